@@ -1,13 +1,28 @@
 import os
+import sys
+import json
+import atexit
+import signal
 import requests
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_pymongo import PyMongo
 from flask_cors import CORS
-import google.generativeai as genai
 from config import Config
 import time
 import threading
-from models import GameWorld, Player, NPC, Quest, QuestCriteria  # Import your models
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from the_veiled_realm.models import GameWorld, Player, NPC, Quest, QuestCriteria  # Import your models
+from persistence import write_game_world, load_saved_game_world, replace_game_world
+from storage import get_storage, MongoStorage
+from migrations import Migrator, SCHEMA_FIELD, SCHEMA_VERSIONS
+from content_store import ContentStore, get_blobs
+from the_veiled_realm.llm_client import get_client
+from the_veiled_realm.engine import Engine, create_starting_location
+from the_veiled_realm.sessions import SessionManager
+from the_veiled_realm.journal import TurnJournal
+from the_veiled_realm.renderers import JsonRenderer
+from the_veiled_realm.turn_pipeline import TurnPipeline, PipelineRunner
 
 app = Flask(__name__)
 CORS(app, resources=r'/api/*')  # Enable CORS for all routes that start with /api
@@ -16,90 +31,158 @@ app.config.from_object(Config)
 
 mongo = PyMongo(app)
 
-# Configure the Google Gemini API with the API key from the environment variable
-api_key = os.getenv('GEMINI_API_KEY')
-genai.configure(api_key=api_key)
+# Saved GameWorlds go to the configured storage backend; player profiles stay in Mongo
+storage = get_storage(app.config['STORAGE_BACKEND'], mongo_db=mongo.db, sqlite_path=app.config['SQLITE_PATH'])
+storage.ensure_indexes()
+profiles = storage if isinstance(storage, MongoStorage) else MongoStorage(mongo.db)
+# Save slots are manifests in a content-addressed store next to the saved worlds
+content_store = ContentStore(get_blobs(app.config['STORAGE_BACKEND'], mongo_db=mongo.db, sqlite_path=app.config['SQLITE_PATH']))
+if profiles is not storage:
+    # Profiles are looked up by the 'id' index; created in the background so an
+    # unreachable Mongo doesn't hold up a server saving to another backend
+    threading.Thread(target=profiles.ensure_indexes, name='profile-indexes', daemon=True).start()
+
+# Documents saved in an older shape are migrated when their world is loaded; the rest of each
+# collection is migrated in the background, at most MIGRATION_RATE documents a second (0 turns it off)
+MIGRATION_RATE = float(os.getenv('MIGRATION_RATE', '200'))
+migrators = [Migrator(storage, rate=MIGRATION_RATE)]
+if profiles is not storage:
+    migrators.append(Migrator(profiles, rate=MIGRATION_RATE, collections=('players',)))
+if MIGRATION_RATE > 0:
+    for migrator in migrators:
+        migrator.start()
+
+# Shared Gemini client, configured once with the API key from the environment variable
+llm_client = get_client()
 
 # Global variable for autosave interval
 AUTOSAVE_INTERVAL = 600  # 10 minutes in seconds
+# Worlds are saved sooner once enough turns were played or enough objects changed
+AUTOSAVE_AFTER_TURNS = int(os.getenv('AUTOSAVE_AFTER_TURNS', '5'))
+AUTOSAVE_AFTER_DIRTY = int(os.getenv('AUTOSAVE_AFTER_DIRTY', '50'))
+
+# Limits for the live sessions kept in memory
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', '10000'))
+SESSION_MEMORY_MB = float(os.getenv('SESSION_MEMORY_MB', '0')) or None  # Unlimited when unset
+SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', '1800'))  # Seconds
+
+# Every turn is appended to a journal, so a crash loses no turns since the last save
+JOURNAL_DIR = os.getenv('JOURNAL_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journal')
+journal = TurnJournal(JOURNAL_DIR, fsync=os.getenv('JOURNAL_FSYNC', '0') == '1')
+
+# Headless game engine; its sessions are keyed by player ID
+engine = Engine(journal=journal)
+renderer = JsonRenderer()
 
-# Function to save the GameWorld and its children to the database
+# Saves of one GameWorld run one at a time
+save_locks_lock = threading.Lock()
+
+def get_save_lock(game_world):
+    with save_locks_lock:
+        lock = getattr(game_world, 'save_lock', None)
+        if lock is None:
+            lock = game_world.save_lock = threading.Lock()
+        return lock
+
+# Function to save what changed in the GameWorld and its children to the database
 def save_game_world(game_world):
     try:
-        # Save the player
-        player_data = {
-            'id': str(game_world.player.id),
-            'name': game_world.player.name,
-            'race': game_world.player.race,
-            'class_type': game_world.player.class_type,
-            'level': game_world.player.level,
-            'experience': game_world.player.experience,
-            'coordinates': game_world.player.coordinates,
-            'inventory': [{'id': str(item.id), 'name': item.name, 'description': item.description} for item in game_world.player.inventory],
-            'quests': [{'id': str(quest.id), 'name': quest.name, 'completed': quest.completed} for quest in game_world.player.quest_list],
-        }
-        mongo.db.players.update_one({'id': player_data['id']}, {'$set': player_data}, upsert=True)
-
-        # Save NPCs
-        for npc in game_world.npcs:
-            npc_data = {
-                'id': str(npc.id),
-                'name': npc.name,
-                'race': npc.race,
-                'class_type': npc.class_type,
-                'level': npc.level,
-                'experience': npc.experience,
-                'coordinates': npc.coordinates,
-                'inventory': [{'id': str(item.id), 'name': item.name, 'description': item.description} for item in npc.inventory],
-            }
-            mongo.db.npcs.update_one({'id': npc_data['id']}, {'$set': npc_data}, upsert=True)
-
-        # Save locations
-        for location in game_world.locations.values():
-            location_data = {
-                'id': str(location.id),
-                'name': location.name,
-                'description': location.description,
-                'coordinates': location.coordinates,
-                'items': [{'id': str(item.id), 'name': item.name, 'description': item.description} for item in location.items],
-                'npcs': [{'id': str(npc.id)} for npc in location.npcs],
-            }
-            mongo.db.locations.update_one({'id': location_data['id']}, {'$set': location_data}, upsert=True)
+        with get_save_lock(game_world):
+            write_game_world(storage, game_world, app.config['SAVE_BATCH_SIZE'])
+            # The saved world is the new snapshot; drop the journal entries it includes
+            if getattr(game_world, 'saved_journal_seq', 0):
+                journal.compact(str(game_world.player.id), game_world.saved_journal_seq)
+        app.logger.debug(f"GameWorld {game_world.player.id} saved to {storage.name}")
+    except Exception:
+        app.logger.exception(f"Error saving GameWorld {game_world.player.id} to {storage.name}")
 
-        print("GameWorld saved successfully to the_veiled_realm.db")
-    except Exception as e:
-        print(f"Error saving GameWorld to the_veiled_realm.db: {e}")
+# Function to load a player's GameWorld, starting a new one for a player who hasn't played yet
+def load_game_world(player_id):
+    if not player_id:
+        return None
+    player_data = storage.find_player(player_id)
+    snapshot = load_saved_game_world(storage, player_data, write_back=True) if player_data else None
+    # Replay the turns played since the last save (or rebuild an unsaved world) from the journal
+    game_world = engine.recover_world(player_id, snapshot)
+    if game_world:
+        if game_world.current_location is None:
+            # The player's location was never saved; start them somewhere new
+            game_world.current_location = create_starting_location(game_world.player)
+        return game_world
 
-# Function for autosaving the GameWorld
-def autosave(game_world):
-    while True:
-        save_game_world(game_world)
-        time.sleep(AUTOSAVE_INTERVAL)
+    # Never saved: start from the player's profile, found by its indexed 'id'. Old profiles
+    # without one only have their ObjectId _id; migrating them keys them (and their saves) by it.
+    player_doc = profiles.find_player(player_id)
+    if not player_doc and ObjectId.is_valid(player_id):
+        player_doc = mongo.db.players.find_one({'_id': ObjectId(player_id)})
+    if not player_doc:
+        return None
+    game_world = load_saved_game_world(profiles, player_doc, write_back=True)
+    game_world.current_location = create_starting_location(game_world.player)
+    return game_world
 
-# Function to start the autosave feature
-def start_autosave(game_world):
-    autosave_thread = threading.Thread(target=autosave, args=(game_world,))
-    autosave_thread.daemon = True  # Allows thread to exit when the main program exits
-    autosave_thread.start()
+# Live sessions: idle ones are flushed through save_game_world and reloaded on demand.
+# The session sweeper also autosaves every live world.
+sessions = SessionManager(
+    engine,
+    load=load_game_world,
+    save=save_game_world,
+    max_sessions=MAX_SESSIONS,
+    max_memory_mb=SESSION_MEMORY_MB,
+    idle_ttl=SESSION_IDLE_TTL,
+    autosave_interval=AUTOSAVE_INTERVAL,
+    save_after_turns=AUTOSAVE_AFTER_TURNS,
+    save_after_dirty=AUTOSAVE_AFTER_DIRTY,
+)
+
+# Game turns from every session share one asyncio pipeline, saving through save_game_world
+turn_pipeline = PipelineRunner(TurnPipeline(
+    save=save_game_world,
+    apply=lambda session_id, game_world, action, response: engine.apply_response(engine.get_session(session_id), action, response)
+))
+
+# Final flush when the process exits: queued pipeline saves first, then every live session.
+# The saver threads are daemons and would otherwise be cut off mid-save.
+def shutdown():
+    try:
+        turn_pipeline.close()
+    except Exception:
+        app.logger.exception("Error flushing queued saves")
+    for migrator in migrators:
+        migrator.stop()
+    sessions.close()
+    engine.close()
+    storage.close()
+    collect_executor.shutdown(wait=True)
+    content_store.blobs.close()
+
+atexit.register(shutdown)
 
 @app.route('/api/players', methods=['POST'])
 def create_player():
     data = request.json
+    player_id = ObjectId()
     player = {
+        "_id": player_id,
+        "id": str(player_id),  # Saved worlds find their player by 'id'
         "name": data['name'],
         "race": data['race'],
         "class_type": data['class_type'],
         "health": 100,
         "mana": 100,
-        "inventory": {},
-        "game_state": {},
+        "inventory": [],
         "stats": {
             "strength": data.get('strength', 10),
             "intelligence": data.get('intelligence', 10),
             "charisma": data.get('charisma', 10),
             "stealth": data.get('stealth', 10),
             "dexterity": data.get('dexterity', 10)
-        }
+        },
+        "level": 1,
+        "experience": 0,
+        "coordinates": [0, 0],
+        "quests": [],
+        SCHEMA_FIELD: SCHEMA_VERSIONS['players'],
     }
     mongo.db.players.insert_one(player)
 
@@ -108,7 +191,7 @@ def create_player():
 
     # Interact with the LLM using the Google Gemini API
     # Assuming you want to get a response from the API
-    response = genai.GenerativeModel("gemini-1.5-flash").generate_content(input_text)
+    response = llm_client.generate(input_text, model_name="gemini-1.5-flash")
     player['description'] = response.text
 
     return jsonify({'playerId': str(player['_id']), 'description': player['description']}), 201
@@ -166,24 +249,149 @@ def load_game(player_id):
         return jsonify(player), 200
     return jsonify({'error': 'Player not found'}), 404
 
+def save_slot_json(game_save):
+    return {'saveId': str(game_save.id), 'save_name': game_save.save_name, 'manifest': game_save.manifest,
+            'timestamp': game_save.timestamp.isoformat()}
+
+# Blobs only deleted slots used are reclaimed in the background, one collection at a time;
+# slots deleted while one is queued are picked up by that run
+collect_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='content-collect')
+collect_queued = threading.Event()
+
+def collect_content():
+    collect_queued.clear()
+    try:
+        deleted = content_store.collect()
+        app.logger.info(f"Content store collection deleted {deleted} blobs")
+    except Exception:
+        app.logger.exception("Error collecting unused save slot content")
+
+def schedule_collect():
+    if not collect_queued.is_set():
+        collect_queued.set()
+        collect_executor.submit(collect_content)
+
+@app.route('/api/players/<player_id>/saves', methods=['POST'])
+def create_save_slot(player_id):
+    data = request.get_json(silent=True) or {}
+    with sessions.checkout(player_id) as session:
+        if not session:
+            return jsonify({'error': 'Player not found'}), 404
+        # Between turns, so the slot never holds half a turn
+        with session.lock:
+            game_save = content_store.create_save(session.world, data.get('save_name') or 'Saved game', player_id)
+    return jsonify(save_slot_json(game_save)), 201
+
+@app.route('/api/players/<player_id>/saves/<save_id>/load', methods=['POST'])
+def load_save_slot(player_id, save_id):
+    game_save = content_store.find_save(player_id, save_id)
+    if game_save is None:
+        return jsonify({"error": "Save not found"}), 404
+    with sessions.checkout(player_id) as session:
+        if not session:
+            return jsonify({'error': 'Player not found'}), 404
+        with session.lock:
+            # Flush the world being replaced, so a save of it still queued has nothing left to write
+            save_game_world(session.world)
+            game_world = content_store.restore_save(game_save)
+            if game_world.current_location is None:
+                game_world.current_location = create_starting_location(game_world.player)
+            scene = engine.restore(session, game_world)
+            # The slot becomes the player's stored world, and the journal starts over from it
+            with get_save_lock(game_world):
+                replace_game_world(storage, game_world, app.config['SAVE_BATCH_SIZE'])
+                journal.compact(player_id, game_world.saved_journal_seq)
+    return jsonify(renderer.scene(scene)), 200
+
+@app.route('/api/players/<player_id>/saves', methods=['GET'])
+def list_save_slots(player_id):
+    return jsonify([save_slot_json(game_save) for game_save in content_store.get_saves(player_id).saves]), 200
+
+@app.route('/api/players/<player_id>/saves/<save_id>', methods=['DELETE'])
+def delete_save_slot(player_id, save_id):
+    if content_store.delete_save(player_id, save_id):
+        schedule_collect()
+        return jsonify({"message": "Save deleted successfully"}), 200
+    return jsonify({"error": "Save not found"}), 404
+
 @app.route('/character-creation/<player_id>', methods=['GET'])
 def character_creation(player_id):
     # Logic to render the character creation page
     return render_template('character_creation.html', player_id=player_id)
 
+# Function to format a Server-Sent Event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/api/game_action', methods=['POST'])
 def game_action():
     data = request.get_json()
     action = data.get('action')
-    
-    # Here you would use the Gemini LLM to generate a response based on the action
-    response = generate_response(action)  # Implement this function to interact with Gemini
-    
-    return jsonify({'response': response})
+    # The session is pinned so it can't be evicted during the turn
+    with sessions.checkout(data.get('playerId')) as session:
+        if not session:
+            return jsonify({'error': 'Player not found'}), 404
+
+        # Under the session's lock like the streamed turns: local commands are answered
+        # here, the rest runs on the shared asyncio pipeline, which also queues the save
+        result = engine.act(
+            session, action,
+            game_master=lambda session, action: turn_pipeline.run_turn(session.id, session.world, action)
+        )
+
+    return jsonify({'response': result.text, 'state_update': result.state_update})
+
+@app.route('/api/game_action/stream', methods=['POST'])
+def game_action_stream():
+    data = request.get_json()
+    action = data.get('action')
+    player_id = data.get('playerId')
+    # Pinned once for the whole stream, so the session can't be evicted between the check and the turn
+    session = sessions.pin(player_id)
+    if session is None:
+        return jsonify({'error': 'Player not found'}), 404
+
+    def generate():
+        start_time = time.perf_counter()
+        first_chunk_time = None
+        # Flush the headers straight away so the client can start listening
+        yield ": stream opened\n\n"
+
+        try:
+            stream = engine.act_stream(session, action)
+            for text in stream:
+                if first_chunk_time is None:
+                    first_chunk_time = time.perf_counter()
+                yield sse_event('narrative', {'text': text})
+
+            end_time = time.perf_counter()
+            timings = {
+                'first_chunk_ms': round((first_chunk_time - start_time) * 1000) if first_chunk_time else None,
+                'total_ms': round((end_time - start_time) * 1000),
+            }
+            app.logger.info(f"game_action_stream timings: {timings}")
+            state = renderer.turn(stream.result, narrative=False)
+            state['timings'] = timings
+            yield sse_event('state', state)
+        except Exception:
+            # The headers are already sent, so the failure is reported as an event
+            app.logger.exception(f"Error streaming game action for player {player_id}")
+            yield sse_event('error', {'error': 'The Game Master could not finish this turn. Please try again.'})
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Stop reverse proxies from buffering the stream
+    }
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+    # Unpinned when the response is closed: after the last event, or when the client goes away
+    response.call_on_close(lambda: sessions.release(session))
+    return response
 
 @app.route('/')
 def home():
     return 'Welcome to The Veiled Realm!'
 
 if __name__ == '__main__':
+    # Exit normally on SIGTERM so the final flush runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(debug=True)
@@ -0,0 +1,83 @@
+import os
+import sys
+import zlib
+import argparse
+import tempfile
+import subprocess
+from content_store import ContentStore, SQLiteBlobs, encode
+from bench_save import make_world, play_turn
+
+# Benchmark for save slots in the content store: the bytes each slot adds to
+# the store against storing a compressed copy of the world's documents per
+# slot. One turn is played between slots (see bench_save.play_turn).
+#
+# Then a second process, started with a different PYTHONHASHSEED, restores the
+# last slot and saves it again: with nothing changed, only the new slot's
+# manifest should be stored, i.e. the chunks don't depend on the process that
+# cut them.
+#
+# Usage: python bench_content_store.py [--locations 1000] [--slots 20]
+
+
+def copy_size(world) -> int:
+    # Bytes a slot costs when every document is stored again (compressed as the store does)
+    version = world.version
+    documents = [version.player] + list(version.locations.values()) + list(version.npcs.values())
+    return sum(len(zlib.compress(encode(document))) for document in documents)
+
+
+def resave(path, manifest):
+    # In a fresh process: restore the slot and save it again; returns (blobs, bytes) added
+    store = ContentStore(SQLiteBlobs(path))
+    world = store.restore_slot(manifest)
+    blobs, size = len(store.blobs.hashes()), store.blobs.size()
+    store.create_save(world, 'resaved', 'bench')
+    return len(store.blobs.hashes()) - blobs, store.blobs.size() - size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--locations', type=int, default=1000)
+    parser.add_argument('--slots', type=int, default=20)
+    parser.add_argument('--resave', nargs=2, metavar=('PATH', 'MANIFEST'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.resave:
+        print(*resave(*args.resave))
+        return 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench_content_store.db')
+        store = ContentStore(SQLiteBlobs(path))
+        world = make_world(args.locations)
+
+        sizes = []
+        copies = []
+        game_save = None
+        for turn in range(args.slots):
+            if turn:
+                play_turn(world, turn)
+            before = store.blobs.size()
+            game_save = store.create_save(world, f"Slot {turn}", 'bench')
+            sizes.append(store.blobs.size() - before)
+            copies.append(copy_size(world))
+        store.blobs.close()
+
+        later = sizes[1:] or [0]
+        print(f"{args.locations} locations, {args.slots} slots, one turn between slots")
+        print(f"{'':>14} {'first KB':>9} {'KB/later slot':>14} {'total KB':>9}")
+        print(f"{'content store':>14} {sizes[0] / 1024:>9.1f} {sum(later) / len(later) / 1024:>14.1f} {sum(sizes) / 1024:>9.1f}")
+        print(f"{'copy per slot':>14} {copies[0] / 1024:>9.1f} {sum(copies[1:] or [0]) / max(len(copies) - 1, 1) / 1024:>14.1f} "
+              f"{sum(copies) / 1024:>9.1f}")
+
+        seed = str(int(os.getenv('PYTHONHASHSEED', '0') or 0) + 1)
+        output = subprocess.run([sys.executable, __file__, '--resave', path, game_save.manifest], check=True,
+                                capture_output=True, text=True, env=dict(os.environ, PYTHONHASHSEED=seed)).stdout
+        blobs, size = map(int, output.split()[-2:])
+        print(f"Unchanged slot saved again by another process (PYTHONHASHSEED={seed}): "
+              f"{blobs} blobs, {size / 1024:.1f} KB added")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import sys
+import time
+import argparse
+from the_veiled_realm.models import GameWorld, Player, NPC, Location, Item, Path
+from persistence import write_game_world, player_document, npc_document, location_document
+from storage import MongoStorage, SQLiteStorage
+
+# Benchmark for save_game_world: one update_one per entity (the old save)
+# against unordered bulk_write batches, and a full save against the
+# incremental save of what changed in one turn.
+#
+# By default the collections are an in-process stand-in that charges a
+# network round trip per call and a small cost per written document, so the
+# number of round trips dominates as it does against a remote server. Pass
+# --mongo to run against a real server instead (uses a bench_save database),
+# or --sqlite to save to a local SQLite file (one transaction per entity
+# against one per save).
+#
+# Usage: python bench_save.py [--mongo mongodb://localhost:27017 | --sqlite bench_save.db] [--rtt-ms 0.5] [--batch-size 500]
+
+
+class StandInCollection:
+    def __init__(self, rtt, per_document):
+        self.rtt = rtt
+        self.per_document = per_document
+        self.documents = {}
+        self.calls = 0
+        self.bytes_written = 0
+
+    def _wait(self, documents):
+        self.calls += 1
+        time.sleep(self.rtt + self.per_document * documents)
+
+    def _set(self, document_id, fields):
+        self.bytes_written += len(repr(fields))
+        self.documents.setdefault(document_id, {}).update(fields)
+
+    def bulk_write(self, operations, ordered=True):
+        self._wait(len(operations))
+        for operation in operations:
+            self._set(operation._filter['id'], operation._doc['$set'])
+
+
+class StandInDatabase:
+    def __init__(self, rtt, per_document):
+        self.players = StandInCollection(rtt, per_document)
+        self.npcs = StandInCollection(rtt, per_document)
+        self.locations = StandInCollection(rtt, per_document)
+
+        self.storage = MongoStorage(self)
+
+    def drop(self):
+        pass
+
+    def bytes_written(self):
+        return sum(collection.bytes_written for collection in (self.players, self.npcs, self.locations))
+
+
+class MongoDatabase:
+    def __init__(self, uri):
+        from pymongo import MongoClient
+        self.client = MongoClient(uri)
+        self.db = self.client.bench_save
+        self.players = self.db.players
+        self.npcs = self.db.npcs
+        self.locations = self.db.locations
+        self.storage = MongoStorage(self.db)
+        self.storage.ensure_indexes()
+
+    def drop(self):
+        for collection in (self.players, self.npcs, self.locations):
+            collection.delete_many({})
+
+    def bytes_written(self):
+        return None  # Not measured against a real server
+
+
+class SQLiteDatabase:
+    def __init__(self, path):
+        self.storage = SQLiteStorage(path)
+
+    def drop(self):
+        with self.storage.lock:
+            for table in ('players', 'npcs', 'locations'):
+                self.storage.connection.execute(f"DELETE FROM {table}")
+
+    def bytes_written(self):
+        return None  # Not measured for SQLite
+
+
+# What a typical turn changes: the player moves and picks up an item, and a location changes
+def play_turn(world, turn):
+    location = world.get_location((turn % 100, turn // 100))
+    world.player.coordinates = location.coordinates
+    if location.items:
+        world.player.inventory.append(location.items.pop())
+    location.description += " Someone has passed through here."
+
+
+# The save as it was: one round trip per player, NPC and location
+def write_game_world_per_entity(storage, game_world):
+    player_id = str(game_world.player.id)
+    storage.write({'players': [player_document(game_world.player)]})
+    for location in game_world.locations.values():
+        for npc in location.npcs:
+            storage.write({'npcs': [npc_document(npc)]})
+    for location in game_world.locations.values():
+        storage.write({'locations': [location_document(location, player_id)]})
+
+
+def make_world(location_count):
+    player = Player(name='Bench', race='Dwarf', class_type='Warrior')
+    world = GameWorld(player=player)
+    for index in range(location_count):
+        coordinates = (index % 100, index // 100)
+        location = Location(f"Location {index}", "A wind-scoured ridge above a valley of standing stones. " * 4, coordinates)
+        location.items = [Item(f"Item {index}.{n}", "A worn trinket of uncertain origin.") for n in range(3)]
+        location.npcs = [NPC(f"NPC {index}.{n}", "A wary traveller.", 'Human', 'Bard', coordinates=coordinates) for n in range(2)]
+        location.paths = [Path("A narrow track.", (coordinates[0] + 1, coordinates[1]), 'east')]
+        world.add_location(location)
+    world.current_location = world.get_location((0, 0))
+    return world
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo', help='MongoDB URI; the in-process stand-in is used when omitted')
+    parser.add_argument('--sqlite', help='SQLite file to save to instead of a Mongo target')
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help='Stand-in round trip time')
+    parser.add_argument('--per-document-us', type=float, default=5.0, help='Stand-in cost per written document')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--sizes', default='10,100,1000', help='Locations per world')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        db = SQLiteDatabase(args.sqlite)
+        print(f"Target: SQLite file {args.sqlite}")
+    elif args.mongo:
+        db = MongoDatabase(args.mongo)
+        print(f"Target: {args.mongo}")
+    else:
+        db = StandInDatabase(args.rtt_ms / 1000, args.per_document_us / 1_000_000)
+        print(f"Target: in-process stand-in, {args.rtt_ms} ms per round trip")
+    storage = db.storage
+
+    print(f"{'locations':>9} {'entities':>8} {'per-entity s':>12} {'calls':>6} {'bulk s':>8} {'calls':>6} {'speedup':>8}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        world = make_world(size)
+        entities = 1 + size * 3  # Player, locations and two NPCs per location
+
+        db.drop()
+        start = time.perf_counter()
+        write_game_world_per_entity(storage, world)
+        per_entity = time.perf_counter() - start
+
+        db.drop()
+        start = time.perf_counter()
+        calls = write_game_world(storage, world, args.batch_size)
+        bulk = time.perf_counter() - start
+
+        print(f"{size:>9} {entities:>8} {per_entity:>12.3f} {entities:>6} {bulk:>8.3f} {calls:>6} {per_entity / bulk:>7.1f}x")
+
+    print()
+    print("Saving after one turn: full rewrite against only what changed")
+    print(f"{'locations':>9} {'full s':>8} {'full KB':>8} {'changed s':>9} {'changed KB':>10}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        world = make_world(size)
+        db.drop()
+        write_game_world(storage, world, args.batch_size)  # First save writes everything
+        play_turn(world, 1)
+
+        before = db.bytes_written()
+        start = time.perf_counter()
+        write_game_world(storage, world, args.batch_size, full=True)
+        full = time.perf_counter() - start
+        full_bytes = db.bytes_written() - before if before is not None else None
+
+        play_turn(world, 2)
+        before = db.bytes_written()
+        start = time.perf_counter()
+        write_game_world(storage, world, args.batch_size)
+        changed = time.perf_counter() - start
+        changed_bytes = db.bytes_written() - before if before is not None else None
+
+        kilobytes = lambda value: f"{value / 1024:.1f}" if value is not None else '-'
+        print(f"{size:>9} {full:>8.3f} {kilobytes(full_bytes):>8} {changed:>9.4f} {kilobytes(changed_bytes):>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import sys
+import copy
+import time
+import argparse
+import tracemalloc
+from versions import capture
+from bench_save import make_world, play_turn
+
+# Benchmark for save slots: a WorldVersion per slot (sharing unchanged
+# entities with the previous slot) against a deep copy of the world per slot.
+# One turn is played between slots (see bench_save.play_turn).
+#
+# Usage: python bench_versions.py [--locations 1000] [--slots 20]
+
+
+def measure(make_slot, slots):
+    # (seconds, bytes) per slot
+    tracemalloc.start()
+    kept = []
+    elapsed = 0.0
+    for turn in range(slots):
+        start = time.perf_counter()
+        kept.append(make_slot(turn))
+        elapsed += time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed / slots, memory / slots
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--locations', type=int, default=1000)
+    parser.add_argument('--slots', type=int, default=20)
+    args = parser.parse_args()
+
+    world = make_world(args.locations)
+    capture(world)  # The first version holds the whole world
+
+    def version_slot(turn):
+        play_turn(world, turn)
+        return capture(world)
+
+    def deepcopy_slot(turn):
+        play_turn(world, turn)
+        return copy.deepcopy(world.locations), copy.deepcopy(world.player)
+
+    print(f"{args.locations} locations, {args.slots} slots, one turn between slots (timed under tracemalloc)")
+    print(f"{'':>10} {'ms/slot':>8} {'KB/slot':>9}")
+    for name, make_slot in (('version', version_slot), ('deepcopy', deepcopy_slot)):
+        seconds, memory = measure(make_slot, args.slots)
+        print(f"{name:>10} {seconds * 1000:>8.1f} {memory / 1024:>9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
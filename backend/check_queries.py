@@ -0,0 +1,133 @@
+import sys
+import argparse
+from bson import ObjectId
+from pymongo import MongoClient
+from persistence import write_game_world, load_saved_game_world
+from storage import MongoStorage
+from migrations import Migrator
+from bench_save import make_world, play_turn
+
+# Checks that every query the app sends to MongoDB is served by an index.
+#
+# Creates the indexes (MongoStorage.ensure_indexes) in a scratch database,
+# then saves, changes, re-saves and loads a world through MongoStorage while
+# recording the filter of every query, update and bulk_write it sends, runs
+# the schema migrator over the collections, and adds the player profile
+# lookups the /players routes make by _id. Each
+# query shape is run through explain(); the check fails if any winning plan
+# contains a COLLSCAN. Listing every player (GET /api/players) reads the
+# whole collection on purpose and is not checked.
+#
+# Usage: python check_queries.py [--mongo mongodb://localhost:27017] [--locations 200]
+
+
+class RecordingCollection:
+    def __init__(self, collection, queries):
+        self.collection = collection
+        self.queries = queries  # [(collection name, filter)]
+
+    def _record(self, query):
+        self.queries.append((self.collection.name, query))
+
+    def find(self, query=None, *args, **kwargs):
+        self._record(query or {})
+        return self.collection.find(query, *args, **kwargs)
+
+    def find_one(self, query=None, *args, **kwargs):
+        self._record(query or {})
+        return self.collection.find_one(query, *args, **kwargs)
+
+    def update_one(self, query, *args, **kwargs):
+        self._record(query)
+        return self.collection.update_one(query, *args, **kwargs)
+
+    def delete_one(self, query, *args, **kwargs):
+        self._record(query)
+        return self.collection.delete_one(query, *args, **kwargs)
+
+    def bulk_write(self, operations, *args, **kwargs):
+        for operation in operations:
+            self._record(operation._filter)
+        return self.collection.bulk_write(operations, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class RecordingDatabase:
+    def __init__(self, db):
+        self.queries = []
+        self.players = RecordingCollection(db.players, self.queries)
+        self.npcs = RecordingCollection(db.npcs, self.queries)
+        self.locations = RecordingCollection(db.locations, self.queries)
+
+
+# Stages of a winning plan, for the classic and the slot-based query engines
+def plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+
+# A query's shape: its fields and operators, without the values
+def query_shape(query):
+    if isinstance(query, dict):
+        return tuple(sorted((key, query_shape(value) if key.startswith('$') or isinstance(value, dict) else None)
+                            for key, value in query.items()))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo', default='mongodb://localhost:27017')
+    parser.add_argument('--locations', type=int, default=200)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo)
+    client.drop_database('check_queries')
+    db = client.check_queries
+    recording = RecordingDatabase(db)
+    storage = MongoStorage(recording)
+    storage.ensure_indexes()
+
+    # Two player profiles as POST /api/players stored them before schema versions (no 'id' field)
+    profile_ids = [db.players.insert_one({'name': name, 'race': 'Elf', 'class_type': 'Ranger'}).inserted_id
+                   for name in ('First', 'Second')]
+
+    world = make_world(args.locations)
+    write_game_world(storage, world)
+    play_turn(world, 1)
+    write_game_world(storage, world)
+    load_saved_game_world(storage, storage.find_player(str(world.player.id)))
+    Migrator(storage, rate=0, batch_size=50).run()
+
+    # The /players routes look profiles up by _id
+    recording.players.find_one({'_id': profile_ids[0]})
+    recording.players.update_one({'_id': profile_ids[0]}, {'$set': {'name': 'First'}})
+    recording.players.delete_one({'_id': ObjectId()})
+
+    checked = {}
+    for collection, query in recording.queries:
+        checked.setdefault((collection, query_shape(query)), (collection, query))
+
+    failures = 0
+    for collection, query in checked.values():
+        plan = db[collection].find(query).explain()['queryPlanner']['winningPlan']
+        stages = list(plan_stages(plan))
+        scan = 'COLLSCAN' in stages
+        failures += scan
+        shown = {key: ('...' if not key.startswith('$') else value) for key, value in query.items()}
+        print(f"{'FAIL' if scan else 'ok':>4}  {collection}.find({shown}): {' > '.join(stages)}")
+
+    client.drop_database('check_queries')
+    print(f"{len(checked)} query shapes, {failures} collection scans")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
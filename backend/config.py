@@ -2,3 +2,7 @@ import os
 
 class Config:
     MONGO_URI = os.getenv('MONGO_URI') or 'mongodb://localhost:27017/the_veiled_realm'
+    SAVE_BATCH_SIZE = int(os.getenv('SAVE_BATCH_SIZE') or 500)  # Upserts per bulk_write call when saving
+    # Where GameWorlds are saved: mongo, sqlite (a local file, no database server needed) or memory
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND') or 'mongo'
+    SQLITE_PATH = os.getenv('SQLITE_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'the_veiled_realm.db')
@@ -0,0 +1,420 @@
+import os
+import json
+import uuid
+import zlib
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from the_veiled_realm.models import GameSave, GameSaves
+from persistence import load_saved_game_world
+from versions import WorldVersion, capture
+
+# Content-addressed storage for save slots.
+#
+# Every document of a world (see persistence) is stored once under the hash
+# of its content, and a save slot is a manifest of the hashes of its player,
+# locations and NPCs, itself stored under its hash. The location and NPC
+# hashes are listed in chunks stored as blobs of their own, cut where a hash
+# ends in a chosen pattern, so a change only alters the chunk around it and
+# the other chunks are shared with earlier slots. Entries are listed in the
+# order of their documents' ids, so the chunks of unchanged content are the
+# same whatever process (and hash seed) saves them. Saving a slot
+# only writes the documents that no earlier slot has stored, so storage grows
+# with the amount of new content rather than with the number of slots.
+# Narrative text is stored apart from the documents (strings of TEXT_MIN
+# characters or more become {'$text': hash}), so a description repeated in
+# several locations, worlds or players' saves is stored once too.
+#
+# Blobs are compressed canonical JSON; hashes are SHA-256 of the
+# uncompressed bytes. Documents captured into the last saved slot keep their
+# hash (WorldVersion shares unchanged documents between captures), so saving
+# a slot hashes only what changed. collect() deletes the blobs no longer
+# reachable from the slots that are kept.
+#
+# A player's save slots (GameSave records pointing at their manifest) are
+# kept under a ref: the one mutable, named value a blob backend stores
+# besides the blobs themselves.
+
+TEXT_MIN = 64  # Strings at least this long are stored as their own blobs
+CHUNK_ENTRIES = 32  # Average number of hashes per manifest chunk
+MANIFEST_FORMAT = 1
+
+
+class MemoryBlobs:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blobs = {}  # Hash -> compressed bytes
+        self.refs = {}  # Name -> str
+
+    def missing(self, hashes) -> list:
+        with self.lock:
+            return [blob_hash for blob_hash in hashes if blob_hash not in self.blobs]
+
+    def put_many(self, items) -> None:
+        with self.lock:
+            for blob_hash, data in items:
+                self.blobs.setdefault(blob_hash, data)
+
+    def get(self, blob_hash):
+        with self.lock:
+            return self.blobs.get(blob_hash)
+
+    def hashes(self) -> list:
+        with self.lock:
+            return list(self.blobs)
+
+    def delete_many(self, hashes) -> None:
+        with self.lock:
+            for blob_hash in hashes:
+                self.blobs.pop(blob_hash, None)
+
+    def size(self) -> int:
+        with self.lock:
+            return sum(len(data) for data in self.blobs.values())
+
+    def get_ref(self, name):
+        with self.lock:
+            return self.refs.get(name)
+
+    def set_ref(self, name, value) -> None:
+        with self.lock:
+            self.refs[name] = value
+
+    def ref_names(self) -> list:
+        with self.lock:
+            return list(self.refs)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteBlobs:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS refs (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def missing(self, hashes):
+        with self.lock:
+            present = {row[0] for row in self.connection.execute(
+                "SELECT hash FROM blobs WHERE hash IN (SELECT value FROM json_each(?))", (json.dumps(list(hashes)),))}
+        return [blob_hash for blob_hash in hashes if blob_hash not in present]
+
+    def put_many(self, items):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany("INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", items)
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def get(self, blob_hash):
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+        return row[0] if row else None
+
+    def hashes(self):
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT hash FROM blobs")]
+
+    def delete_many(self, hashes):
+        with self.lock:
+            self.connection.execute("DELETE FROM blobs WHERE hash IN (SELECT value FROM json_each(?))", (json.dumps(list(hashes)),))
+
+    def size(self):
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blobs").fetchone()[0]
+
+    def get_ref(self, name):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM refs WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_ref(self, name, value):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO refs (name, value) VALUES (?, ?)", (name, value))
+
+    def ref_names(self):
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT name FROM refs")]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class MongoBlobs:
+    def __init__(self, db):
+        self.collection = db.content  # Blobs, keyed by _id
+        self.refs = db.content_refs
+
+    def missing(self, hashes):
+        present = {document['_id'] for document in self.collection.find({'_id': {'$in': list(hashes)}}, {'_id': 1})}
+        return [blob_hash for blob_hash in hashes if blob_hash not in present]
+
+    def put_many(self, items):
+        documents = [{'_id': blob_hash, 'data': data} for blob_hash, data in items]
+        if not documents:
+            return
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Blobs stored concurrently by another save are fine; anything else is not
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+
+    def get(self, blob_hash):
+        document = self.collection.find_one({'_id': blob_hash})
+        return document['data'] if document else None
+
+    def hashes(self):
+        return [document['_id'] for document in self.collection.find({}, {'_id': 1})]
+
+    def delete_many(self, hashes):
+        self.collection.delete_many({'_id': {'$in': list(hashes)}})
+
+    def size(self):
+        return sum(len(document['data']) for document in self.collection.find({}, {'data': 1}))
+
+    def get_ref(self, name):
+        document = self.refs.find_one({'_id': name})
+        return document['value'] if document else None
+
+    def set_ref(self, name, value):
+        self.refs.replace_one({'_id': name}, {'_id': name, 'value': value}, upsert=True)
+
+    def ref_names(self):
+        return [document['_id'] for document in self.refs.find({}, {'_id': 1})]
+
+    def close(self):
+        pass
+
+
+def get_blobs(kind: str = None, mongo_db=None, sqlite_path: str = None):
+    # Blobs go next to the saved worlds of the same storage backend (see storage.get_storage)
+    kind = kind or os.getenv('STORAGE_BACKEND', 'mongo')
+    if kind == 'sqlite':
+        return SQLiteBlobs(sqlite_path or os.getenv('SQLITE_PATH') or 'the_veiled_realm.db')
+    if kind == 'memory':
+        return MemoryBlobs()
+    if kind == 'mongo':
+        return MongoBlobs(mongo_db)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def encode(obj) -> bytes:
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+# Read interface of a storage backend over one slot, for load_saved_game_world
+class SlotReader:
+    def __init__(self, player, locations, npcs, journal_seq):
+        self.player = player
+        self.locations = locations
+        self.npcs = {npc['id']: npc for npc in npcs}
+        self.journal_seq = journal_seq
+
+    def find_player(self, player_id):
+        return self.player if self.player['id'] == player_id else None
+
+    def find_locations(self, player_id):
+        return self.locations if self.player['id'] == player_id else []
+
+    def find_npcs(self, npc_ids):
+        return [self.npcs[npc_id] for npc_id in npc_ids if npc_id in self.npcs]
+
+
+class ContentStore:
+    def __init__(self, blobs):
+        self.blobs = blobs  # MemoryBlobs, SQLiteBlobs or MongoBlobs
+        self.lock = threading.Lock()
+        self.known = {}  # id(document) -> (document, hash) for the documents of the last slot saved
+
+    def _put(self, obj, pending: dict, split_text: bool = True) -> str:
+        # Hash obj (with its long strings split out) and queue it for storing
+        if split_text:
+            obj = self._split(obj, pending)
+        data = encode(obj)
+        blob_hash = hashlib.sha256(data).hexdigest()
+        pending[blob_hash] = data
+        return blob_hash
+
+    def _split(self, obj, pending):
+        if isinstance(obj, str) and len(obj) >= TEXT_MIN:
+            return {'$text': self._put(obj, pending, split_text=False)}
+        if isinstance(obj, dict):
+            return {key: self._split(value, pending) for key, value in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [self._split(value, pending) for value in obj]
+        return obj
+
+    def _load(self, blob_hash):
+        data = self.blobs.get(blob_hash)
+        if data is None:
+            raise KeyError(f"Missing blob {blob_hash}")
+        return json.loads(zlib.decompress(data))
+
+    def _join(self, obj, texts: dict):
+        # Put the split-out strings back
+        if isinstance(obj, dict):
+            if len(obj) == 1 and '$text' in obj:
+                text_hash = obj['$text']
+                if text_hash not in texts:
+                    texts[text_hash] = self._load(text_hash)
+                return texts[text_hash]
+            return {key: self._join(value, texts) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [self._join(value, texts) for value in obj]
+        return obj
+
+    def save_slot(self, world) -> str:
+        # Store a GameWorld (captured first) or a WorldVersion; returns the slot's manifest hash
+        version = world if isinstance(world, WorldVersion) else capture(world)
+        with self.lock:
+            return self._store(version)
+
+    def _store(self, version: WorldVersion) -> str:
+        # Called with self.lock held
+        pending = {}
+        known = {}
+
+        def put_document(document):
+            cached = self.known.get(id(document))
+            blob_hash = cached[1] if cached and cached[0] is document else self._put(document, pending)
+            known[id(document)] = (document, blob_hash)
+            return blob_hash
+
+        by_id = lambda document: document['id']
+        locations = sorted(version.locations.values(), key=by_id)
+        npc_ids = [npc['id'] for location in locations for npc in location.get('npcs', [])]
+        npcs = sorted(version.find_npcs(npc_ids), key=by_id)
+        manifest = {
+            'format': MANIFEST_FORMAT,
+            'player': put_document(version.player),
+            'locations': self._chunks([put_document(location) for location in locations], pending),
+            'npcs': self._chunks([put_document(npc) for npc in npcs], pending),
+            'journal_seq': version.journal_seq,
+        }
+        manifest_hash = self._put(manifest, pending, split_text=False)
+        missing = self.blobs.missing(list(pending))
+        self.blobs.put_many([(blob_hash, zlib.compress(pending[blob_hash])) for blob_hash in missing])
+        self.known = known
+        return manifest_hash
+
+    def _chunks(self, hashes, pending) -> list:
+        # Store a list of hashes as content-defined chunks; returns the chunks' hashes
+        chunks, chunk = [], []
+        for blob_hash in hashes:
+            chunk.append(blob_hash)
+            if int(blob_hash[-4:], 16) % CHUNK_ENTRIES == 0:
+                chunks.append(self._put(chunk, pending, split_text=False))
+                chunk = []
+        if chunk:
+            chunks.append(self._put(chunk, pending, split_text=False))
+        return chunks
+
+    def _entries(self, chunk_hashes) -> list:
+        return [blob_hash for chunk_hash in chunk_hashes for blob_hash in self._load(chunk_hash)]
+
+    def read_slot(self, manifest_hash) -> SlotReader:
+        manifest = self._load(manifest_hash)
+        texts = {}
+        load = lambda blob_hash: self._join(self._load(blob_hash), texts)
+        return SlotReader(load(manifest['player']), [load(blob_hash) for blob_hash in self._entries(manifest['locations'])],
+                          [load(blob_hash) for blob_hash in self._entries(manifest['npcs'])], manifest.get('journal_seq'))
+
+    def restore_slot(self, manifest_hash):
+        # Rebuild a live GameWorld from a slot; save it in full before relying on the journal (see versions.restore)
+        reader = self.read_slot(manifest_hash)
+        return load_saved_game_world(reader, reader.player)
+
+    # Save slots
+
+    def _slots_ref(self, user_id) -> str:
+        return f"saves/{user_id}"
+
+    def get_saves(self, user_id) -> GameSaves:
+        game_saves = GameSaves()
+        for record in json.loads(self.blobs.get_ref(self._slots_ref(user_id)) or '[]'):
+            game_save = GameSave(record['manifest'], record['save_name'], user_id)
+            game_save.id = uuid.UUID(record['id'])
+            game_save.timestamp = datetime.fromisoformat(record['timestamp'])
+            game_saves.add_save(game_save)
+        return game_saves
+
+    def _put_saves(self, user_id, game_saves: GameSaves):
+        records = [{'id': str(game_save.id), 'save_name': game_save.save_name, 'manifest': game_save.manifest,
+                    'timestamp': game_save.timestamp.isoformat()} for game_save in game_saves.get_saves_by_user(user_id)]
+        self.blobs.set_ref(self._slots_ref(user_id), json.dumps(records))
+
+    def create_save(self, game_world, save_name: str, user_id) -> GameSave:
+        # Store a slot of the world (a GameWorld or a WorldVersion) and add it to the user's save slots.
+        # Both happen under the lock, so collect() can't delete the slot's blobs in between.
+        version = game_world if isinstance(game_world, WorldVersion) else capture(game_world)
+        with self.lock:
+            game_save = GameSave(self._store(version), save_name, user_id)
+            game_saves = self.get_saves(user_id)
+            game_saves.add_save(game_save)
+            self._put_saves(user_id, game_saves)
+        return game_save
+
+    def find_save(self, user_id, save_id):
+        return next((game_save for game_save in self.get_saves(user_id).saves if str(game_save.id) == str(save_id)), None)
+
+    def delete_save(self, user_id, save_id) -> bool:
+        # Its blobs are deleted by the next collect()
+        with self.lock:
+            game_saves = self.get_saves(user_id)
+            game_save = next((game_save for game_save in game_saves.saves if str(game_save.id) == str(save_id)), None)
+            if game_save is None:
+                return False
+            game_saves.del_save(game_save)
+            self._put_saves(user_id, game_saves)
+        return True
+
+    def restore_save(self, game_save: GameSave):
+        return self.restore_slot(game_save.manifest)
+
+    def all_manifests(self) -> list:
+        # Manifest hashes of every user's save slots
+        return [game_save.manifest for name in self.blobs.ref_names() if name.startswith('saves/')
+                for game_save in self.get_saves(name[len('saves/'):]).saves]
+
+    def collect(self, manifest_hashes=None) -> int:
+        # Delete the blobs not reachable from the given slots (every user's save slots when None);
+        # returns how many were deleted
+        with self.lock:
+            if manifest_hashes is None:
+                manifest_hashes = self.all_manifests()
+            reachable = set()
+            for manifest_hash in manifest_hashes:
+                reachable.add(manifest_hash)
+                manifest = self._load(manifest_hash)
+                chunk_hashes = manifest['locations'] + manifest['npcs']
+                reachable.update(chunk_hashes)
+                for blob_hash in [manifest['player']] + self._entries(chunk_hashes):
+                    if blob_hash not in reachable:
+                        reachable.add(blob_hash)
+                        self._mark_texts(self._load(blob_hash), reachable)
+            garbage = [blob_hash for blob_hash in self.blobs.hashes() if blob_hash not in reachable]
+            self.blobs.delete_many(garbage)
+            self.known = {}  # Cached hashes may point at deleted blobs
+        return len(garbage)
+
+    def _mark_texts(self, obj, reachable):
+        if isinstance(obj, dict):
+            if len(obj) == 1 and '$text' in obj:
+                reachable.add(obj['$text'])
+                return
+            for value in obj.values():
+                self._mark_texts(value, reachable)
+        elif isinstance(obj, list):
+            for value in obj:
+                self._mark_texts(value, reachable)
@@ -0,0 +1,182 @@
+import copy
+import time
+import logging
+import threading
+
+# Versioned document shapes.
+#
+# Every document persistence writes carries the version of its collection's
+# shape in SCHEMA_FIELD (see SCHEMA_VERSIONS); documents written before
+# versions existed have none and count as version 0. When a shape changes, its
+# version goes up and a migration function registered with @migration turns a
+# document of the previous version into the new shape.
+#
+# Documents are migrated lazily: load_saved_game_world migrates what it reads
+# and writes the changed fields back (see persistence), so a world is upgraded
+# the first time it is played. The Migrator walks the rest of a collection in
+# the background, a batch at a time and at most rate documents a second, so
+# nothing has to be rewritten in one go and the database never stops serving
+# games. Both only write a document back if it still has the version they
+# read, so a migration never overwrites a save made in the meantime.
+#
+# Migrations must be safe to run on a document that already has the new shape
+# (a document saved in part before versions existed, e.g.), and can only add
+# or change fields: write-backs are merged into the stored document.
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FIELD = 'schema_version'
+
+# Collection -> version of the documents persistence writes
+SCHEMA_VERSIONS = {'players': 2, 'npcs': 2, 'locations': 1}
+
+MIGRATION_RATE = 200  # Documents a second read by the background migrator
+MIGRATION_BATCH_SIZE = 100  # Documents per scan() and write-back
+
+# (collection, version) -> function turning a document of that version into the next one
+MIGRATIONS = {}
+
+_MISSING = object()
+
+
+def migration(collection: str, version: int):
+    def register(function):
+        MIGRATIONS[(collection, version)] = function
+        return function
+    return register
+
+
+def schema_version(document) -> int:
+    return document.get(SCHEMA_FIELD) or 0
+
+
+# Function to bring a document to its collection's current version.
+# Returns (document, change): change is None if the document was current, else
+# (version read, fields to write back), the fields carrying the document's key.
+def migrate(collection: str, document):
+    version = schema_version(document)
+    target = SCHEMA_VERSIONS[collection]
+    if version >= target:
+        # Documents from a newer version are read as they are; loaders ignore unknown fields
+        return document, None
+    migrated = copy.deepcopy(document)
+    for step in range(version, target):
+        migrated = MIGRATIONS[(collection, step)](migrated)
+        migrated[SCHEMA_FIELD] = step + 1
+    fields = {key: value for key, value in migrated.items() if document.get(key, _MISSING) != value}
+    for key in ('_id', 'id'):
+        if key in migrated:
+            fields[key] = migrated[key]
+    return migrated, (version, fields)
+
+
+def _item_list(items):
+    # Inventories were once stored as a dict of name -> description (or item document)
+    if isinstance(items, dict):
+        return [dict(value, name=name) if isinstance(value, dict) else {'name': name, 'description': str(value)}
+                for name, value in items.items()]
+    return list(items or [])
+
+
+@migration('players', 0)
+def player_v1(document):
+    # Profiles from POST /api/players only had Mongo's _id, an inventory dict and no level or position;
+    # saved worlds had an 'id' but no health, mana or stats
+    if 'id' not in document and '_id' in document:
+        document['id'] = str(document['_id'])
+    document['inventory'] = _item_list(document.get('inventory'))
+    document.setdefault('health', 100)
+    document.setdefault('mana', 100)
+    document.setdefault('level', 1)
+    document.setdefault('experience', 0)
+    document.setdefault('coordinates', [0, 0])
+    document.setdefault('quests', [])
+    return document
+
+
+@migration('npcs', 0)
+def npc_v1(document):
+    document['inventory'] = _item_list(document.get('inventory'))
+    document.setdefault('description', 'No description available.')
+    document.setdefault('race', 'Unknown')
+    document.setdefault('class_type', 'Unknown')
+    document.setdefault('level', 1)
+    document.setdefault('experience', 0)
+    return document
+
+
+@migration('players', 1)
+def player_v2(document):
+    # Quests were saved as id, name and completed only
+    for quest in document.get('quests', []):
+        quest.setdefault('description', '')
+        quest.setdefault('criteria', [])
+    return document
+
+
+@migration('npcs', 1)
+def npc_v2(document):
+    # NPCs were saved without health, mana, stats or party potential; stats stay
+    # missing so the NPC's defaults apply when it is loaded
+    document.setdefault('health', 100)
+    document.setdefault('mana', 100)
+    document.setdefault('party_potential', 0)
+    return document
+
+
+@migration('locations', 0)
+def location_v1(document):
+    # Early saves had no paths
+    document['items'] = _item_list(document.get('items'))
+    document.setdefault('description', '')
+    document.setdefault('npcs', [])
+    document.setdefault('paths', [])
+    return document
+
+
+# Walks collections in the background, migrating the documents no game has loaded yet
+class Migrator:
+    def __init__(self, storage, rate: float = MIGRATION_RATE, batch_size: int = MIGRATION_BATCH_SIZE,
+                 collections=tuple(SCHEMA_VERSIONS)):
+        self.storage = storage  # A storage backend (see storage); needs scan() and write_migrated()
+        self.rate = rate  # Documents read a second; 0 for no limit
+        self.batch_size = batch_size
+        self.collections = collections
+        self.scanned = 0
+        self.migrated = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def run(self) -> int:
+        # Walk every collection once; returns the number of documents migrated
+        for collection in self.collections:
+            after = None
+            while not self.stop_event.is_set():
+                started = time.monotonic()
+                documents, after = self.storage.scan(collection, after, self.batch_size)
+                changes = [change for change in (migrate(collection, document)[1] for document in documents) if change]
+                if changes:
+                    self.migrated += self.storage.write_migrated(collection, changes, self.batch_size)
+                self.scanned += len(documents)
+                if after is None:
+                    break
+                if self.rate:
+                    self.stop_event.wait(max(0.0, len(documents) / self.rate - (time.monotonic() - started)))
+        return self.migrated
+
+    def _run(self):
+        try:
+            self.run()
+            logger.info(f"Schema migration of {self.storage.name} done: {self.migrated} of {self.scanned} documents migrated")
+        except Exception as e:
+            # Whatever is left is still migrated when it is loaded
+            logger.error(f"Schema migration of {self.storage.name} stopped: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='schema-migrator', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = None):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout)
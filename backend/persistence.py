@@ -0,0 +1,360 @@
+import uuid
+import logging
+from pymongo import UpdateOne
+from the_veiled_realm.models import GameWorld, Player, NPC, Quest, QuestCriteria, Location, Item, Path
+from migrations import SCHEMA_FIELD, SCHEMA_VERSIONS, migrate
+
+# Documents for a GameWorld.
+#
+# A world is stored as one document per player, NPC and location, in one of
+# the storage backends (see storage). Against Mongo, saves send each
+# collection's upserts as unordered bulk_write batches of up to batch_size
+# operations, so a save costs a few round trips per collection instead of one
+# per entity.
+#
+# Saves are incremental: the models track which attributes changed (see
+# Tracked in models), and only entities with changes are written, as $set
+# deltas of the changed fields. Items, paths and quests are embedded in their
+# owner's document, so a change to one of them rewrites that field of the
+# owner.
+#
+# The player document also records journal_seq, the last turn journal entry
+# (see journal) the saved state includes.
+#
+# Saves can run on other threads while turns are played (autosaves, evictions,
+# the turn pipeline's save workers). A save first takes a snapshot: the
+# documents of everything that changed, built under the world's state_lock,
+# which turns hold while they apply an update. The documents share nothing
+# with the live models, so they are written without the lock and turns never
+# wait for the database.
+#
+# Documents carry the schema version of their collection (see migrations).
+# Full documents are stamped with it; deltas are not, so a document saved in
+# part before its migration still reads as the old version. Loading a world
+# migrates its documents and, with write_back, writes the migrated fields
+# back; otherwise the migrated entities are saved in full with the next save.
+
+logger = logging.getLogger(__name__)
+
+SAVE_BATCH_SIZE = 500  # Upserts per bulk_write call
+
+# Model attributes stored under a different document field
+DOCUMENT_FIELDS = {'quest_list': 'quests'}
+
+
+def item_document(item):
+    return {'id': str(item.id), 'name': item.name, 'description': item.description}
+
+
+def quest_document(quest):
+    return {
+        'id': str(quest.id),
+        'name': quest.name,
+        'description': quest.description,
+        'completed': quest.completed,
+        'criteria': [{'id': str(criterion.id), 'description': criterion.description, 'completed': criterion.completed}
+                     for criterion in quest.criteria],
+    }
+
+
+def player_document(player):
+    return {
+        'id': str(player.id),
+        'name': player.name,
+        'race': player.race,
+        'class_type': player.class_type,
+        'health': player.health,
+        'mana': player.mana,
+        'stats': dict(player.stats or {}),
+        'level': player.level,
+        'experience': player.experience,
+        'coordinates': player.coordinates,
+        'inventory': [item_document(item) for item in player.inventory],
+        'quests': [quest_document(quest) for quest in player.quest_list],
+        SCHEMA_FIELD: SCHEMA_VERSIONS['players'],
+    }
+
+
+def npc_document(npc):
+    return {
+        'id': str(npc.id),
+        'name': npc.name,
+        'description': npc.description,
+        'race': npc.race,
+        'class_type': npc.class_type,
+        'health': npc.health,
+        'mana': npc.mana,
+        'stats': dict(npc.stats or {}),
+        'party_potential': npc.party_potential,
+        'level': npc.level,
+        'experience': npc.experience,
+        'coordinates': npc.coordinates,
+        'inventory': [item_document(item) for item in npc.inventory],
+        SCHEMA_FIELD: SCHEMA_VERSIONS['npcs'],
+    }
+
+
+def location_document(location, player_id):
+    return {
+        'id': str(location.id),
+        'player_id': player_id,
+        'name': location.name,
+        'description': location.description,
+        'coordinates': location.coordinates,
+        'items': [item_document(item) for item in location.items],
+        'npcs': [{'id': str(npc.id)} for npc in location.npcs],
+        'paths': [{'description': path.description, 'cardinal_direction': path.cardinal_direction,
+                   'destination_coordinates': path.destination_coordinates} for path in location.paths],
+        SCHEMA_FIELD: SCHEMA_VERSIONS['locations'],
+    }
+
+
+# Upsert documents by 'id' in unordered batches; returns the number of bulk_write calls
+def bulk_upsert(collection, documents, batch_size: int = SAVE_BATCH_SIZE) -> int:
+    calls = 0
+    for start in range(0, len(documents), batch_size):
+        operations = [
+            UpdateOne({'id': document['id']}, {'$set': document}, upsert=True)
+            for document in documents[start:start + batch_size]
+        ]
+        collection.bulk_write(operations, ordered=False)
+        calls += 1
+    return calls
+
+
+# (document field, objects) saved inside an entity's document
+def embedded_objects(entity):
+    if isinstance(entity, Player):
+        return [('inventory', entity.inventory), ('quests', entity.quest_list)]
+    if isinstance(entity, NPC):
+        return [('inventory', entity.inventory)]
+    if isinstance(entity, Location):
+        return [('items', entity.items), ('paths', entity.paths)]
+    if isinstance(entity, Quest):
+        return [('criteria', entity.criteria)]
+    return []
+
+
+# Function to keep only the changed fields of a document (always with its 'id')
+def document_delta(document, fields, always=('id',)):
+    return {field: value for field, value in document.items() if field in fields or field in always}
+
+
+# The documents of one save, taken from a GameWorld at a single point in time
+class WorldSnapshot:
+    def __init__(self, game_world, changes, taken, journal_seq):
+        self.game_world = game_world
+        self.changes = changes  # Collection -> documents (or deltas) to upsert
+        self.taken = taken  # (object, attributes) taken from the change tracking
+        self.journal_seq = journal_seq  # Last journal entry the snapshot includes
+
+
+# Function to snapshot what changed in a GameWorld (everything with full=True).
+# Only this runs under the world's state_lock: the documents are built from the changed
+# entities while no turn is being applied, and writing them needs no lock.
+def snapshot_game_world(game_world, full: bool = False) -> WorldSnapshot:
+    taken = []
+
+    def changed_fields(entity):
+        # Document fields of entity that changed, including fields holding changed embedded objects
+        dirty = entity.take_dirty()
+        taken.append((entity, dirty))
+        fields = {DOCUMENT_FIELDS.get(attr, attr) for attr in dirty}
+        for field, objects in embedded_objects(entity):
+            for obj in objects:
+                if changed_fields(obj):
+                    fields.add(field)
+        return fields
+
+    def deltas(entities, build_document, always=('id',)):
+        documents = []
+        for entity in entities:
+            fields = changed_fields(entity)
+            if full or fields:
+                document = build_document(entity)
+                # A document whose fields all changed (a new entity) is written whole, with its schema version
+                if not full and not fields.issuperset(set(document).difference(always, (SCHEMA_FIELD,))):
+                    document = document_delta(document, fields, always)
+                documents.append(document)
+        return documents
+
+    with game_world.state_lock:
+        player_id = str(game_world.player.id)
+        locations = list(game_world.locations.values())
+        # The GameWorld keeps its NPCs in its locations
+        npcs = [npc for location in locations for npc in location.npcs]
+        journal_seq = getattr(game_world, 'journal_seq', None)
+        player_documents = deltas([game_world.player], player_document)
+        if journal_seq is not None and journal_seq != getattr(game_world, 'saved_journal_seq', None):
+            if not player_documents:
+                player_documents = [{'id': player_id}]
+            player_documents[0]['journal_seq'] = journal_seq
+        changes = {
+            'players': player_documents,
+            'npcs': deltas(npcs, npc_document),
+            'locations': deltas(locations, lambda location: location_document(location, player_id), ('id', 'player_id')),
+        }
+    return WorldSnapshot(game_world, changes, taken, journal_seq)
+
+
+# Function to write a snapshot to a storage backend; returns the number of round trips
+# (bulk_write calls or transactions). If the write fails, the changes are kept for the next save.
+def write_snapshot(storage, snapshot: WorldSnapshot, batch_size: int = SAVE_BATCH_SIZE) -> int:
+    try:
+        calls = storage.write(snapshot.changes, batch_size)
+    except Exception:
+        for obj, dirty in snapshot.taken:
+            obj.restore_dirty(dirty)
+        raise
+    if snapshot.journal_seq is not None:
+        snapshot.game_world.saved_journal_seq = snapshot.journal_seq
+    return calls
+
+
+# Write what changed in a GameWorld (everything with full=True) to a storage backend; returns the
+# number of round trips (bulk_write calls or transactions)
+def write_game_world(storage, game_world, batch_size: int = SAVE_BATCH_SIZE, full: bool = False) -> int:
+    return write_snapshot(storage, snapshot_game_world(game_world, full), batch_size)
+
+
+# Function to make a GameWorld the whole stored state of its player (e.g. a restored save slot):
+# writes it in full, then deletes the player's stored locations it doesn't have
+def replace_game_world(storage, game_world, batch_size: int = SAVE_BATCH_SIZE) -> int:
+    calls = write_game_world(storage, game_world, batch_size, full=True)
+    storage.delete_locations(str(game_world.player.id), [str(location.id) for location in game_world.locations.values()])
+    return calls + 1
+
+
+# Function to mark a whole GameWorld as saved (e.g. after loading it), except the entities in unsaved
+def mark_saved(game_world, unsaved=()):
+    unsaved = {id(entity) for entity in unsaved}
+
+    def mark(entity):
+        if id(entity) in unsaved:
+            return
+        entity.mark_clean()
+        for _, objects in embedded_objects(entity):
+            for obj in objects:
+                mark(obj)
+
+    mark(game_world.player)
+    for location in game_world.locations.values():
+        mark(location)
+        for npc in location.npcs:
+            mark(npc)
+
+
+# Function to rebuild an Item from its saved form, keeping its ID
+def load_item(item_data):
+    item = Item(item_data.get('name', 'Unknown'), item_data.get('description', ''))
+    if item_data.get('id'):
+        item.id = uuid.UUID(item_data['id'])
+    return item
+
+
+# Function to rebuild a Quest and its criteria from their saved form, keeping their IDs
+def load_quest(quest_data):
+    criteria = []
+    for criterion_data in quest_data.get('criteria', []):
+        criterion = QuestCriteria(criterion_data.get('description', ''))
+        criterion.completed = criterion_data.get('completed', False)
+        if criterion_data.get('id'):
+            criterion.id = uuid.UUID(criterion_data['id'])
+        criteria.append(criterion)
+    quest = Quest(quest_data.get('name', ''), quest_data.get('description', ''), criteria)
+    quest.completed = quest_data.get('completed', False)
+    if quest_data.get('id'):
+        quest.id = uuid.UUID(quest_data['id'])
+    return quest
+
+
+# Function to write back the documents migrated on read; returns True if all of them were written
+def write_migrated(storage, changes: dict) -> bool:
+    try:
+        written = sum(storage.write_migrated(collection, collection_changes)
+                      for collection, collection_changes in changes.items())
+    except Exception as e:
+        logger.warning(f"Could not write back migrated documents to {storage.name}: {e}")
+        return False
+    return written == sum(len(collection_changes) for collection_changes in changes.values())
+
+
+# Rebuild a saved GameWorld from its player document and the locations and NPCs in storage.
+# current_location is None if the player's location was never saved. Old documents are
+# migrated (see migrations); with write_back, the migrated fields are written back to storage.
+def load_saved_game_world(storage, player_data, write_back: bool = False):
+    changes = {}  # Collection -> [(version read, fields)] of the migrated documents
+    migrated = []  # Entities built from migrated documents
+
+    def read(collection, document):
+        document, change = migrate(collection, document)
+        if change:
+            changes.setdefault(collection, []).append(change)
+        return document, change is not None
+
+    player_data, player_migrated = read('players', player_data)
+    player = Player(
+        name=player_data['name'],
+        race=player_data['race'],
+        class_type=player_data['class_type'],
+        health=player_data.get('health', 100),
+        mana=player_data.get('mana', 100),
+        inventory=[load_item(item_data) for item_data in player_data.get('inventory', [])],
+        stats=player_data.get('stats'),
+        coordinates=tuple(player_data.get('coordinates') or (0, 0)),
+        level=player_data.get('level', 1),
+        experience=player_data.get('experience', 0),
+    )
+    player.id = player_data['id']
+    player.quest_list.extend(load_quest(quest_data) for quest_data in player_data.get('quests', []))
+    if player_migrated:
+        migrated.append(player)
+
+    game_world = GameWorld(player=player)
+    location_docs = storage.find_locations(player_data['id'])
+    npc_ids = [npc['id'] for location_data in location_docs for npc in location_data.get('npcs', [])]
+    npc_docs = {npc_data['id']: npc_data for npc_data in storage.find_npcs(npc_ids)}
+    for location_data in location_docs:
+        location_data, location_migrated = read('locations', location_data)
+        coordinates = tuple(location_data['coordinates'])
+        location = Location(location_data['name'], location_data['description'], coordinates)
+        location.id = uuid.UUID(location_data['id'])
+        location.items = [load_item(item_data) for item_data in location_data.get('items', [])]
+        location.paths = [
+            Path(path_data.get('description'),
+                 tuple(path_data['destination_coordinates']) if path_data.get('destination_coordinates') else None,
+                 path_data.get('cardinal_direction'))
+            for path_data in location_data.get('paths', [])
+        ]
+        for npc_ref in location_data.get('npcs', []):
+            npc_data = npc_docs.get(npc_ref['id'])
+            if npc_data:
+                npc_data, npc_migrated = read('npcs', npc_data)
+                npc = NPC(
+                    name=npc_data['name'],
+                    description=npc_data.get('description', 'No description available.'),
+                    race=npc_data.get('race', 'Unknown'),
+                    class_type=npc_data.get('class_type', 'Unknown'),
+                    health=npc_data.get('health', 100),
+                    mana=npc_data.get('mana', 100),
+                    stats=npc_data.get('stats'),
+                    party_potential=npc_data.get('party_potential', 0),
+                    inventory=[load_item(item_data) for item_data in npc_data.get('inventory', [])],
+                    coordinates=coordinates,
+                    level=npc_data.get('level', 1),
+                    experience=npc_data.get('experience', 0),
+                )
+                npc.id = uuid.UUID(npc_data['id'])
+                location.add_npc(npc)
+                if npc_migrated:
+                    migrated.append(npc)
+        game_world.add_location(location)
+        if location_migrated:
+            migrated.append(location)
+
+    game_world.current_location = game_world.get_location(player.coordinates)
+    game_world.journal_seq = game_world.saved_journal_seq = player_data.get('journal_seq', 0)
+    written = write_back and changes and write_migrated(storage, changes)
+    # Entities whose migration was not written back stay changed, so the next save writes them whole
+    mark_saved(game_world, () if written else migrated)
+    return game_world
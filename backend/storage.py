@@ -0,0 +1,333 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from bson import MinKey
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError, OperationFailure
+from persistence import bulk_upsert, SAVE_BATCH_SIZE
+from migrations import SCHEMA_FIELD, schema_version
+
+# Where saved GameWorlds live.
+#
+# A world is stored as players, npcs and locations documents keyed by 'id'
+# (see persistence for their shape). Every backend has the same interface:
+# write() applies a save's upserts, where each document only carries the
+# fields that changed and is merged into the stored one ($set semantics), and
+# the find_* methods read a world back. scan() and write_migrated() serve
+# schema migrations (see migrations): scan() pages through a collection in key
+# order, and write_migrated() merges migrated fields into documents that still
+# have the schema version they were read with.
+#
+# - MongoStorage keeps the documents in MongoDB collections.
+# - SQLiteStorage keeps them in a local SQLite file, so a single node needs no
+#   database server. Each document is a JSON column next to the keys that are
+#   looked up; a save is one transaction, written with executemany() in
+#   batches of batch_size rows through the connection's prepared statements.
+#   The database runs in WAL mode, so reads don't wait for a save to commit.
+# - MemoryStorage keeps them in dicts, for benchmarks and tests.
+#
+# STORAGE_BACKEND (mongo, sqlite or memory) picks the backend; see get_storage.
+#
+# ensure_indexes() runs at startup and creates the indexes the queries above
+# need, so no save or load scans a whole collection. check_queries.py verifies
+# that against a MongoDB server with explain().
+
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = ('players', 'npcs', 'locations')
+
+# Collection -> [(keys, options)] for MongoStorage.ensure_indexes
+MONGO_INDEXES = {
+    # Player profiles created before schema versions have no 'id' until they are migrated, hence sparse
+    'players': [([('id', 1)], {'name': 'id', 'unique': True, 'sparse': True})],
+    'npcs': [([('id', 1)], {'name': 'id', 'unique': True})],
+    'locations': [
+        ([('id', 1)], {'name': 'id', 'unique': True}),
+        # A world's locations on the coordinate grid; also serves lookups by player_id alone
+        ([('player_id', 1), ('coordinates', 1)], {'name': 'player_id_coordinates'}),
+    ],
+}
+
+
+class BaseStorage:
+    name = 'storage'  # Shown in log messages
+
+    def write(self, changes: dict, batch_size: int = SAVE_BATCH_SIZE) -> int:
+        # Upsert {collection: [document, ...]}; returns the number of round trips or transactions
+        raise NotImplementedError
+
+    def find_player(self, player_id):
+        raise NotImplementedError
+
+    def find_locations(self, player_id) -> list:
+        raise NotImplementedError
+
+    def find_npcs(self, npc_ids) -> list:
+        raise NotImplementedError
+
+    def delete_locations(self, player_id, keep_ids) -> None:
+        # Delete the player's locations whose id is not in keep_ids
+        raise NotImplementedError
+
+    def scan(self, collection: str, after=None, limit: int = SAVE_BATCH_SIZE):
+        # (up to limit documents with a key after 'after', key to continue from or None at the end)
+        raise NotImplementedError
+
+    def write_migrated(self, collection: str, changes, batch_size: int = SAVE_BATCH_SIZE) -> int:
+        # Merge [(version read, fields)] (see migrations.migrate); returns the number of documents changed
+        raise NotImplementedError
+
+    def ensure_indexes(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MongoStorage(BaseStorage):
+    name = 'MongoDB'
+
+    def __init__(self, db):
+        self.db = db  # e.g. mongo.db
+
+    def write(self, changes, batch_size=SAVE_BATCH_SIZE):
+        return sum(bulk_upsert(getattr(self.db, collection), documents, batch_size)
+                   for collection, documents in changes.items() if documents)
+
+    def find_player(self, player_id):
+        return self.db.players.find_one({'id': player_id})
+
+    def find_locations(self, player_id):
+        return list(self.db.locations.find({'player_id': player_id}))
+
+    def find_npcs(self, npc_ids):
+        return list(self.db.npcs.find({'id': {'$in': list(npc_ids)}}))
+
+    def delete_locations(self, player_id, keep_ids):
+        self.db.locations.delete_many({'player_id': player_id, 'id': {'$nin': list(keep_ids)}})
+
+    def scan(self, collection, after=None, limit=SAVE_BATCH_SIZE):
+        # By _id, so every page is a range of the _id index
+        documents = list(getattr(self.db, collection).find(
+            {'_id': {'$gt': MinKey() if after is None else after}}).sort('_id', 1).limit(limit))
+        return documents, documents[-1]['_id'] if len(documents) == limit else None
+
+    def write_migrated(self, collection, changes, batch_size=SAVE_BATCH_SIZE):
+        # By _id when it is known: old player profiles have no 'id'
+        modified = 0
+        for start in range(0, len(changes), batch_size):
+            operations = []
+            for version, fields in changes[start:start + batch_size]:
+                key = {'_id': fields['_id']} if '_id' in fields else {'id': fields['id']}
+                fields = {field: value for field, value in fields.items() if field != '_id'}
+                # Version 0 documents have no schema field; None matches that
+                operations.append(UpdateOne(dict(key, **{SCHEMA_FIELD: version or None}), {'$set': fields}))
+            modified += getattr(self.db, collection).bulk_write(operations, ordered=False).modified_count
+        return modified
+
+    def ensure_indexes(self):
+        # create_index is a no-op for indexes that already exist
+        for collection, indexes in MONGO_INDEXES.items():
+            for keys, options in indexes:
+                try:
+                    getattr(self.db, collection).create_index(keys, **options)
+                except OperationFailure as e:
+                    # e.g. duplicate ids in old data; saves still work, just without the index
+                    logger.error(f"Could not create index {options['name']} on {collection}: {e}")
+                except PyMongoError as e:
+                    logger.error(f"Could not create indexes, MongoDB is unavailable: {e}")
+                    return
+
+
+class SQLiteStorage(BaseStorage):
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS players (id TEXT PRIMARY KEY, data TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS npcs (id TEXT PRIMARY KEY, data TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS locations (id TEXT PRIMARY KEY, player_id TEXT NOT NULL, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS locations_player_id ON locations (player_id)",
+    )
+    # Rows of a table whose id is in a JSON array, so one statement serves any number of ids
+    SELECT = "SELECT id, data FROM {table} WHERE id IN (SELECT value FROM json_each(?))"
+    UPSERT = {
+        'players': "INSERT INTO players (id, data) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET data = excluded.data",
+        'npcs': "INSERT INTO npcs (id, data) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET data = excluded.data",
+        'locations': "INSERT INTO locations (id, player_id, data) VALUES (?, ?, ?) "
+                     "ON CONFLICT (id) DO UPDATE SET player_id = excluded.player_id, data = excluded.data",
+    }
+
+    def __init__(self, path, synchronous: str = 'NORMAL'):
+        self.name = os.path.basename(path)
+        self.lock = threading.Lock()  # The connection is shared by every thread
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # NORMAL only syncs at checkpoints in WAL mode: a power cut can lose the last saves, never corrupt
+        self.connection.execute(f"PRAGMA synchronous={synchronous}")
+        self.connection.execute("PRAGMA busy_timeout=5000")
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+
+    def write(self, changes, batch_size=SAVE_BATCH_SIZE):
+        if not any(changes.values()):
+            return 0
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for collection, documents in changes.items():
+                    for start in range(0, len(documents), batch_size):
+                        self._upsert(cursor, collection, documents[start:start + batch_size])
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return 1
+
+    def _upsert(self, cursor, collection, documents):
+        # Merge the changed fields into the stored documents
+        stored = {row[0]: json.loads(row[1]) for row in cursor.execute(
+            self.SELECT.format(table=collection), (json.dumps([document['id'] for document in documents]),))}
+        rows = []
+        for document in documents:
+            merged = stored.get(document['id'], {})
+            merged.update(document)
+            rows.append(self._row(collection, merged))
+        cursor.executemany(self.UPSERT[collection], rows)
+
+    def _row(self, collection, document):
+        data = json.dumps(document, separators=(',', ':'))
+        return (document['id'], document['player_id'], data) if collection == 'locations' else (document['id'], data)
+
+    def _find(self, sql, parameters):
+        with self.lock:
+            return [json.loads(row[0]) for row in self.connection.execute(sql, parameters)]
+
+    def find_player(self, player_id):
+        documents = self._find("SELECT data FROM players WHERE id = ?", (player_id,))
+        return documents[0] if documents else None
+
+    def find_locations(self, player_id):
+        return self._find("SELECT data FROM locations WHERE player_id = ?", (player_id,))
+
+    def find_npcs(self, npc_ids):
+        return self._find("SELECT data FROM npcs WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(npc_ids)),))
+
+    def delete_locations(self, player_id, keep_ids):
+        with self.lock:
+            self.connection.execute("DELETE FROM locations WHERE player_id = ? AND id NOT IN (SELECT value FROM json_each(?))",
+                                    (player_id, json.dumps(list(keep_ids))))
+
+    def scan(self, collection, after=None, limit=SAVE_BATCH_SIZE):
+        with self.lock:
+            rows = self.connection.execute(f"SELECT id, data FROM {collection} WHERE id > ? ORDER BY id LIMIT ?",
+                                           (after or '', limit)).fetchall()
+        return [json.loads(data) for _, data in rows], rows[-1][0] if len(rows) == limit else None
+
+    def write_migrated(self, collection, changes, batch_size=SAVE_BATCH_SIZE):
+        rows = []
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(changes), batch_size):
+                    batch = [(version, fields) for version, fields in changes[start:start + batch_size] if 'id' in fields]
+                    stored = {row[0]: json.loads(row[1]) for row in cursor.execute(
+                        self.SELECT.format(table=collection), (json.dumps([fields['id'] for _, fields in batch]),))}
+                    for version, fields in batch:
+                        document = stored.get(fields['id'])
+                        if document is not None and schema_version(document) == version:
+                            document.update((field, value) for field, value in fields.items() if field != '_id')
+                            rows.append(self._row(collection, document))
+                cursor.executemany(self.UPSERT[collection], rows)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class MemoryStorage(BaseStorage):
+    name = 'memory'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collections = {collection: {} for collection in COLLECTIONS}  # Collection -> id -> JSON text
+        self.player_locations = {}  # Player ID -> IDs of their locations (a dict, to keep the order they were added in)
+
+    def write(self, changes, batch_size=SAVE_BATCH_SIZE):
+        # Documents are kept as JSON, so nothing is shared with the live world
+        if not any(changes.values()):
+            return 0
+        with self.lock:
+            for collection, documents in changes.items():
+                stored = self.collections[collection]
+                for document in documents:
+                    merged = json.loads(stored[document['id']]) if document['id'] in stored else {}
+                    merged.update(document)
+                    stored[document['id']] = json.dumps(merged)
+                    if collection == 'locations':
+                        self.player_locations.setdefault(merged['player_id'], {})[merged['id']] = None
+        return 1
+
+    def _get(self, collection, ids):
+        with self.lock:
+            stored = self.collections[collection]
+            return [json.loads(stored[document_id]) for document_id in ids if document_id in stored]
+
+    def find_player(self, player_id):
+        documents = self._get('players', [player_id])
+        return documents[0] if documents else None
+
+    def find_locations(self, player_id):
+        with self.lock:
+            location_ids = list(self.player_locations.get(player_id, ()))
+        return self._get('locations', location_ids)
+
+    def find_npcs(self, npc_ids):
+        return self._get('npcs', npc_ids)
+
+    def delete_locations(self, player_id, keep_ids):
+        keep_ids = set(keep_ids)
+        with self.lock:
+            location_ids = self.player_locations.get(player_id, {})
+            for location_id in [location_id for location_id in location_ids if location_id not in keep_ids]:
+                del location_ids[location_id]
+                self.collections['locations'].pop(location_id, None)
+
+    def scan(self, collection, after=None, limit=SAVE_BATCH_SIZE):
+        with self.lock:
+            stored = self.collections[collection]
+            keys = sorted(key for key in stored if after is None or key > after)[:limit]
+            documents = [json.loads(stored[key]) for key in keys]
+        return documents, keys[-1] if len(keys) == limit else None
+
+    def write_migrated(self, collection, changes, batch_size=SAVE_BATCH_SIZE):
+        written = 0
+        with self.lock:
+            stored = self.collections[collection]
+            for version, fields in changes:
+                if fields.get('id') not in stored:
+                    continue
+                document = json.loads(stored[fields['id']])
+                if schema_version(document) == version:
+                    document.update((field, value) for field, value in fields.items() if field != '_id')
+                    stored[fields['id']] = json.dumps(document)
+                    written += 1
+        return written
+
+
+# Function to create the storage backend named by kind (STORAGE_BACKEND when omitted)
+def get_storage(kind: str = None, mongo_db=None, sqlite_path: str = None) -> BaseStorage:
+    kind = kind or os.getenv('STORAGE_BACKEND', 'mongo')
+    if kind == 'sqlite':
+        return SQLiteStorage(sqlite_path or os.getenv('SQLITE_PATH') or 'the_veiled_realm.db')
+    if kind == 'memory':
+        return MemoryStorage()
+    if kind == 'mongo':
+        return MongoStorage(mongo_db)
+    raise ValueError(f"Unknown storage backend: {kind}")
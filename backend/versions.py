@@ -0,0 +1,191 @@
+from the_veiled_realm.models import GameWorld, Tracked
+from persistence import player_document, npc_document, location_document, embedded_objects, load_saved_game_world
+
+# Persistent versions of a GameWorld, for save slots, branches and undo.
+#
+# A WorldVersion is an immutable view of a world: the player's document and
+# persistent maps of location and NPC documents (the same documents the
+# storage backends save, see persistence). Capturing a version starts from
+# the world's previous one and only rebuilds the documents of entities
+# changed since then; everything else, including most of the maps' nodes, is
+# shared with the previous version. Each save slot therefore costs memory in
+# proportion to what changed since the last capture, not to the world's size.
+#
+# Changes are found through the revision number Tracked objects take when
+# they change, so a capture walks those numbers but copies only what changed.
+#
+# A version has the read interface of a storage backend, so restore() can
+# rebuild a live GameWorld from it with load_saved_game_world.
+
+
+class _Leaf:
+    __slots__ = ('hash', 'key', 'value')
+
+    def __init__(self, hash_, key, value):
+        self.hash = hash_
+        self.key = key
+        self.value = value
+
+
+class _Collision:
+    __slots__ = ('hash', 'leaves')
+
+    def __init__(self, hash_, leaves):
+        self.hash = hash_
+        self.leaves = leaves  # Tuple of _Leaf with the same hash
+
+
+# Immutable hash trie: set() returns a new map that shares every untouched node with this one
+class PersistentMap:
+    BITS = 5
+    WIDTH = 1 << BITS
+    MASK = WIDTH - 1
+    HASH_BITS = 64
+
+    __slots__ = ('_root', '_size')
+
+    def __init__(self, root=None, size=0):
+        self._root = root  # Tuple of WIDTH slots: None, _Leaf, _Collision or a child node
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def _hash(self, key):
+        return hash(key) & ((1 << self.HASH_BITS) - 1)
+
+    def get(self, key, default=None):
+        hash_ = self._hash(key)
+        node, shift = self._root, 0
+        while node is not None:
+            slot = node[(hash_ >> shift) & self.MASK]
+            if slot is None:
+                return default
+            if isinstance(slot, _Leaf):
+                return slot.value if slot.key == key else default
+            if isinstance(slot, _Collision):
+                return next((leaf.value for leaf in slot.leaves if leaf.key == key), default)
+            node, shift = slot, shift + self.BITS
+        return default
+
+    def set(self, key, value) -> 'PersistentMap':
+        root, added = self._set(self._root, 0, _Leaf(self._hash(key), key, value))
+        return PersistentMap(root, self._size + added)
+
+    def _set(self, node, shift, leaf):
+        # (new node, 1 if the key is new else 0)
+        slots = list(node) if node is not None else [None] * self.WIDTH
+        index = (leaf.hash >> shift) & self.MASK
+        slot = slots[index]
+        added = 1
+        if slot is None:
+            slots[index] = leaf
+        elif isinstance(slot, _Leaf):
+            if slot.key == leaf.key:
+                slots[index] = leaf
+                added = 0
+            elif slot.hash == leaf.hash:
+                slots[index] = _Collision(leaf.hash, (slot, leaf))
+            else:
+                child, _ = self._set(None, shift + self.BITS, slot)
+                slots[index], _ = self._set(child, shift + self.BITS, leaf)
+        elif isinstance(slot, _Collision):
+            if slot.hash == leaf.hash:
+                others = tuple(other for other in slot.leaves if other.key != leaf.key)
+                added = int(len(others) == len(slot.leaves))
+                slots[index] = _Collision(slot.hash, others + (leaf,))
+            else:
+                child = [None] * self.WIDTH
+                child[(slot.hash >> (shift + self.BITS)) & self.MASK] = slot
+                slots[index], _ = self._set(tuple(child), shift + self.BITS, leaf)
+        else:
+            slots[index], added = self._set(slot, shift + self.BITS, leaf)
+        return tuple(slots), added
+
+    def items(self):
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            for slot in stack.pop():
+                if slot is None:
+                    continue
+                if isinstance(slot, _Leaf):
+                    yield slot.key, slot.value
+                elif isinstance(slot, _Collision):
+                    for leaf in slot.leaves:
+                        yield leaf.key, leaf.value
+                else:
+                    stack.append(slot)
+
+    def values(self):
+        return (value for _, value in self.items())
+
+
+_MISSING = object()
+
+
+class WorldVersion:
+    def __init__(self, player, locations: PersistentMap, npcs: PersistentMap, revision: int, journal_seq=None):
+        # The documents are shared between versions and must not be changed
+        self.player = player
+        self.locations = locations  # Coordinates -> location document, like GameWorld.locations
+        self.npcs = npcs  # NPC ID -> NPC document
+        self.revision = revision  # Changes with a higher revision came after this version
+        self.journal_seq = journal_seq
+
+    def find_player(self, player_id):
+        return self.player if self.player['id'] == player_id else None
+
+    def find_locations(self, player_id):
+        return list(self.locations.values()) if self.player['id'] == player_id else []
+
+    def find_npcs(self, npc_ids):
+        return [self.npcs.get(npc_id) for npc_id in npc_ids if npc_id in self.npcs]
+
+
+# Function to get the newest revision of an entity and the objects embedded in it
+def latest_revision(entity: Tracked) -> int:
+    revision = entity.__dict__.get('_revision', 0)
+    for _, objects in embedded_objects(entity):
+        for obj in objects:
+            revision = max(revision, latest_revision(obj))
+    return revision
+
+
+# Capture the current state of a GameWorld, sharing what didn't change with its previous version
+def capture(game_world: GameWorld, base: WorldVersion = None) -> WorldVersion:
+    base = base or game_world.version
+    with game_world.state_lock:
+        revision = Tracked.next_revision()
+        player_id = str(game_world.player.id)
+        if base is None:
+            player, locations, npcs, since = None, PersistentMap(), PersistentMap(), -1
+        else:
+            player, locations, npcs, since = base.player, base.locations, base.npcs, base.revision
+        if player is None or latest_revision(game_world.player) > since:
+            player = player_document(game_world.player)
+        for coordinates, location in game_world.locations.items():
+            # Entities added since the base (e.g. prefetched locations) may have older revisions
+            stored = locations.get(coordinates)
+            if stored is None or stored['id'] != str(location.id) or latest_revision(location) > since:
+                locations = locations.set(coordinates, location_document(location, player_id))
+            for npc in location.npcs:
+                npc_id = str(npc.id)
+                if npc_id not in npcs or latest_revision(npc) > since:
+                    npcs = npcs.set(npc_id, npc_document(npc))
+        version = WorldVersion(player, locations, npcs, revision, getattr(game_world, 'journal_seq', None))
+        game_world.version = version
+    return version
+
+
+# Rebuild a live GameWorld from a version (e.g. to load a save slot, branch or undo).
+# Its storage holds a different state, so save it in full: write_game_world(..., full=True).
+def restore(version: WorldVersion) -> GameWorld:
+    game_world = load_saved_game_world(version, version.player)
+    # The rebuilt entities match the version's documents, so the next capture can share them all
+    game_world.version = WorldVersion(version.player, version.locations, version.npcs, Tracked.next_revision(),
+                                      version.journal_seq)
+    return game_world
+
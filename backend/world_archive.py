@@ -0,0 +1,464 @@
+import os
+import sys
+import mmap
+import time
+import uuid
+import zlib
+import struct
+import argparse
+
+try:
+    import msgpack
+except ImportError:  # The built-in encoder below writes the same bytes
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # Archives are written with zlib instead
+    zstandard = None
+
+from the_veiled_realm.models import GameWorld
+from persistence import load_saved_game_world, write_game_world
+from versions import WorldVersion, capture
+
+# Compact binary file format for a whole GameWorld, for backups, moving a
+# world between nodes and fast cold loads.
+#
+# Layout (integers little-endian):
+#   header   MAGIC, format version (u8), codec (u8), 2 reserved bytes
+#   frames   metadata, player, then blocks of up to block_size locations
+#   index    a frame with each section's offset, and for each block the
+#            coordinates of its locations and where their records start
+#   footer   index offset (u64), INDEX_MAGIC
+# A frame is its stored length (u32), its raw length (u32) and the payload:
+# msgpack data compressed with the archive's codec (zstd when the zstandard
+# package is installed, zlib otherwise). Documents are the ones the storage
+# backends save (see persistence), with UUIDs as 16 bytes instead of
+# 36-character strings; a location record holds the location and its NPCs.
+#
+# Archives are written and read a block at a time, so a large world never has
+# to be held as one serialised blob, and WorldArchive memory-maps the file to
+# read a single location through the index.
+
+MAGIC = b'VRLM'
+INDEX_MAGIC = b'VRLI'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBH')
+FRAME = struct.Struct('<II')
+FOOTER = struct.Struct('<Q4s')
+BLOCK_LOCATIONS = 64  # Locations per compressed block
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+
+class ArchiveError(Exception):
+    pass
+
+
+# Encoding: msgpack when installed, otherwise this subset of it (nil, bool, int, float, str, bin, array, map)
+
+def _pack(obj, out: bytearray):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True or obj is False:
+        out.append(0xc3 if obj else 0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out += struct.pack('b', obj)
+        elif obj >= 0:
+            for code, fmt, limit in ((0xcc, '>B', 1 << 8), (0xcd, '>H', 1 << 16), (0xce, '>I', 1 << 32), (0xcf, '>Q', 1 << 64)):
+                if obj < limit:
+                    out.append(code)
+                    out += struct.pack(fmt, obj)
+                    break
+        else:
+            for code, fmt, limit in ((0xd0, '>b', 1 << 7), (0xd1, '>h', 1 << 15), (0xd2, '>i', 1 << 31), (0xd3, '>q', 1 << 63)):
+                if obj >= -limit:
+                    out.append(code)
+                    out += struct.pack(fmt, obj)
+                    break
+    elif isinstance(obj, float):
+        out.append(0xcb)
+        out += struct.pack('>d', obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        _pack_header(out, len(data), 0xa0, 32, (0xd9, 0xda, 0xdb))
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        _pack_header(out, len(obj), None, 0, (0xc4, 0xc5, 0xc6))
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        _pack_header(out, len(obj), 0x90, 16, (None, 0xdc, 0xdd))
+        for value in obj:
+            _pack(value, out)
+    elif isinstance(obj, dict):
+        _pack_header(out, len(obj), 0x80, 16, (None, 0xde, 0xdf))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"Cannot pack {type(obj).__name__}")
+
+
+def _pack_header(out, length, fix_code, fix_limit, codes):
+    # codes: 8, 16 and 32-bit length codes (None where the type has no such form)
+    if fix_code is not None and length < fix_limit:
+        out.append(fix_code | length)
+    elif codes[0] is not None and length < 1 << 8:
+        out.append(codes[0])
+        out.append(length)
+    elif length < 1 << 16:
+        out.append(codes[1])
+        out += struct.pack('>H', length)
+    else:
+        out.append(codes[2])
+        out += struct.pack('>I', length)
+
+
+def _unpack(data, pos):
+    # (object, next position)
+    code = data[pos]
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if 0xa0 <= code <= 0xbf:
+        length = code & 0x1f
+        return bytes(data[pos:pos + length]).decode('utf-8'), pos + length
+    if 0x90 <= code <= 0x9f:
+        return _unpack_array(data, pos, code & 0x0f)
+    if 0x80 <= code <= 0x8f:
+        return _unpack_map(data, pos, code & 0x0f)
+    if code == 0xc0:
+        return None, pos
+    if code in (0xc2, 0xc3):
+        return code == 0xc3, pos
+    if code == 0xcb:
+        return struct.unpack_from('>d', data, pos)[0], pos + 8
+    if code == 0xca:
+        return struct.unpack_from('>f', data, pos)[0], pos + 4
+    if code in _FIXED:
+        fmt = _FIXED[code]
+        return struct.unpack_from(fmt, data, pos)[0], pos + struct.calcsize(fmt)
+    if code in _SIZED:
+        kind, fmt = _SIZED[code]
+        length = struct.unpack_from(fmt, data, pos)[0]
+        pos += struct.calcsize(fmt)
+        if kind == 'str':
+            return bytes(data[pos:pos + length]).decode('utf-8'), pos + length
+        if kind == 'bin':
+            return bytes(data[pos:pos + length]), pos + length
+        if kind == 'array':
+            return _unpack_array(data, pos, length)
+        return _unpack_map(data, pos, length)
+    raise ArchiveError(f"Unsupported msgpack type 0x{code:02x}")
+
+
+_FIXED = {0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q', 0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q'}
+_SIZED = {
+    0xd9: ('str', '>B'), 0xda: ('str', '>H'), 0xdb: ('str', '>I'),
+    0xc4: ('bin', '>B'), 0xc5: ('bin', '>H'), 0xc6: ('bin', '>I'),
+    0xdc: ('array', '>H'), 0xdd: ('array', '>I'),
+    0xde: ('map', '>H'), 0xdf: ('map', '>I'),
+}
+
+
+def _unpack_array(data, pos, length):
+    items = []
+    for _ in range(length):
+        item, pos = _unpack(data, pos)
+        items.append(item)
+    return items, pos
+
+
+def _unpack_map(data, pos, length):
+    items = {}
+    for _ in range(length):
+        key, pos = _unpack(data, pos)
+        items[key], pos = _unpack(data, pos)
+    return items, pos
+
+
+def pack(obj) -> bytes:
+    if msgpack:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def unpack(data):
+    if msgpack:
+        return msgpack.unpackb(data, raw=False)
+    obj, pos = _unpack(data, 0)
+    if pos != len(data):
+        raise ArchiveError("Trailing bytes after msgpack data")
+    return obj
+
+
+# UUID fields are stored as 16 bytes; other ids (e.g. Mongo ObjectIds) stay strings
+
+def pack_ids(document):
+    if isinstance(document, dict):
+        packed = {}
+        for key, value in document.items():
+            if key == 'id' and isinstance(value, str):
+                try:
+                    if str(uuid.UUID(value)) == value:  # Only ids that read back identically
+                        value = uuid.UUID(value).bytes
+                except ValueError:
+                    pass
+            packed[key] = pack_ids(value)
+        return packed
+    if isinstance(document, (list, tuple)):
+        return [pack_ids(value) for value in document]
+    return document
+
+
+def unpack_ids(document):
+    if isinstance(document, dict):
+        return {key: str(uuid.UUID(bytes=value)) if key == 'id' and isinstance(value, bytes) and len(value) == 16
+                else unpack_ids(value) for key, value in document.items()}
+    if isinstance(document, list):
+        return [unpack_ids(value) for value in document]
+    return document
+
+
+# Compression
+
+def default_codec() -> int:
+    return CODEC_ZSTD if zstandard else CODEC_ZLIB
+
+
+def compress(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(codec: int, data) -> bytes:
+    if codec == CODEC_ZSTD:
+        if not zstandard:
+            raise ArchiveError("This archive is zstd compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(bytes(data))
+    return zlib.decompress(data)
+
+
+class ArchiveWriter:
+    def __init__(self, file, codec: int = None):
+        self.file = file
+        self.codec = codec or default_codec()
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.codec, 0))
+
+    def write_frame(self, obj) -> int:
+        # Write one frame and return its offset
+        return self.write_raw_frame(pack(obj))
+
+    def write_raw_frame(self, raw: bytes) -> int:
+        offset = self.file.tell()
+        stored = compress(self.codec, raw)
+        self.file.write(FRAME.pack(len(stored), len(raw)))
+        self.file.write(stored)
+        return offset
+
+    def finish(self, index: dict) -> None:
+        offset = self.write_frame(index)
+        self.file.write(FOOTER.pack(offset, INDEX_MAGIC))
+
+
+# Function to write a GameWorld (or a WorldVersion of one) to an archive file.
+# A world is captured first (see versions), so turns only wait for that, not for the write.
+def write_archive(world, path, codec: int = None, block_size: int = BLOCK_LOCATIONS) -> dict:
+    version = world if isinstance(world, WorldVersion) else capture(world)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        writer = ArchiveWriter(file, codec)
+        metadata = {
+            'format': FORMAT_VERSION,
+            'created': time.time(),
+            'player_id': version.player['id'],
+            'journal_seq': version.journal_seq,
+            'locations': len(version.locations),
+        }
+        index = {'metadata': writer.write_frame(metadata), 'player': writer.write_frame(pack_ids(version.player)), 'blocks': []}
+        block = []
+
+        def flush():
+            # A block is its records packed back to back; the index keeps where each one starts
+            records = [pack({'location': pack_ids(location), 'npcs': [pack_ids(npc) for npc in npcs]}) for location, npcs in block]
+            starts = [0]
+            for record in records[:-1]:
+                starts.append(starts[-1] + len(record))
+            offset = writer.write_raw_frame(b''.join(records))
+            index['blocks'].append([offset, [list(location['coordinates']) for location, _ in block], starts])
+            block.clear()
+
+        for location in version.locations.values():
+            npc_ids = [npc['id'] for npc in location.get('npcs', [])]
+            block.append((location, version.find_npcs(npc_ids)))
+            if len(block) >= block_size:
+                flush()
+        if block:
+            flush()
+        writer.finish(index)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    return metadata
+
+
+# Random and streaming access to an archive. It also has the read interface of a
+# storage backend, so read_archive can rebuild the world with load_saved_game_world.
+class WorldArchive:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ArchiveError(f"{path} is empty")
+        try:
+            magic, version, self.codec, _ = HEADER.unpack_from(self.data, 0)
+            if magic != MAGIC:
+                raise ArchiveError(f"{path} is not a world archive")
+            if version > FORMAT_VERSION:
+                raise ArchiveError(f"{path} has format version {version}; this build reads up to {FORMAT_VERSION}")
+            index_offset, index_magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+            if index_magic != INDEX_MAGIC:
+                raise ArchiveError(f"{path} is truncated")
+            self.index = self.read_frame(index_offset)
+            self.metadata = self.read_frame(self.index['metadata'])
+            self.block_of = {}  # Coordinates -> (block number, position in block)
+            for number, (_, coordinates, _) in enumerate(self.index['blocks']):
+                for position, location_coordinates in enumerate(coordinates):
+                    self.block_of[tuple(location_coordinates)] = (number, position)
+        except struct.error:
+            self.close()
+            raise ArchiveError(f"{path} is truncated")
+        except BaseException:
+            # A bad header or index: don't leave the file and the mapping open
+            self.close()
+            raise
+        self.npcs = {}  # NPC documents read by find_locations, for find_npcs
+
+    def read_raw_frame(self, offset: int) -> bytes:
+        stored, raw = FRAME.unpack_from(self.data, offset)
+        start = offset + FRAME.size
+        data = decompress(self.codec, self.data[start:start + stored])
+        if len(data) != raw:
+            raise ArchiveError(f"Corrupt frame at offset {offset}")
+        return data
+
+    def read_frame(self, offset: int):
+        return unpack(self.read_raw_frame(offset))
+
+    def read_records(self, number: int, positions=None):
+        # Decode the records of a block (only those at positions, when given)
+        offset, _, starts = self.index['blocks'][number]
+        data = self.read_raw_frame(offset)
+        ends = starts[1:] + [len(data)]
+        for position in (range(len(starts)) if positions is None else positions):
+            record = unpack(data[starts[position]:ends[position]])
+            yield unpack_ids(record['location']), unpack_ids(record['npcs'])
+
+    def player(self) -> dict:
+        return unpack_ids(self.read_frame(self.index['player']))
+
+    def location_at(self, coordinates):
+        # (location document, NPC documents) for one location, or None; reads a single block
+        found = self.block_of.get(tuple(coordinates))
+        if found is None:
+            return None
+        number, position = found
+        return next(self.read_records(number, [position]))
+
+    def iter_locations(self):
+        # (location document, NPC documents) for every location, one block in memory at a time
+        for number in range(len(self.index['blocks'])):
+            yield from self.read_records(number)
+
+    def find_player(self, player_id):
+        player = self.player()
+        return player if player['id'] == player_id else None
+
+    def find_locations(self, player_id):
+        locations = []
+        for location, npcs in self.iter_locations():
+            locations.append(location)
+            self.npcs.update((npc['id'], npc) for npc in npcs)
+        return locations
+
+    def find_npcs(self, npc_ids):
+        return [self.npcs[npc_id] for npc_id in npc_ids if npc_id in self.npcs]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Function to rebuild a GameWorld from an archive file
+def read_archive(path) -> GameWorld:
+    with WorldArchive(path) as archive:
+        game_world = load_saved_game_world(archive, archive.player())
+        game_world.journal_seq = archive.metadata.get('journal_seq') or 0
+    return game_world
+
+
+# Command line: export a saved world to an archive, import one into storage, or describe one.
+# The storage backend comes from the app's configuration (STORAGE_BACKEND, MONGO_URI, SQLITE_PATH).
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='Write a saved world to an archive')
+    export_parser.add_argument('player_id')
+    export_parser.add_argument('path')
+    import_parser = commands.add_parser('import', help='Save the world in an archive to storage')
+    import_parser.add_argument('path')
+    info_parser = commands.add_parser('info', help='Describe an archive')
+    info_parser.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        with WorldArchive(args.path) as archive:
+            print(f"Format {archive.metadata['format']}, codec {'zstd' if archive.codec == CODEC_ZSTD else 'zlib'}, "
+                  f"player {archive.metadata['player_id']}, {archive.metadata['locations']} locations "
+                  f"in {len(archive.index['blocks'])} blocks, {os.path.getsize(args.path) / 1024:.1f} KB")
+        return 0
+
+    from config import Config
+    from storage import get_storage
+    mongo_db = None
+    if Config.STORAGE_BACKEND == 'mongo':
+        from pymongo import MongoClient
+        mongo_db = MongoClient(Config.MONGO_URI).get_default_database()
+    storage = get_storage(Config.STORAGE_BACKEND, mongo_db=mongo_db, sqlite_path=Config.SQLITE_PATH)
+    try:
+        if args.command == 'export':
+            player_data = storage.find_player(args.player_id)
+            if not player_data:
+                print(f"No saved world for player {args.player_id}")
+                return 1
+            game_world = load_saved_game_world(storage, player_data)
+            metadata = write_archive(game_world, args.path)
+            print(f"Exported {metadata['locations']} locations to {args.path}")
+        else:
+            game_world = read_archive(args.path)
+            game_world.saved_journal_seq = None  # Write journal_seq too
+            write_game_world(storage, game_world, full=True)
+            print(f"Imported {len(game_world.locations)} locations for player {game_world.player.id}")
+    finally:
+        storage.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import os
+import sys
+import glob
+import json
+import time
+
+from the_veiled_realm.json_repair import parse_json_object
+
+# Benchmark for the local JSON repair engine over the logs/ corpus.
+#
+# Each logged response is parsed as-is and in a few damaged variants that
+# match what the model produces (prose around the object, code fences,
+# trailing commas, two objects back to back). For every variant it reports
+# whether the old brace-slicing approach and the repair engine produce a
+# usable object, and how long the repair engine takes.
+#
+# Usage: python bench_json_repair.py [logs_dir] [iterations]
+
+LOGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+EXPECTED_KEYS = ('RESPONSE', 'GAME_STATE_UPDATE', 'Location')
+
+
+def variants(text):
+    yield 'original', text
+    yield 'prose', f"Here is the updated game state:\n{text}\nLet me know what you do next!"
+    yield 'fenced', f"```json\n{text.strip().strip('`')}\n```"
+    yield 'trailing_commas', text.replace('"\n', '",\n').replace('}\n', '},\n').replace(']\n', '],\n')
+    yield 'two_objects', '{"PLAYER_DIED": "no"}\n' + text
+
+
+def brace_slice(text):
+    # The approach used before the repair engine
+    try:
+        return json.loads(text[text.find('{'):text.rfind('}') + 1])
+    except json.JSONDecodeError:
+        return None
+
+
+def has_list_coordinates(data):
+    # True if every coordinates value in data is an [x, y] pair
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key.lower() in ('coordinates', 'destination_coordinates'):
+                if not (isinstance(value, list) and len(value) == 2):
+                    return False
+            elif not has_list_coordinates(value):
+                return False
+    elif isinstance(data, list):
+        return all(has_list_coordinates(value) for value in data)
+    return True
+
+
+def usable(data):
+    return isinstance(data, dict) and any(key in data for key in EXPECTED_KEYS)
+
+
+def main():
+    logs_dir = sys.argv[1] if len(sys.argv) > 1 else LOGS_DIR
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    log_files = sorted(glob.glob(os.path.join(logs_dir, 'llm_response_*.log')))
+    if not log_files:
+        print(f"No llm_response_*.log files found in {logs_dir}")
+        return
+
+    totals = {}
+    print(f"{'file':<32} {'variant':<16} {'slice':>6} {'repair':>7} {'coords':>7} {'us/parse':>9}")
+    for log_file in log_files:
+        with open(log_file) as f:
+            text = f.read()
+        for name, variant in variants(text):
+            sliced = brace_slice(variant)
+            repaired = parse_json_object(variant, EXPECTED_KEYS)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                parse_json_object(variant, EXPECTED_KEYS)
+            elapsed_us = (time.perf_counter() - start) / iterations * 1e6
+
+            stats = totals.setdefault(name, {'count': 0, 'slice': 0, 'repair': 0, 'coords': 0, 'time_us': 0.0})
+            stats['count'] += 1
+            stats['slice'] += usable(sliced)
+            stats['repair'] += usable(repaired)
+            stats['coords'] += usable(repaired) and has_list_coordinates(repaired)
+            stats['time_us'] += elapsed_us
+            print(f"{os.path.basename(log_file):<32} {name:<16} {'ok' if usable(sliced) else '-':>6} "
+                  f"{'ok' if usable(repaired) else '-':>7} {'ok' if has_list_coordinates(repaired) else '-':>7} {elapsed_us:>9.1f}")
+
+    print("\nSummary (success rate; coords = coordinates normalised to [x, y]):")
+    print(f"{'variant':<16} {'slice':>7} {'repair':>7} {'coords':>7} {'mean us':>9}")
+    for name, stats in totals.items():
+        count = stats['count']
+        print(f"{name:<16} {stats['slice'] / count:>7.0%} {stats['repair'] / count:>7.0%} "
+              f"{stats['coords'] / count:>7.0%} {stats['time_us'] / count:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
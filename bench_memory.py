@@ -0,0 +1,43 @@
+import random
+
+from the_veiled_realm.memory import ConversationMemory
+from the_veiled_realm.schema_render import estimate_tokens
+
+# Benchmark for prompt growth with ConversationMemory.
+#
+# Plays synthetic turns (responses about the length the Game Master writes,
+# moving between a handful of locations and NPCs) and reports the size of the
+# history section of the prompt at several session lengths, next to the size
+# a naive "append the whole transcript" approach would reach. The extractive
+# summary is used so the numbers are reproducible without an LLM.
+#
+# Usage: python bench_memory.py
+
+CHECKPOINTS = (10, 100, 1000)
+LOCATIONS = ['Whispering Glade', 'Sunlit Forest', 'Shadowed Path', 'Mossy Clearing', 'Old Mill']
+NPCS = ['Elara', 'Borin', 'Grik', 'Thistle', 'Maelis', 'Oren']
+SENTENCE = "The trees sway as you pass and the light shifts across the mossy ground. "
+
+
+def main():
+    rng = random.Random(42)
+    memory = ConversationMemory()
+    transcript_chars = 0
+    print(f"{'turn':>6} {'naive tokens':>13} {'memory tokens':>14}")
+    for turn in range(1, max(CHECKPOINTS) + 1):
+        location = rng.choice(LOCATIONS)
+        npcs = rng.sample(NPCS, rng.randint(0, 2))
+        action = f"talk to {npcs[0]}" if npcs else rng.choice(['go north', 'look around', 'search the ground'])
+        response = f"Turn {turn}: you {action} in the {location}. " + SENTENCE * rng.randint(6, 12)
+        memory.record_turn(action, response, location, npcs)
+        transcript_chars += len(f"Player: {action}\nGame Master: {response}\n")
+
+        if turn in CHECKPOINTS:
+            memory.wait_for_refresh()
+            block = memory.context_block(location, npcs)
+            print(f"{turn:>6} {(transcript_chars + 3) // 4:>13} {estimate_tokens(block):>14}")
+    memory.shutdown()
+
+
+if __name__ == '__main__':
+    main()
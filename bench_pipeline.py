@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import asyncio
+
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('PREFETCH_LOCATIONS', '0')
+os.environ.setdefault('LOG_LLM_RESPONSES', '0')
+
+from the_veiled_realm.fake_llm import FakeLLMClient
+from the_veiled_realm.llm_client import set_client
+from the_veiled_realm.models import GameWorld, Player, Location
+from the_veiled_realm.turn_pipeline import TurnPipeline, STAGES
+
+# Load test for the asyncio turn pipeline against the offline fake LLM.
+#
+# Runs the same number of turns for a growing number of concurrent sessions
+# and reports turns per second, so the effect of overlapping LLM waits is
+# visible without network access. Saves go to a stand-in that sleeps for
+# save_ms to model a database write.
+#
+# Usage: python bench_pipeline.py [turns_per_session] [save_ms]
+
+ACTIONS = ['look around', 'go north', 'search the ground', 'talk to the stranger', 'go south']
+
+
+def make_world(index):
+    player = Player(name=f"Player {index}", race='Elf', class_type='Ranger')
+    return GameWorld(player=player, current_location=Location('Whispering Glade', 'A quiet glade.'))
+
+
+async def run(sessions, turns, save_ms):
+    def save(game_world):
+        time.sleep(save_ms / 1000)
+
+    pipeline = TurnPipeline(save=save)
+    await pipeline.start()
+    worlds = [make_world(index) for index in range(sessions)]
+
+    async def play(session_id, world):
+        for turn in range(turns):
+            await pipeline.run_turn(session_id, world, ACTIONS[turn % len(ACTIONS)])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(play(index, world) for index, world in enumerate(worlds)))
+    await pipeline.close()
+    return time.perf_counter() - start, pipeline
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    save_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    set_client(FakeLLMClient(mode='replay', latency='lognormal:-1.2,0.3', seed=1))
+    print(f"{'sessions':>8} {'turns':>6} {'seconds':>8} {'turns/s':>8}  mean ms per stage")
+    for sessions in (1, 10, 100):
+        elapsed, pipeline = asyncio.run(run(sessions, turns, save_ms))
+        per_stage = ' '.join(f"{stage}={pipeline.stage_time[stage] / pipeline.turns * 1000:.1f}" for stage in STAGES)
+        print(f"{sessions:>8} {pipeline.turns:>6} {elapsed:>8.2f} {pipeline.turns / elapsed:>8.1f}  {per_stage}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import time
+
+# Local interpreter for deterministic commands.
+#
+# Bookkeeping commands (inventory, stats, paths, quests, look, help) and moves
+# into locations the game already knows can be answered from GameWorld and
+# Player state without an LLM call. interpret() returns the text to show, or
+# None when the input needs the Game Master.
+
+DIRECTIONS = {
+    'n': 'north', 'north': 'north',
+    's': 'south', 'south': 'south',
+    'e': 'east', 'east': 'east',
+    'w': 'west', 'west': 'west',
+}
+
+MOVE_VERBS = ('go', 'move', 'walk', 'head', 'travel', 'run')
+
+# Alias -> command name
+ALIASES = {
+    'i': 'inventory', 'inv': 'inventory', 'inventory': 'inventory', 'items': 'inventory',
+    'stats': 'stats', 'stat': 'stats', 'st': 'stats', 'status': 'stats', 'character': 'stats',
+    'paths': 'paths', 'exits': 'paths', 'directions': 'paths', 'look at paths': 'paths',
+    'quests': 'quests', 'quest': 'quests', 'q': 'quests', 'journal': 'quests',
+    'look': 'look', 'l': 'look', 'look around': 'look',
+    'help': 'help', 'h': 'help', '?': 'help', 'commands': 'help',
+}
+
+# Longer names that may be abbreviated to any unique prefix of three or more letters
+COMMAND_NAMES = ('inventory', 'stats', 'status', 'paths', 'exits', 'quests', 'journal', 'look', 'help')
+
+
+class CommandInterpreter:
+    def __init__(self, find_location=None, on_move=None):
+        self.find_location = find_location  # Callable(game_state, coordinates) -> known Location or None
+        self.on_move = on_move  # Callable(game_state, direction, text) after a local move
+        self.handlers = {
+            'inventory': self.inventory,
+            'stats': self.stats,
+            'paths': self.paths,
+            'quests': self.quests,
+            'look': self.look,
+            'help': self.help,
+        }
+        self.local_count = 0  # Inputs answered locally
+        self.escalated_count = 0  # Inputs passed on to the LLM
+        self.local_time = 0.0  # Seconds spent answering locally
+
+    def parse(self, text):
+        # Return (command, argument) for a known command, or None
+        words = text.lower().strip().rstrip('.!').split()
+        if not words:
+            return None
+        phrase = ' '.join(words)
+        if phrase in ALIASES:
+            return ALIASES[phrase], None
+        if len(words) == 1 and words[0] in DIRECTIONS:
+            return 'move', DIRECTIONS[words[0]]
+        if len(words) == 2 and words[0] in MOVE_VERBS and words[1] in DIRECTIONS:
+            return 'move', DIRECTIONS[words[1]]
+        if len(words) == 1 and len(words[0]) >= 3:
+            matches = {ALIASES.get(name, name) for name in COMMAND_NAMES if name.startswith(words[0])}
+            if len(matches) == 1:
+                return matches.pop(), None
+        return None
+
+    def interpret(self, text, game_state):
+        start = time.perf_counter()
+        parsed = self.parse(text)
+        result = None
+        if parsed:
+            command, argument = parsed
+            if command == 'move':
+                result = self.move(game_state, argument)
+            else:
+                result = self.handlers[command](game_state)
+        if result is None:
+            self.escalated_count += 1
+        else:
+            self.local_count += 1
+            self.local_time += time.perf_counter() - start
+        return result
+
+    def inventory(self, game_state):
+        items = game_state.player.inventory
+        if not items:
+            return "Your pack is empty."
+        return "You are carrying:\n" + '\n'.join(f"- {item.name}: {item.description}" for item in items)
+
+    def stats(self, game_state):
+        player = game_state.player
+        lines = [
+            f"{player.name}, {player.race} {player.class_type} (Level {player.level})",
+            f"Health: {player.health}  Mana: {player.mana}  Experience: {player.experience}/{player.experience_to_next_level()}",
+        ]
+        lines += [f"{stat.capitalize()}: {value}" for stat, value in player.stats.items()]
+        return '\n'.join(lines)
+
+    def paths(self, game_state):
+        paths = game_state.current_location.paths
+        if not paths:
+            return "There are no visible paths from here."
+        return "Available paths:\n" + '\n'.join(f"- {path.cardinal_direction.capitalize()}: {path.description}" for path in paths)
+
+    def quests(self, game_state):
+        quests = game_state.player.quest_list
+        if not quests:
+            return "You have no active quests."
+        lines = []
+        for quest in quests:
+            lines.append(f"- {quest.name}{' (completed)' if quest.completed else ''}: {quest.description}")
+            for criteria in quest.criteria:
+                lines.append(f"    [{'x' if criteria.completed else ' '}] {criteria.description}")
+        return '\n'.join(lines)
+
+    def look(self, game_state):
+        location = game_state.current_location
+        lines = [location.name, location.description]
+        if location.items:
+            lines.append("You notice: " + ', '.join(item.name for item in location.items))
+        if location.npcs:
+            lines.append("Here with you: " + ', '.join(npc.name for npc in location.npcs))
+        lines.append(self.paths(game_state))
+        return '\n'.join(lines)
+
+    def help(self, game_state):
+        return ("Quick commands: inventory (i, inv), stats (st), paths (exits), quests (q), look (l), "
+                "n/s/e/w to move to places you know. Anything else is sent to the Game Master.")
+
+    def move(self, game_state, direction):
+        path = next((p for p in game_state.current_location.paths
+                     if (p.cardinal_direction or '').lower() == direction), None)
+        if path is None:
+            return f"There is no way {direction} from here."
+        if path.destination_coordinates is None or self.find_location is None:
+            return None
+        destination = self.find_location(game_state, tuple(path.destination_coordinates))
+        if destination is None:
+            return None  # Unknown place; the Game Master has to describe it
+
+        game_state.player.coordinates = tuple(path.destination_coordinates)
+        game_state.current_location = destination
+        game_state.add_location(destination)
+        text = f"You head {direction}.\n" + self.look(game_state)
+        if self.on_move:
+            self.on_move(game_state, direction, text)
+        return text
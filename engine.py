@@ -0,0 +1,1042 @@
+from typing import Tuple, List, Dict
+import os
+import json
+import uuid
+import dotenv
+import datetime
+import glob
+import logging
+import threading
+import contextlib
+from the_veiled_realm.response_stream import ResponseStreamParser
+from the_veiled_realm.prefetch import LocationPrefetcher
+from the_veiled_realm.json_repair import parse_json_object
+from the_veiled_realm.llm_client import get_client
+from the_veiled_realm.schema_render import load_master_schema, derive_schema, render_compact
+from the_veiled_realm.memory import ConversationMemory
+from the_veiled_realm.commands import CommandInterpreter
+from the_veiled_realm.structured_output import (
+    location_response_schema,
+    action_response_schema,
+    generation_config
+)
+from the_veiled_realm.models import (
+    GameWorld,
+    Player,
+    Location,
+    Item,
+    NPC,
+    Path
+)
+
+# Headless game engine.
+#
+# Engine.start(player) opens a Session and returns its first Scene, and
+# Engine.act(session, text) plays one turn and returns a TurnResult. Nothing
+# here reads input or writes to stdout, so one process can run any number of
+# sessions; front ends (the CLI in test_gemini_api, the Flask API) turn Scenes
+# and TurnResults into text or JSON with a renderer (see renderers).
+
+# Load environment variables from .env file in the backend directory
+dotenv.load_dotenv(dotenv_path='backend/.env')
+
+# The engine never writes to stdout; diagnostics go to this logger
+logger = logging.getLogger(__name__)
+
+# Derive the prompt schemas from master_schema.json, plus their compact prompt renderings
+master_schema = load_master_schema()
+initial_loc_json_schema = derive_schema(master_schema, 'initial_location')
+action_json_schema = derive_schema(master_schema, 'action')
+initial_loc_schema_text = render_compact(initial_loc_json_schema)
+action_schema_text = render_compact(action_json_schema)
+
+
+# Stream the Game Master narrative as it is generated (set STREAM_RESPONSES=0 to disable)
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', '1') != '0'
+
+# Ask for native JSON output matching the schemas (set STRUCTURED_OUTPUT=0 to disable)
+STRUCTURED_OUTPUT = os.getenv('STRUCTURED_OUTPUT', '1') != '0'
+response_schemas = {
+    'location': location_response_schema(initial_loc_json_schema),
+    'action': action_response_schema(action_json_schema),
+}
+unsupported_schemas = set()  # Schemas the model/SDK rejected; these use the prompt-only path
+
+try:
+    from google.api_core.exceptions import InvalidArgument
+except ImportError:  # No SDK; only the offline fake backend is available
+    InvalidArgument = None
+
+# Errors that mean the response schema itself was refused: the API's 400 InvalidArgument, or the
+# SDK failing to convert it. Anything else (429s, timeouts, outages) is raised as usual, so a
+# transient failure never turns structured output off for the rest of the process.
+SCHEMA_REJECTED = (ValueError, TypeError) + ((InvalidArgument,) if InvalidArgument else ())
+
+# Function to stop using a schema the model refused
+def reject_schema(schema_name, error):
+    logger.warning(f"Structured output unavailable for '{schema_name}', falling back to prompt-only JSON: {error}")
+    unsupported_schemas.add(schema_name)
+
+def use_schema(schema_name):
+    return STRUCTURED_OUTPUT and schema_name in response_schemas and schema_name not in unsupported_schemas
+
+# Function to call the model, using native structured output when it is available
+def generate_content(model, prompt, schema_name=None, **kwargs):
+    if kwargs.get('stream'):
+        return stream_content(model, prompt, schema_name, **kwargs)
+    if use_schema(schema_name):
+        try:
+            return model.generate_content(prompt, generation_config=generation_config(response_schemas[schema_name]), **kwargs)
+        except SCHEMA_REJECTED as e:
+            reject_schema(schema_name, e)
+    return model.generate_content(prompt, **kwargs)
+
+# Streaming version of generate_content: yields the response chunks. A streamed request can
+# fail when it is sent or on its first chunk, so a refused schema is detected up to there;
+# nothing has reached the caller yet, so the prompt-only request can take over.
+def stream_content(model, prompt, schema_name=None, **kwargs):
+    if use_schema(schema_name):
+        try:
+            chunks = iter(model.generate_content(prompt, generation_config=generation_config(response_schemas[schema_name]), **kwargs))
+            first = next(chunks, None)
+        except SCHEMA_REJECTED as e:
+            reject_schema(schema_name, e)
+        else:
+            if first is not None:
+                yield first
+            yield from chunks
+            return
+    yield from model.generate_content(prompt, **kwargs)
+
+# Asyncio version of generate_content
+async def generate_content_async(model, prompt, schema_name=None, **kwargs):
+    if use_schema(schema_name):
+        try:
+            return await model.generate_content_async(prompt, generation_config=generation_config(response_schemas[schema_name]), **kwargs)
+        except SCHEMA_REJECTED as e:
+            reject_schema(schema_name, e)
+    return await model.generate_content_async(prompt, **kwargs)
+
+# Where LLM responses are logged (set LOG_LLM_RESPONSES=0 to disable, e.g. for load tests).
+# Not logs/: that is the recorded corpus fake_llm and bench_json_repair read.
+LOG_LLM_RESPONSES = os.getenv('LOG_LLM_RESPONSES', '1') != '0'
+LLM_LOG_DIR = os.getenv('LLM_LOG_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_logs')
+LLM_LOG_KEEP = int(os.getenv('LLM_LOG_KEEP', '100'))  # Newest log files kept
+llm_log_lock = threading.Lock()
+
+# Function to log LLM responses to a file. A failed write is reported, never raised:
+# logging must not fail a turn.
+def log_llm_response(response_text):
+    if not LOG_LLM_RESPONSES:
+        return
+    # Names sort by time; the random part keeps responses logged in the same instant apart
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    log_filename = os.path.join(LLM_LOG_DIR, f'llm_response_{timestamp}_{uuid.uuid4().hex[:8]}.log')
+    try:
+        os.makedirs(LLM_LOG_DIR, exist_ok=True)
+        with open(log_filename, 'w', encoding='utf-8') as log_file:
+            log_file.write(response_text)
+        with llm_log_lock:
+            # Delete the oldest log files; another process may have deleted them already
+            log_files = sorted(glob.glob(os.path.join(LLM_LOG_DIR, 'llm_response_*.log')))
+            for old_log in log_files[:max(0, len(log_files) - LLM_LOG_KEEP)]:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(old_log)
+    except OSError as e:
+        logger.warning(f"Could not log LLM response to {LLM_LOG_DIR}: {e}")
+
+# Coordinate offsets for each cardinal direction
+DIRECTION_OFFSETS = {
+    'NORTH': (0, 1),
+    'SOUTH': (0, -1),
+    'EAST': (1, 0),
+    'WEST': (-1, 0),
+}
+
+# Function to get the coordinates one step away in a cardinal direction
+def step_coordinates(coordinates, direction):
+    dx, dy = DIRECTION_OFFSETS.get((direction or '').upper(), (0, 0))
+    x, y = coordinates
+    return (x + dx, y + dy)
+
+# Function to ask the LLM for a Location and return the parsed 'Location' data (or None)
+def generate_location_data(prompt):
+    model = get_client().model()
+    raw_response = generate_content(model, prompt, 'location')
+    response_text = raw_response.text.strip()
+    log_llm_response(response_text)
+
+    # Attempt to parse the response, repairing common defects locally first
+    location_data = parse_json_object(response_text, ('Location',))
+    if location_data is None:
+        # Only ask the LLM again if local repair couldn't recover the JSON
+        error_prompt = f"""
+        The previous response could not be parsed as JSON. Please provide a valid JSON response for a Location using the following schema:
+        {initial_loc_schema_text}
+        
+        Ensure the response is a single, valid JSON object with no additional text before or after.
+        """
+        retry_response = generate_content(model, error_prompt, 'location')
+        retry_text = retry_response.text.strip()
+        location_data = parse_json_object(retry_text, ('Location',))
+        if location_data is None:
+            logger.error(f"Failed to decode JSON after retry. Response was: {retry_text}")
+            return None
+
+    # Check for required keys in location_data
+    required_keys = ['name', 'description']
+    missing_keys = [key for key in required_keys if key not in location_data.get('Location', {})]
+    if missing_keys:
+        logger.error(f"Missing {', '.join(missing_keys)} in location data.")
+        return None
+
+    return location_data.get('Location', {})
+
+# Function to build a Location object from the LLM's 'Location' data
+def build_location(location_data, coordinates) -> Location:
+    location = Location(
+        name=location_data["name"],
+        description=location_data["description"],
+        coordinates=coordinates,
+    )
+
+    # Add items to the location
+    if 'items' in location_data:
+        for item_data in location_data["items"]:
+            if 'name' in item_data and 'description' in item_data:
+                item = Item(name=item_data["name"], description=item_data["description"])
+                location.add_item(item)
+            else:
+                logger.warning("Missing 'name' or 'description' in item data.")
+
+    # Add NPCs to the location
+    if 'npcs' in location_data:
+        for npc_data in location_data["npcs"]:
+            npc = NPC(
+                name=npc_data.get("name", "Unknown"),
+                description=npc_data.get("description", "No description available."),
+                race=npc_data.get("race", "Unknown"),
+                class_type=npc_data.get("class_type", "Unknown"),
+                health=npc_data.get("health", 100),  # Default health
+                mana=npc_data.get("mana", 100),      # Default mana
+                coordinates=coordinates
+            )
+            location.add_npc(npc)
+
+    # Add paths to the location
+    if 'paths' in location_data:
+        for path_data in location_data["paths"]:
+            if 'description' in path_data and 'cardinal_direction' in path_data:
+                # Destinations follow from the direction when the LLM leaves them out
+                destination = path_data.get("destination_coordinates") or step_coordinates(coordinates, path_data["cardinal_direction"])
+                path = Path(
+                    description=path_data["description"],
+                    destination_coordinates=tuple(destination),
+                    cardinal_direction=path_data["cardinal_direction"]
+                )
+                location.add_path(path)
+            else:
+                logger.warning("Missing required keys in path data.")
+
+    return location
+
+# Function to create the starting location based on player attributes
+def create_starting_location(player: Player) -> Location:
+    prompt = f"""
+    Create a starting location for a {player.race} {player.class_type} in a fantasy RPG.
+    Creatively work into the narrative:
+    1. A detailed description of the surroundings
+    2. A unique feature based on the character's class
+    3. Three or four paths leading to different Locations
+    4. Two to four items that can be found in this location
+    5. Zero or more NPCs with different races and classes that can be found in this location
+    
+    EXTREMELY IMPORTANT: The game expects you to return a 'Location' object in
+    JSON format using the following schema (note that the Location class
+    is made up of some of the other classes defined here, so you'll need
+    to match their structures when you create your JSON response):
+    {initial_loc_schema_text}
+    """
+
+    location_data = generate_location_data(prompt)
+    if location_data is None:
+        return Location(name="Error Location", description="An error occurred while creating the starting location.")
+    return build_location(location_data, (0, 0))
+
+# Function to generate the Location at the far end of a Path (used by the prefetcher)
+def generate_path_destination(player: Player, from_location: Location, path: Path) -> Location:
+    prompt = f"""
+    A {player.race} {player.class_type} in a fantasy RPG is standing in {from_location.name}:
+    {from_location.description}
+
+    Create the location they reach by heading {path.cardinal_direction} along this path:
+    {path.description}
+
+    Creatively work into the narrative:
+    1. A detailed description of the surroundings that follows on from the path
+    2. One to four paths leading to different Locations, including the way back {from_location.name}
+    3. Zero to four items that can be found in this location
+    4. Zero or more NPCs with different races and classes that can be found in this location
+
+    EXTREMELY IMPORTANT: The game expects you to return a 'Location' object in
+    JSON format using the following schema:
+    {initial_loc_schema_text}
+    """
+
+    location_data = generate_location_data(prompt)
+    if location_data is None:
+        return None
+    return build_location(location_data, tuple(path.destination_coordinates))
+
+# Generate neighbouring locations in the background (set PREFETCH_LOCATIONS=0 to disable)
+PREFETCH_LOCATIONS = os.getenv('PREFETCH_LOCATIONS', '1') != '0'
+location_prefetcher = LocationPrefetcher(generate_path_destination) if PREFETCH_LOCATIONS else None
+
+# Function to find a location the game already knows (visited or prefetched)
+def find_known_location(game_state: GameWorld, coordinates):
+    location = game_state.get_location(coordinates)
+    if location is None and location_prefetcher:
+        location = location_prefetcher.take(game_state, coordinates)
+    return location
+
+# Function to keep memory and prefetching in step after a move answered locally
+def after_local_move(game_state: GameWorld, direction: str, text: str) -> None:
+    record_turn(f"go {direction}", {"RESPONSE": text}, game_state)
+    if location_prefetcher:
+        location_prefetcher.schedule(game_state)
+
+# Answers bookkeeping commands and moves to known places without the LLM
+command_interpreter = CommandInterpreter(find_location=find_known_location, on_move=after_local_move)
+
+
+# Function to roll a new character's stats from their race and class
+def generate_stats(race, class_type):
+    import random
+
+    base_stats = {
+        'strength': 10, 'intelligence': 10, 'wisdom': 10,
+        'charisma': 10, 'stealth': 10, 'dexterity': 10, 'constitution': 10
+    }
+    
+    race_modifiers = {
+        'Human': {'all': 1},
+        'Elf': {'intelligence': 2, 'dexterity': 2, 'constitution': -1},
+        'Dwarf': {'strength': 2, 'constitution': 2, 'charisma': -1},
+        'Halfling': {'dexterity': 2, 'charisma': 1, 'strength': -1},
+        'Orc': {'strength': 3, 'constitution': 1, 'intelligence': -1},
+        'Goblin': {'dexterity': 2, 'stealth': 2, 'charisma': -1},
+        'Faun': {'charisma': 2, 'dexterity': 1, 'constitution': -1}
+    }
+    
+    class_modifiers = {
+        'Warrior': {'strength': 2, 'constitution': 2, 'intelligence': -1},
+        'Mage': {'intelligence': 3, 'wisdom': 1, 'strength': -1},
+        'Rogue': {'dexterity': 2, 'stealth': 2, 'wisdom': -1},
+        'Cleric': {'wisdom': 2, 'charisma': 2, 'dexterity': -1},
+        'Ranger': {'dexterity': 2, 'wisdom': 2, 'charisma': -1},
+        'Paladin': {'strength': 2, 'charisma': 2, 'stealth': -1},
+        'Bard': {'charisma': 2, 'dexterity': 2, 'constitution': -1}
+    }
+
+    for stat in base_stats:
+        if stat in race_modifiers.get(race, {}):
+            base_stats[stat] += race_modifiers[race][stat]
+        elif 'all' in race_modifiers.get(race, {}):
+            base_stats[stat] += race_modifiers[race]['all']
+        
+        if stat in class_modifiers.get(class_type, {}):
+            base_stats[stat] += class_modifiers[class_type][stat]
+        
+        base_stats[stat] += random.randint(0, 2)
+    
+    return base_stats
+
+
+# Hold back new prefetches for a world while its player's turn is waiting on the LLM
+def interactive_turn(game_state: GameWorld):
+    if location_prefetcher:
+        return location_prefetcher.interactive_turn(game_state)
+    return contextlib.nullcontext()
+
+# Function to list (path, location) pairs for neighbours that are visited or already prefetched
+def known_neighbours(game_state: GameWorld):
+    known = []
+    for path in game_state.current_location.paths:
+        if path.destination_coordinates is None:
+            continue
+        location = game_state.get_location(tuple(path.destination_coordinates))
+        if location:
+            known.append((path, location))
+    if location_prefetcher:
+        known.extend(location_prefetcher.ready_locations(game_state))
+    return known
+
+# Function to apply a LOCATION_CHANGES delta to a stored location
+def apply_location_changes(location: Location, changes: dict) -> None:
+    if changes.get('description'):
+        location.description = changes['description']
+    removed_items = {name.lower() for name in changes.get('items_removed', [])}
+    location.items = [item for item in location.items if item.name.lower() not in removed_items]
+    for item_data in changes.get('items_added', []):
+        location.add_item(Item(item_data.get('name', 'Unknown'), item_data.get('description', '')))
+    removed_npcs = {name.lower() for name in changes.get('npcs_removed', [])}
+    location.npcs = [npc for npc in location.npcs if npc.name.lower() not in removed_npcs]
+    for npc_data in changes.get('npcs_added', []):
+        location.add_npc(NPC(
+            name=npc_data.get('name', 'Unknown'),
+            description=npc_data.get('description', 'No description available.'),
+            race=npc_data.get('race', 'Unknown'),
+            class_type=npc_data.get('class_type', 'Unknown'),
+            coordinates=location.coordinates
+        ))
+
+# Function to fold older turns into the rolling story summary (runs in the background)
+def summarize_turns(summary: str, turns) -> str:
+    transcript = '\n'.join(f"Player: {turn.action}\nGame Master: {turn.response}" for turn in turns)
+    prompt = f"""
+    Update this summary of a text adventure so far with the new turns below.
+    Keep names of places, characters, items and unresolved events. Write at most 150 words of plain prose.
+
+    Summary so far: {summary or 'None'}
+
+    New turns:
+    {transcript}
+    """
+    return get_client().generate(prompt).text.strip()
+
+# Function to get a GameWorld's conversation memory, creating it on first use
+def get_memory(game_state: GameWorld) -> ConversationMemory:
+    memory = getattr(game_state, 'memory', None)
+    if memory is None:
+        memory = ConversationMemory(summarize=summarize_turns)
+        game_state.memory = memory
+    return memory
+
+# Function to remember a finished turn for later prompts
+def record_turn(user_input: str, response_data: dict, game_state: GameWorld) -> None:
+    location = game_state.current_location
+    get_memory(game_state).record_turn(
+        user_input,
+        str(response_data.get("RESPONSE", "")),
+        location.name,
+        [npc.name for npc in location.npcs]
+    )
+
+# Static part of the Game Master prompt. It is the same on every turn, so it is
+# sent once as a cached context / system instruction instead of with each action.
+GAME_MASTER_INSTRUCTIONS = f"""
+    You are the Game Master of a text-based adventure game. Your role is to interpret player actions, provide narrative responses, and update the game state.
+    Each message gives you the current game state and the player's action.
+
+    Examine this schema and use it as a guide for the JSON objects you will create:
+    {action_schema_text}
+    your response must be in this exact format:
+    {{
+        "RESPONSE": "Your narrative response here",
+        "GAME_STATE_UPDATE": "A list of JSON objects from the schema above representing the updated game state"
+    }}
+
+    Guidelines:
+    1. Interpret the player's action in the context of the current game state.
+    2. If the action is valid (e.g., "go east" when there's an eastern path), describe the result and update the location.
+    3. If the action is invalid (e.g., "go east" when there's no path), explain why it's not possible.
+    4. For item interactions, check if the item is in the inventory or current location before allowing its use.
+    5. Combat actions should affect health. If health reaches 0, end the game with a creative narrative and add {{"PLAYER_DIED": "yes"}},
+    otherwise, {{"PLAYER_DIED": "no"}}.
+    6. Maintain internal consistency with previous responses and the game world.
+    7. Do not use or refer to any nouns that could be considered copyrighted or trademarked or that is known as existing intellectual property.
+    8. Always provide a narrative response, even if it's just a description of the current location.
+    9. Always provide a list of JSON objects representing the updated game state.
+    10. If the player is moving to another location, always add a JSON object for {{"MOVING": "the cardinal direction"}}
+    11. If you add a location object, make sure the key is named "Location".
+    12. If the player returns to an already known location, do not add a Location object; describe only what changed with a "LOCATION_CHANGES" object.
+
+    Notes:
+    - Include only changed state values in GAME_STATE_UPDATE.
+    - Use an empty dictionary {{}} if no updates are needed.
+    - Ensure all JSON in GAME_STATE_UPDATE is valid and matches the ones in the schema.
+    - IMPORTANT: Try to write a creative narrative in the style of a fantasy novel.
+    Creatively work into the narrative:
+    1. A detailed description of the surroundings
+    3. IMPORTANT: One to four paths leading to different Locations. If a cardinal direction is available, use it, otherwise have a valid description of what's blocking it.
+    4. Zero to four items that can be found in this location
+    5. Zero or more NPCs with different races and classes that can be found in this location
+    """
+
+# Function to get the Game Master model with the static instructions cached
+def game_master_model():
+    return get_client().cached_model(GAME_MASTER_INSTRUCTIONS)
+
+# Build the dynamic part of the Game Master prompt for a player action
+def build_game_action_prompt(user_input: str, game_state: GameWorld) -> str:
+    inventory = ', '.join([item.name for item in game_state.player.inventory])
+    party_members = ', '.join([f"{member.name} ({member.class_type}, Level {member.level})" for member in game_state.player.party_members]) if game_state.player.party_members else "None"
+    active_quests = ', '.join([f"{quest.name} - {quest.description[:50]}..." for quest in game_state.player.quest_list]) if game_state.player.quest_list else "None"
+    # Visited and prefetched neighbours are already part of the world; keep the narrative consistent with them
+    neighbours = ''
+    known = known_neighbours(game_state)
+    if known:
+        neighbours = "    Already known neighbouring locations (if the player moves into one, describe it as given and do not add a Location object;\n"
+        neighbours += "    only add a LOCATION_CHANGES object if something there has changed):\n"
+        neighbours += ''.join(f"        {path.cardinal_direction}: {location.name} - {location.description}\n" for path, location in known)
+    # Bounded history: recent turns, a rolling summary and past events relevant to this scene
+    history = get_memory(game_state).context_block(
+        game_state.current_location.name,
+        [npc.name for npc in game_state.current_location.npcs]
+    )
+    prompt = f"""
+{history}
+
+    The current game state is:
+
+    Player:
+        ID: {game_state.player.id}
+        Name: {game_state.player.name}
+        Race: {game_state.player.race}
+        Class: {game_state.player.class_type}
+        Health: {game_state.player.health}
+        Mana: {game_state.player.mana}
+        Level: {game_state.player.level}
+        Experience: {game_state.player.experience}
+        Inventory: {inventory}
+        Stats:
+            Strength: {game_state.player.stats['strength']}
+            Intelligence: {game_state.player.stats['intelligence']}
+            Wisdom: {game_state.player.stats['wisdom']}
+            Charisma: {game_state.player.stats['charisma']}
+            Stealth: {game_state.player.stats['stealth']}
+            Dexterity: {game_state.player.stats['dexterity']}
+            Constitution: {game_state.player.stats['constitution']}
+        Party Members: {party_members}
+        Active Quests: {active_quests}
+    Location: {game_state.current_location.name}
+    Description: {game_state.current_location.description}
+{neighbours}
+
+    The player's action is: {user_input}
+    """
+    return prompt
+
+
+def handle_game_action(user_input: str, game_state: GameWorld) -> dict:
+    model = game_master_model()
+    prompt = build_game_action_prompt(user_input, game_state)
+    with interactive_turn(game_state):
+        response = generate_content(model, prompt, 'action')
+    response_text = response.text
+    log_llm_response(response_text)
+    response_data = parse_game_action_response(response_text)
+    record_turn(user_input, response_data, game_state)
+    return response_data
+
+# Function to parse the Game Master's response envelope, keeping the raw text if it isn't JSON
+def parse_game_action_response(response_text: str) -> dict:
+    response_data = parse_json_object(response_text, ('RESPONSE', 'GAME_STATE_UPDATE'))
+    if response_data is None:
+        return {
+            "RESPONSE": response_text,
+            "GAME_STATE_UPDATE": {}
+        }
+    return response_data
+
+# Streaming variant of handle_game_action. Iterating yields the RESPONSE
+# narrative as it is generated; the parsed response (including the buffered
+# GAME_STATE_UPDATE) is available from response_data once iteration ends.
+class GameActionStream:
+    def __init__(self, user_input: str, game_state: GameWorld):
+        self.user_input = user_input
+        self.game_state = game_state
+        self.parser = ResponseStreamParser()
+        self.response_data = None
+
+    def __iter__(self):
+        model = game_master_model()
+        prompt = build_game_action_prompt(self.user_input, self.game_state)
+        with interactive_turn(self.game_state):
+            for chunk in generate_content(model, prompt, 'action', stream=True):
+                text = self.parser.feed(chunk.text)
+                if text:
+                    yield text
+        log_llm_response(self.parser.buffer)
+        self.response_data = self.parser.result()
+        record_turn(self.user_input, self.response_data, self.game_state)
+
+
+def stream_game_action(user_input: str, game_state: GameWorld) -> GameActionStream:
+    return GameActionStream(user_input, game_state)
+
+# Function to apply a Player update from the LLM without clobbering the model's types
+def apply_player_update(player: Player, player_data: dict) -> None:
+    for attr, value in player_data.items():
+        attr = attr.lower().replace(' ', '_')
+        attr = 'class_type' if attr == 'class' else attr
+        if attr == 'id' or not hasattr(player, attr):
+            continue  # The player's ID is never changed by the LLM
+        if attr == 'stats' and isinstance(value, dict):
+            # Stats may be partial and come with capitalised names
+            player.stats.update({stat.lower(): stat_value for stat, stat_value in value.items()})
+        elif attr == 'inventory' and isinstance(value, list):
+            # Keep existing Item objects (and their IDs) for items the player still has
+            existing = {item.name.lower(): item for item in player.inventory}
+            player.inventory = [
+                existing.get(str(item_data.get('name', '')).lower()) or Item(item_data.get('name', 'Unknown'), item_data.get('description', ''))
+                for item_data in value if isinstance(item_data, dict)
+            ]
+        elif isinstance(value, (str, int, float)) and not isinstance(getattr(player, attr), (list, dict)):
+            setattr(player, attr, value)
+
+def update_game_state(response_data: dict, game_state: GameWorld, prefetch: bool = True) -> None:
+    if not response_data:
+        return
+
+    updates = response_data
+    paths_to_update = []
+    known_location = None  # Visited or prefetched location the player moved into
+    created_location = None  # Location generated by this update
+    location_changes = []
+    for update in updates:
+        if not isinstance(update, dict):
+            continue
+        if any(key.upper() == 'PLAYER' for key in update):
+            player_data = update[next(key for key in update if key.upper() == 'PLAYER')]
+            if isinstance(player_data, dict):
+                apply_player_update(game_state.player, player_data)
+
+        if any(key.upper() == 'LOCATION' for key in update):
+            location_data = update[next(key for key in update if key.upper() == 'LOCATION')]
+            if not isinstance(location_data, dict):
+                # Sometimes only the location's name is sent
+                location_data = {'name': str(location_data), 'description': game_state.current_location.description}
+            new_location = Location(
+                name=location_data.get('name') or location_data.get('NAME'),
+                description=location_data.get('description') or location_data.get('DESCRIPTION'),
+                coordinates=game_state.player.coordinates,
+            )
+            new_location.paths = [
+                Path(p.get('description') or p.get('DESCRIPTION'),
+                     None,  # Destination coordinates will be calculated later
+                     p.get('cardinal_direction') or p.get('CARDINAL_DIRECTION'))
+                for p in location_data.get('paths') or location_data.get('PATHS', [])
+            ]
+            paths_to_update.extend(new_location.paths)
+            created_location = new_location
+            new_location.items = [
+                Item(i.get('name') or i.get('NAME'),
+                     i.get('description') or i.get('DESCRIPTION'))
+                for i in location_data.get('items') or location_data.get('ITEMS', [])
+            ]
+            if not known_location:
+                game_state.current_location = new_location
+            
+        if any(key.upper() == 'MOVING' for key in update):
+            direction = update[next(key for key in update if key.upper() == 'MOVING')]
+            game_state.player.coordinates = step_coordinates(game_state.player.coordinates, direction)
+            # Revisits reuse the stored location; otherwise use the prefetched one if it's ready
+            known_location = find_known_location(game_state, game_state.player.coordinates)
+            if known_location:
+                game_state.current_location = known_location
+                paths_to_update = list(known_location.paths)
+            elif created_location:
+                # The location came before the move; it belongs where the player ends up.
+                # (The location the player left keeps its coordinates.)
+                created_location.coordinates = game_state.player.coordinates
+
+        if any(key.upper() == 'LOCATION_CHANGES' for key in update):
+            location_changes.append(update[next(key for key in update if key.upper() == 'LOCATION_CHANGES')])
+
+        if any(key.upper() == 'NPCS' for key in update):
+            npcs_data = update[next(key for key in update if key.upper() == 'NPCS')]
+            for npc_data in npcs_data:
+                new_npc = NPC(
+                    name=npc_data.get('name', 'Unknown'),
+                    description=npc_data.get('description', 'No description available.'),
+                    race=npc_data.get('race', 'Unknown'),
+                    class_type=npc_data.get('class_type', 'Unknown'),
+                    health=npc_data.get('health', 100),
+                    mana=npc_data.get('mana', 100),
+                    inventory=[Item(item['name'], item['description']) for item in npc_data.get('inventory', [])],
+                    stats=npc_data.get('stats', {}),
+                    party_potential=npc_data.get('party_potential', 0),
+                    level=npc_data.get('level', 1),
+                    experience=npc_data.get('experience', 0)
+                )
+                game_state.current_location.add_npc(new_npc)
+
+    # "What changed" deltas apply to wherever the player ended up
+    for changes in location_changes:
+        apply_location_changes(game_state.current_location, changes)
+
+    # Remember the location so revisits don't need a full generation
+    game_state.add_location(game_state.current_location)
+
+    # Calculate coordinates for paths after the loop
+    for path in paths_to_update:
+        path.destination_coordinates = step_coordinates(game_state.current_location.coordinates, path.cardinal_direction)
+
+    # Start generating the neighbouring locations while the player reads this scene
+    if location_prefetcher and prefetch:
+        location_prefetcher.schedule(game_state)
+
+# Function to describe a Location in the LLM's 'Location' format, which build_location reads back
+def location_data(location: Location) -> dict:
+    return {
+        'id': str(location.id),
+        'name': location.name,
+        'description': location.description,
+        'coordinates': list(location.coordinates),
+        'items': [{'name': item.name, 'description': item.description} for item in location.items],
+        'npcs': [{'name': npc.name, 'description': npc.description, 'race': npc.race, 'class_type': npc.class_type,
+                  'health': npc.health, 'mana': npc.mana} for npc in location.npcs],
+        'paths': [{'description': path.description, 'cardinal_direction': path.cardinal_direction,
+                   'destination_coordinates': list(path.destination_coordinates) if path.destination_coordinates else None}
+                  for path in location.paths],
+    }
+
+# Function to describe a new Player for the journal
+def player_data(player: Player) -> dict:
+    return {
+        'id': str(player.id),
+        'name': player.name,
+        'race': player.race,
+        'class_type': player.class_type,
+        'health': player.health,
+        'mana': player.mana,
+        'stats': dict(player.stats),
+        'coordinates': list(player.coordinates),
+        'level': player.level,
+        'experience': player.experience,
+        'inventory': [{'name': item.name, 'description': item.description} for item in player.inventory],
+    }
+
+# Function to rebuild a journalled Location, keeping its ID
+def journalled_location(data: dict) -> Location:
+    location = build_location(data, tuple(data['coordinates']))
+    if data.get('id'):
+        location.id = uuid.UUID(data['id'])
+    return location
+
+# Function to replay a journalled turn on a GameWorld
+def replay_turn(game_state: GameWorld, entry: dict) -> None:
+    # Locations the turn added (generated, prefetched or from the LLM) go in first, so the
+    # update finds them as known locations instead of depending on the prefetcher
+    for data in entry.get('locations', []):
+        game_state.add_location(journalled_location(data))
+    update = entry.get('update') or []
+    update_game_state(update, game_state, prefetch=False)
+    moved_to = entry.get('moved_to')
+    if moved_to:
+        # A move answered locally goes exactly where it went live: a path's destination
+        # can be anywhere, not just one step in its direction
+        coordinates = tuple(moved_to['coordinates'])
+        location = game_state.get_location(coordinates)
+        if location is None or str(location.id) != moved_to.get('location_id', str(location.id)):
+            location = next((known for known in game_state.locations.values()
+                             if str(known.id) == moved_to.get('location_id')), location)
+        game_state.player.coordinates = coordinates
+        if location is not None:
+            game_state.current_location = location
+        else:
+            logger.warning(f"Journalled move to unknown location at {coordinates}")
+    if not entry.get('local') or update or moved_to:
+        record_turn(entry.get('action', ''), {"RESPONSE": entry.get('response', '')}, game_state)
+
+# Function to rebuild a session's GameWorld from its journal (see journal). With a
+# snapshot world, only the entries after the snapshot are replayed; without one the
+# world is rebuilt from the session's first entry. Returns None if neither is available.
+# Raises ValueError if entries are missing: replaying around them would diverge from
+# the world as it was played.
+def recover_world(journal, session_id, game_state: GameWorld = None):
+    after = getattr(game_state, 'journal_seq', 0) if game_state else 0
+    expected = after + 1 if game_state is not None else None
+    for entry in journal.entries(session_id, after):
+        if expected is not None and entry['seq'] != expected:
+            raise ValueError(f"Journal of session {session_id} is missing entries {expected} to {entry['seq'] - 1}")
+        expected = entry['seq'] + 1
+        if entry.get('type') == 'start':
+            if game_state is None:
+                data = entry['player']
+                player = Player(
+                    name=data['name'],
+                    race=data['race'],
+                    class_type=data['class_type'],
+                    health=data.get('health', 100),
+                    mana=data.get('mana', 100),
+                    inventory=[Item(item['name'], item['description']) for item in data.get('inventory', [])],
+                    stats=data.get('stats'),
+                    coordinates=tuple(data.get('coordinates') or (0, 0)),
+                    level=data.get('level', 1),
+                    experience=data.get('experience', 0)
+                )
+                player.id = data['id']
+                location = journalled_location(entry['location'])
+                game_state = GameWorld(player=player, current_location=location)
+                game_state.add_location(location)
+            elif not game_state.locations:
+                # A player profile saved without a world: the world starts where the journal does
+                location = journalled_location(entry['location'])
+                game_state.add_location(location)
+                game_state.current_location = location
+        elif game_state is not None:
+            replay_turn(game_state, entry)
+        if game_state is not None:
+            game_state.journal_seq = entry['seq']
+    if game_state is not None:
+        journal.seed(session_id, getattr(game_state, 'journal_seq', 0))
+    return game_state
+
+
+# What a front end shows of the world after a turn: a copy of the current
+# location and its exits, so it can be rendered later without locking the session
+class Scene:
+    def __init__(self, session, name: str, description: str, coordinates, paths, items, npcs):
+        self.session = session
+        self.name = name
+        self.description = description
+        self.coordinates = coordinates
+        self.paths = paths  # List of (cardinal direction, description)
+        self.items = items  # Item names
+        self.npcs = npcs  # NPC names
+
+    @classmethod
+    def of(cls, session):
+        location = session.world.current_location
+        return cls(
+            session,
+            location.name,
+            location.description,
+            tuple(location.coordinates) if location.coordinates is not None else None,
+            [(path.cardinal_direction or '', path.description or '') for path in location.paths],
+            [item.name for item in location.items],
+            [npc.name for npc in location.npcs]
+        )
+
+
+# The outcome of one player action
+class TurnResult:
+    def __init__(self, action: str, text: str, scene: Scene, state_update=None, local: bool = False,
+                 moved: bool = False, player_died: bool = False):
+        self.action = action
+        self.text = text  # Narrative shown to the player
+        self.scene = scene  # Where the player is after the turn
+        self.state_update = state_update if state_update is not None else []  # GAME_STATE_UPDATE as applied
+        self.local = local  # Answered without the LLM
+        self.moved = moved  # The player is in a different location
+        self.player_died = player_died
+
+
+# One player's game. Turns of a session run one at a time.
+class Session:
+    def __init__(self, world: GameWorld, session_id=None):
+        self.id = session_id or str(world.player.id)
+        self.world = world
+        self.lock = threading.Lock()
+        self.turns = 0
+        self.ended = False  # Set when the player dies
+
+
+# Function to check a GAME_STATE_UPDATE for the player's death
+def player_died(state_update) -> bool:
+    if not isinstance(state_update, list):
+        return False
+    for update in state_update:
+        if isinstance(update, dict):
+            for key, value in update.items():
+                if key.upper() == 'PLAYER_DIED' and str(value).lower() == 'yes':
+                    return True
+    return False
+
+
+class Engine:
+    def __init__(self, local_commands: bool = True, journal=None):
+        self.local_commands = local_commands  # Answer bookkeeping commands without the LLM
+        self.journal = journal  # Optional TurnJournal every turn is appended to
+        self.sessions = {}  # Session ID -> Session
+
+    def create_player(self, name: str, race: str, class_type: str) -> Player:
+        return Player(
+            name=name,
+            race=race,
+            class_type=class_type,
+            health=100,
+            mana=100,
+            inventory=[],
+            stats=generate_stats(race, class_type),
+            coordinates=(0, 0),
+            level=1,
+            experience=0
+        )
+
+    def start(self, player: Player, session_id=None) -> Scene:
+        # Create the starting location and open a session for the player
+        starting_location = create_starting_location(player)
+        return self.resume(GameWorld(player=player, current_location=starting_location), session_id)
+
+    def resume(self, world: GameWorld, session_id=None) -> Scene:
+        # Open a session for an existing GameWorld (e.g. one loaded from the database)
+        session = Session(world, session_id)
+        world.add_location(world.current_location)
+        self.sessions[session.id] = session
+        if self.journal and not getattr(world, 'journal_seq', 0):
+            # A new world: journal where it starts so it can be rebuilt before its first save
+            world.journal_seq = self.journal.append(session.id, {
+                'type': 'start',
+                'player': player_data(world.player),
+                'location': location_data(world.current_location),
+            })
+        if location_prefetcher:
+            location_prefetcher.schedule(world)
+        return Scene.of(session)
+
+    def restore(self, session: Session, world: GameWorld) -> Scene:
+        # Swap a session's world for another one (e.g. a loaded save slot); call with session.lock held.
+        # The journal starts over from the new world, so save it in full before relying on the journal.
+        old_world = session.world
+        if location_prefetcher:
+            location_prefetcher.forget(old_world)
+        memory = getattr(old_world, 'memory', None)
+        if memory:
+            memory.shutdown()
+        world.add_location(world.current_location)
+        session.world = world
+        if self.journal:
+            world.journal_seq = self.journal.append(session.id, {
+                'type': 'start',
+                'player': player_data(world.player),
+                'location': location_data(world.current_location),
+            })
+        if location_prefetcher:
+            location_prefetcher.schedule(world)
+        return Scene.of(session)
+
+    def get_session(self, session_id):
+        return self.sessions.get(session_id)
+
+    def recover_world(self, session_id, world: GameWorld = None):
+        # Bring a loaded snapshot up to date from the journal, or rebuild the world from it
+        if not self.journal:
+            return world
+        return recover_world(self.journal, session_id, world)
+
+    def end(self, session: Session) -> None:
+        self.sessions.pop(session.id, None)
+        if location_prefetcher:
+            location_prefetcher.forget(session.world)
+        memory = getattr(session.world, 'memory', None)
+        if memory:
+            memory.shutdown()
+
+    def act(self, session: Session, text: str, game_master=None) -> TurnResult:
+        # game_master: Callable(session, text) -> TurnResult playing the LLM part of the turn
+        # somewhere else (e.g. on the turn pipeline, whose apply stage calls apply_response).
+        # It runs under the session's lock, after the local commands.
+        with session.lock:
+            result = self._act_locally(session, text)
+            if result:
+                return result
+            if game_master:
+                return game_master(session, text)
+            known = self._known_locations(session)
+            response = handle_game_action(text, session.world)
+            return self.apply_response(session, text, response, known)
+
+    def act_stream(self, session: Session, text: str) -> 'TurnStream':
+        return TurnStream(self, session, text)
+
+    def _act_locally(self, session: Session, text: str):
+        # TurnResult for a command answered from the game state, or None
+        if not self.local_commands:
+            return None
+        with session.world.state_lock:
+            location = session.world.current_location
+            coordinates = session.world.player.coordinates
+            known = self._known_locations(session)
+            local_text = command_interpreter.interpret(text, session.world)
+            if local_text is None:
+                return None
+            session.turns += 1
+            moved = session.world.current_location is not location or session.world.player.coordinates != coordinates
+            if self.journal:
+                moved_to = {'coordinates': list(session.world.player.coordinates),
+                            'location_id': str(session.world.current_location.id)} if moved else None
+                self._journal_turn(session, text, local_text, [], known, local=True, moved_to=moved_to)
+            return TurnResult(text, local_text, Scene.of(session), local=True, moved=moved)
+
+    def _known_locations(self, session: Session):
+        # Identities of the world's locations, to find the ones a turn adds (journal only)
+        if not self.journal:
+            return None
+        return {id(location) for location in session.world.locations.values()}
+
+    def _journal_turn(self, session: Session, text: str, response_text: str, state_update, known, local=False, moved_to=None):
+        new_locations = [location_data(location) for location in session.world.locations.values() if id(location) not in known]
+        entry = {
+            'type': 'turn',
+            'action': text,
+            'response': response_text,
+            'update': state_update,
+            'locations': new_locations,
+            'local': local,
+        }
+        if moved_to:
+            entry['moved_to'] = moved_to  # Where a local move went: {'coordinates', 'location_id'}
+        session.world.journal_seq = self.journal.append(session.id, entry)
+
+    def apply_response(self, session: Session, text: str, response_data: dict, known=None) -> TurnResult:
+        # Apply the Game Master's response to the session's world (the caller runs one turn
+        # of a session at a time). known: the world's locations before the turn, see _known_locations.
+        # The world's state_lock keeps a save from snapshotting a half-applied update.
+        with session.world.state_lock:
+            location = session.world.current_location
+            if known is None:
+                known = self._known_locations(session)
+            state_update = response_data.get("GAME_STATE_UPDATE", [])
+            update_game_state(state_update, session.world)
+            session.turns += 1
+            if self.journal:
+                self._journal_turn(session, text, str(response_data.get("RESPONSE", "")), state_update, known)
+            died = player_died(state_update)
+            session.ended = session.ended or died
+            return TurnResult(
+                text,
+                str(response_data.get("RESPONSE", "")).strip(),
+                Scene.of(session),
+                state_update,
+                moved=session.world.current_location is not location,
+                player_died=died
+            )
+
+    def close(self) -> None:
+        for session in list(self.sessions.values()):
+            self.end(session)
+        if location_prefetcher:
+            location_prefetcher.shutdown()
+
+
+# Streaming variant of Engine.act. Iterating yields the narrative as it is
+# generated (a local answer is yielded whole); result holds the TurnResult
+# once iteration ends.
+class TurnStream:
+    def __init__(self, engine: Engine, session: Session, text: str):
+        self.engine = engine
+        self.session = session
+        self.text = text
+        self.local = False
+        self.result = None
+
+    def __iter__(self):
+        with self.session.lock:
+            result = self.engine._act_locally(self.session, self.text)
+            if result:
+                self.local = True
+                self.result = result
+                yield result.text
+                return
+
+            known = self.engine._known_locations(self.session)
+            stream = stream_game_action(self.text, self.session.world)
+            yield from stream
+            response_data = stream.response_data
+            if not stream.parser.response_text and response_data.get("RESPONSE"):
+                # RESPONSE could not be streamed (e.g. it came after the update); send it whole
+                yield str(response_data["RESPONSE"]).strip()
+            self.result = self.engine.apply_response(self.session, self.text, response_data, known)
@@ -0,0 +1,228 @@
+import os
+import re
+import glob
+import json
+import time
+import random
+import asyncio
+import threading
+
+from the_veiled_realm.llm_client import BaseLLMClient
+
+# Offline stand-in for the Gemini client.
+#
+# FakeLLMClient has the same interface as LLMClient, so the whole engine can
+# run with no network (LLM_BACKEND=fake). Responses are either replayed from
+# a corpus of recorded responses (logs/llm_response_*.log) or synthesised
+# from the requested response schema. Latency, token streaming, failures and
+# malformed JSON can all be configured and are driven by a seeded random
+# generator, so runs are repeatable.
+#
+# Latency specs (seconds): "fixed:0.5", "uniform:0.2,1.5", "normal:0.8,0.2",
+# "lognormal:-0.5,0.4" (mu and sigma of the underlying normal).
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+
+WORDS = ('ancient moss shadow river lantern whisper stone path glade ember hollow mist oak '
+         'silver raven thorn meadow ruin spire brook cavern willow dusk amber').split()
+TOKEN_PATTERN = re.compile(r'\S+\s*|\s+')
+
+
+class FakeLLMError(Exception):
+    pass
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+def parse_latency(spec):
+    # Turn a latency spec into a function of a random.Random
+    kind, _, args = (spec or 'fixed:0').partition(':')
+    values = [float(value) for value in args.split(',') if value]
+    if kind == 'fixed':
+        return lambda rng: values[0] if values else 0.0
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def load_corpus(corpus_dir):
+    # Recorded responses grouped by the kind of call that produced them
+    corpus = {'action': [], 'location': []}
+    for log_file in sorted(glob.glob(os.path.join(corpus_dir, 'llm_response_*.log'))):
+        with open(log_file) as f:
+            text = f.read()
+        if '"RESPONSE"' in text:
+            corpus['action'].append(text)
+        elif '"Location"' in text:
+            corpus['location'].append(text)
+    return corpus
+
+
+class FakeModel:
+    def __init__(self, client, system_instruction=None):
+        self.client = client
+        self.system_instruction = system_instruction
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        text, first_token_delay, token_delay = self.client.plan_response(prompt, generation_config)
+        if not stream:
+            self.client.sleep(first_token_delay + token_delay * len(TOKEN_PATTERN.findall(text)))
+            return FakeResponse(text)
+        return self._stream(text, first_token_delay, token_delay)
+
+    def _stream(self, text, first_token_delay, token_delay):
+        self.client.sleep(first_token_delay)
+        for token in TOKEN_PATTERN.findall(text):
+            self.client.sleep(token_delay)
+            yield FakeResponse(token)
+
+    async def generate_content_async(self, prompt, generation_config=None, **kwargs):
+        text, first_token_delay, token_delay = self.client.plan_response(prompt, generation_config)
+        await asyncio.sleep((first_token_delay + token_delay * len(TOKEN_PATTERN.findall(text))) * self.client.time_scale)
+        return FakeResponse(text)
+
+    def count_tokens(self, contents):
+        return FakeTokenCount((len(str(contents)) + 3) // 4)
+
+
+class FakeLLMClient(BaseLLMClient):
+    def __init__(self, mode='replay', corpus_dir=DEFAULT_CORPUS_DIR, latency='fixed:0', tokens_per_second=0,
+                 error_rate=0.0, malformed_rate=0.0, seed=0, time_scale=1.0):
+        self.mode = mode  # 'replay' recorded responses or 'synthesize' from the response schema
+        self.corpus = load_corpus(corpus_dir) if mode == 'replay' else {'action': [], 'location': []}
+        self.latency = parse_latency(latency)  # Time to first token
+        self.token_delay = 1.0 / tokens_per_second if tokens_per_second else 0.0
+        self.error_rate = error_rate  # Share of calls that raise FakeLLMError
+        self.malformed_rate = malformed_rate  # Share of responses with damaged JSON
+        self.time_scale = time_scale  # Multiplies every delay (0 for no waiting at all)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.replay_position = {'action': 0, 'location': 0}
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv('FAKE_LLM_MODE', 'replay'),
+            corpus_dir=os.getenv('FAKE_LLM_CORPUS', DEFAULT_CORPUS_DIR),
+            latency=os.getenv('FAKE_LLM_LATENCY', 'fixed:0'),
+            tokens_per_second=float(os.getenv('FAKE_LLM_TOKENS_PER_SEC', '0')),
+            error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', '0')),
+            malformed_rate=float(os.getenv('FAKE_LLM_MALFORMED_RATE', '0')),
+            seed=int(os.getenv('FAKE_LLM_SEED', '0')),
+            time_scale=float(os.getenv('FAKE_LLM_TIME_SCALE', '1')),
+        )
+
+    def model(self, model_name=None, system_instruction=None):
+        return FakeModel(self, system_instruction)
+
+    def cached_model(self, system_instruction, model_name=None):
+        return FakeModel(self, system_instruction)
+
+    def sleep(self, seconds):
+        if seconds > 0 and self.time_scale > 0:
+            time.sleep(seconds * self.time_scale)
+
+    def plan_response(self, prompt, generation_config=None):
+        # Pick the response text and its timing; raises FakeLLMError for injected failures
+        with self.lock:
+            self.calls += 1
+            if self.rng.random() < self.error_rate:
+                raise FakeLLMError("Injected LLM failure")
+            kind = self._kind(str(prompt), generation_config)
+            if kind == 'text':
+                text = self._sentence(12, 40)
+            elif self.mode == 'replay' and self.corpus[kind]:
+                responses = self.corpus[kind]
+                text = responses[self.replay_position[kind] % len(responses)]
+                self.replay_position[kind] += 1
+            else:
+                text = json.dumps(self._synthesize_response(kind, generation_config))
+            if kind != 'text' and self.rng.random() < self.malformed_rate:
+                text = self._damage(text)
+            return text, self.latency(self.rng), self.token_delay
+
+    def _kind(self, prompt, generation_config):
+        schema = (generation_config or {}).get('response_schema') or {}
+        properties = schema.get('properties', {})
+        if 'RESPONSE' in properties or "The player's action is" in prompt:
+            return 'action'
+        if 'Location' in properties or "'Location' object" in prompt:
+            return 'location'
+        return 'text'
+
+    def _sentence(self, low, high):
+        words = [self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high))]
+        return ' '.join(words).capitalize() + '.'
+
+    def _synthesize(self, schema):
+        # A value matching a compiled response schema (see structured_output)
+        schema_type = schema.get('type', 'STRING')
+        if schema_type == 'OBJECT':
+            required = schema.get('required', [])
+            return {
+                name: self._synthesize(prop) for name, prop in schema.get('properties', {}).items()
+                if name in required or self.rng.random() < 0.5
+            }
+        if schema_type == 'ARRAY':
+            return [self._synthesize(schema.get('items', {})) for _ in range(self.rng.randint(0, 3))]
+        if schema_type in ('NUMBER', 'INTEGER'):
+            return self.rng.randint(0, 20)
+        if schema_type == 'BOOLEAN':
+            return self.rng.random() < 0.5
+        return self._sentence(1, 6)
+
+    def _synthesize_location(self, location_schema=None):
+        if location_schema:
+            location = self._synthesize(location_schema)
+        else:
+            location = {'name': self._sentence(2, 3), 'description': self._sentence(20, 50)}
+        directions = self.rng.sample(['north', 'south', 'east', 'west'], self.rng.randint(1, 4))
+        location['paths'] = [{'description': self._sentence(5, 12), 'cardinal_direction': d} for d in directions]
+        return location
+
+    def _synthesize_response(self, kind, generation_config):
+        schema = (generation_config or {}).get('response_schema') or {}
+        if kind == 'location':
+            location_schema = schema.get('properties', {}).get('Location')
+            return {'Location': self._synthesize_location(location_schema)}
+
+        updates = [{'PLAYER_DIED': 'no'}]
+        if self.rng.random() < 0.5:
+            update_schema = schema.get('properties', {}).get('GAME_STATE_UPDATE', {}).get('items', {})
+            location_schema = update_schema.get('properties', {}).get('Location')
+            updates.insert(0, {'MOVING': self.rng.choice(['north', 'south', 'east', 'west'])})
+            updates.insert(1, {'Location': self._synthesize_location(location_schema)})
+        return {
+            'RESPONSE': ' '.join(self._sentence(8, 20) for _ in range(self.rng.randint(3, 8))),
+            'GAME_STATE_UPDATE': updates,
+        }
+
+    def _damage(self, text):
+        # The defects seen in real responses (see json_repair)
+        damage = self.rng.choice(['fence', 'prose', 'trailing_comma', 'truncate'])
+        if damage == 'fence':
+            return f"```json\n{text}\n```"
+        if damage == 'prose':
+            return f"Here is the response:\n{text}\nEnjoy your adventure!"
+        if damage == 'trailing_comma':
+            return re.sub(r'(["\d\]}])(\s*[}\]])', r'\1,\2', text, count=3)
+        return text[:max(1, int(len(text) * 0.9))]
+
+    def generate(self, prompt, model_name=None, **kwargs):
+        return self.model(model_name).generate_content(prompt, **kwargs)
+
+    async def generate_async(self, prompt, model_name=None, **kwargs):
+        return await self.model(model_name).generate_content_async(prompt, **kwargs)
@@ -37,6 +37,7 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(response => response.json())
             .then(data => {
                 console.log('Player created:', data);
+                localStorage.setItem('playerId', data.playerId); // Used by main gameplay for game actions
                 window.location.href = 'main_gameplay.html'; // Redirect to game dashboard after character creation
             })
             .catch(error => {
@@ -5,6 +5,23 @@ document.addEventListener('DOMContentLoaded', function() {
     const playerInput = document.getElementById('playerInput');
     const narratorMessages = document.getElementById('narratorMessages');
 
+    // Where the API lives: the page's own server unless the page sets window.API_BASE (e.g. 'http://127.0.0.1:5000')
+    const apiBase = window.API_BASE || '';
+
+    // Parse one Server-Sent Event block ("event: ...\ndata: ...")
+    function parseEvent(block) {
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data += line.slice(5).trim();
+            }
+        });
+        return { event: event, data: data ? JSON.parse(data) : null };
+    }
+
     sendMessageButton.addEventListener('click', function() {
         const userMessage = playerInput.value;
         if (userMessage) {
@@ -12,20 +29,59 @@ document.addEventListener('DOMContentLoaded', function() {
             narratorMessages.innerHTML += `<p><strong>You:</strong> ${userMessage}</p>`;
             playerInput.value = ''; // Clear the input field
 
-            // Send the player's input to the backend for processing
-            fetch(process.env.API_ENDPOINT, {
+            // Paragraph that the streamed narrative is appended to
+            const gmMessage = document.createElement('p');
+            gmMessage.innerHTML = '<strong>Game Master:</strong> ';
+            const gmText = document.createElement('span');
+            gmMessage.appendChild(gmText);
+            narratorMessages.appendChild(gmMessage);
+
+            // Send the player's input to the backend and render the narrative as it streams in
+            fetch(`${apiBase}/api/game_action/stream`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({ action: userMessage })
+                body: JSON.stringify({ action: userMessage, playerId: localStorage.getItem('playerId') })
             })
-            .then(response => response.json())
-            .then(data => {
-                // Display the response from the game master
-                narratorMessages.innerHTML += `<p><strong>Game Master:</strong> ${data.response}</p>`;
-                // Optionally scroll to the bottom of the chat window
-                narratorMessages.scrollTop = narratorMessages.scrollHeight;
+            .then(response => {
+                if (!response.ok) {
+                    // Errors before the stream starts (e.g. an unknown player) come back as JSON
+                    return response.json().catch(() => ({})).then(body => {
+                        gmText.textContent = body.error || `The Game Master could not answer (${response.status}).`;
+                    });
+                }
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+
+                function read() {
+                    return reader.read().then(({ done, value }) => {
+                        if (done) {
+                            return;
+                        }
+                        buffer += decoder.decode(value, { stream: true });
+                        const blocks = buffer.split('\n\n');
+                        buffer = blocks.pop(); // Keep any incomplete event for the next read
+                        blocks.forEach(block => {
+                            if (!block.trim() || block.startsWith(':')) {
+                                return; // Comment lines keep the connection alive
+                            }
+                            const { event, data } = parseEvent(block);
+                            if (event === 'narrative') {
+                                gmText.textContent += data.text;
+                            } else if (event === 'state') {
+                                console.log('State update:', data.state_update, 'Timings:', data.timings);
+                            } else if (event === 'error') {
+                                gmText.textContent += (gmText.textContent ? ' ' : '') + data.error;
+                            }
+                        });
+                        // Optionally scroll to the bottom of the chat window
+                        narratorMessages.scrollTop = narratorMessages.scrollHeight;
+                        return read();
+                    });
+                }
+                return read();
             })
             .catch(error => {
                 console.error('Error processing game action:', error);
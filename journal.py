@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import threading
+
+# Append-only turn journal.
+#
+# Every turn of a session is appended as one JSON line to
+# <directory>/<session id>.jsonl: the action, the Game Master's response, the
+# GAME_STATE_UPDATE that was applied and the locations the turn added to the
+# world (with their IDs). A move answered locally records where it went
+# (moved_to), since a path can lead anywhere. A session's first entry records
+# its player and starting location.
+# Entries are numbered; a snapshot (a full save of the world) records the
+# last number it covers, and recovery replays the later entries on top of
+# it (see engine.recover_world). compact() drops the entries a snapshot
+# covers, so recovery never replays more than the turns since the last save.
+#
+# A crash can leave a half-written last line. It is ignored when reading, and
+# cut off before the session's next entry is appended, so a new entry never
+# ends up glued to the fragment. Entries are numbered without gaps; replay
+# treats a missing number as an error rather than skipping it.
+
+SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class TurnJournal:
+    def __init__(self, directory, fsync: bool = False):
+        self.directory = directory
+        self.fsync = fsync  # Flush each entry to disk before the turn returns
+        self.lock = threading.Lock()
+        self.last_seqs = {}  # Session ID -> last entry number
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, session_id):
+        return os.path.join(self.directory, SAFE_NAME.sub('_', str(session_id)) + '.jsonl')
+
+    def _open_session(self, session_id) -> int:
+        # First use of a session's file in this process: cut off a torn last line and
+        # return the last entry number. Call with self.lock held.
+        path = self.path(session_id)
+        try:
+            with open(path, 'rb+') as f:
+                end = f.seek(0, os.SEEK_END)
+                position = end
+                while position > 0:
+                    start = max(0, position - 4096)
+                    f.seek(start)
+                    block = f.read(position - start)
+                    newline = block.rfind(b'\n')
+                    if newline != -1:
+                        position = start + newline + 1
+                        break
+                    position = start
+                if position != end:
+                    f.truncate(position)
+        except FileNotFoundError:
+            pass
+        entries = self.entries(session_id)
+        return entries[-1]['seq'] if entries else 0
+
+    def append(self, session_id, entry: dict) -> int:
+        # Append an entry and return its number
+        with self.lock:
+            seq = self.last_seqs.get(session_id)
+            if seq is None:
+                seq = self._open_session(session_id)
+            seq += 1
+            line = json.dumps(dict(entry, seq=seq)) + '\n'
+            try:
+                with open(self.path(session_id), 'a', encoding='utf-8') as f:
+                    f.write(line)
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            except Exception:
+                # The line may be half written; the next append cuts it off again
+                self.last_seqs.pop(session_id, None)
+                raise
+            self.last_seqs[session_id] = seq
+            return seq
+
+    def seed(self, session_id, seq: int) -> None:
+        # Continue numbering after seq (e.g. the entry a loaded snapshot covers)
+        with self.lock:
+            last = self.last_seqs.get(session_id)
+            if last is None:
+                last = self._open_session(session_id)
+            self.last_seqs[session_id] = max(last, seq)
+
+    def entries(self, session_id, after: int = 0) -> list:
+        # Entries numbered after 'after', oldest first
+        entries = []
+        try:
+            with open(self.path(session_id), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write from a crash
+                    if entry.get('seq', 0) > after:
+                        entries.append(entry)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def compact(self, session_id, up_to: int) -> None:
+        # Drop the entries a snapshot up to entry number up_to covers
+        with self.lock:
+            remaining = self.entries(session_id, after=up_to)
+            if not remaining:
+                # Keep the number sequence going after the file is gone
+                self.last_seqs.setdefault(session_id, up_to)
+                try:
+                    os.remove(self.path(session_id))
+                except FileNotFoundError:
+                    pass
+                return
+            temp_path = self.path(session_id) + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in remaining)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path(session_id))
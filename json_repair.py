@@ -0,0 +1,186 @@
+import re
+import json
+
+# Local extraction and repair of the JSON the LLM sends back.
+#
+# The failure modes seen in logs/ are:
+#   - ```json code fences and prose before or after the object
+#   - trailing commas before } or ]
+#   - coordinates sent as {"x": 5, "y": 12}, "1,-1" or "23N, 47E"
+#     instead of [x, y]
+# Everything here is plain string scanning, so a malformed response can be
+# fixed in well under a millisecond instead of paying for a retry prompt.
+
+COORDINATE_KEYS = ('coordinates', 'destination_coordinates')
+
+TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+COORDINATE_PART = re.compile(r'(-?\d+(?:\.\d+)?)\s*([NSEWnsew]?)')
+
+
+def find_objects(text):
+    # Return the substrings of every balanced top-level {...} in text
+    objects = []
+    stack = []  # Closing characters for the brackets open in the current object
+    start = None
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            # Strings only matter inside an object; quotes in prose are ignored
+            in_string = bool(stack)
+        elif char == '{':
+            if not stack:
+                start = index
+            stack.append('}')
+        elif char == '[' and stack:
+            stack.append(']')
+        elif char in '}]' and stack:
+            stack.pop()
+            if not stack:
+                objects.append(text[start:index + 1])
+    if stack:
+        # Unterminated object (e.g. a cut-off response); close what is still
+        # open, innermost first, and let repair try
+        objects.append(text[start:] + ('"' if in_string else '') + ''.join(reversed(stack)))
+    return objects
+
+
+def _outside_strings(text, fix):
+    # Apply fix() to the parts of text that are not inside JSON strings
+    parts = []
+    last = 0
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+                parts.append(text[last:index + 1])
+                last = index + 1
+        elif char == '"':
+            parts.append(fix(text[last:index]))
+            last = index
+            in_string = True
+    parts.append(text[last:] if in_string else fix(text[last:]))
+    return ''.join(parts)
+
+
+def _escape_control_characters(text):
+    # Raw newlines/tabs inside strings are invalid JSON; escape them
+    result = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char == '\n':
+                char = '\\n'
+            elif char == '\r':
+                char = '\\r'
+            elif char == '\t':
+                char = '\\t'
+        elif char == '"':
+            in_string = True
+        result.append(char)
+    return ''.join(result)
+
+
+def repair_text(text):
+    # Fix syntax defects in a single JSON object string
+    text = _outside_strings(text, lambda part: TRAILING_COMMA.sub(r'\1', part))
+    return _escape_control_characters(text)
+
+
+def _parse_coordinate(value):
+    if isinstance(value, dict):
+        x = value.get('x', value.get('X'))
+        y = value.get('y', value.get('Y'))
+        if x is not None and y is not None:
+            return [x, y]
+        return value
+    if isinstance(value, str):
+        parts = COORDINATE_PART.findall(value)
+        if len(parts) != 2:
+            return value
+        coordinates = []
+        for number, compass in parts:
+            number = float(number)
+            number = int(number) if number.is_integer() else number
+            if compass.upper() in ('S', 'W'):
+                number = -number
+            coordinates.append(number)
+        # "23N, 47E" style values are given latitude-first; put x (east/west) first
+        if parts[0][1].upper() in ('N', 'S') and parts[1][1].upper() in ('E', 'W'):
+            coordinates.reverse()
+        return coordinates
+    return value
+
+
+def normalize(data):
+    # Convert every coordinates/destination_coordinates value to [x, y]
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key.lower() in COORDINATE_KEYS:
+                data[key] = _parse_coordinate(value)
+            else:
+                normalize(value)
+    elif isinstance(data, list):
+        for value in data:
+            normalize(value)
+    return data
+
+
+def parse_objects(text):
+    # Parse every top-level object in text, repairing them where needed
+    parsed = []
+    for candidate in find_objects(text):
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            try:
+                data = json.loads(repair_text(candidate))
+            except json.JSONDecodeError:
+                continue
+        if isinstance(data, dict):
+            parsed.append(normalize(data))
+    return parsed
+
+
+def parse_json_object(text, expected_keys=()):
+    # Return the object in text that has one of expected_keys (or the first one), or None
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return normalize(data)
+    except json.JSONDecodeError:
+        pass
+
+    objects = parse_objects(text)
+    if not objects:
+        return None
+    for data in objects:
+        if any(key in data for key in expected_keys):
+            # Envelopes occasionally arrive split over several objects; fold the rest in
+            for other in objects:
+                if other is not data:
+                    for key, value in other.items():
+                        data.setdefault(key, value)
+            return data
+    return objects[0]
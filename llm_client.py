@@ -0,0 +1,167 @@
+import os
+import time
+import logging
+import datetime
+import threading
+
+try:
+    import google.generativeai as genai
+except ImportError:  # Only the offline fake backend works without the SDK
+    genai = None
+
+try:
+    from google.api_core.exceptions import InvalidArgument
+except ImportError:
+    InvalidArgument = None
+
+# Process-wide Gemini client.
+#
+# genai.configure() and GenerativeModel construction happen once per process
+# (per model name / system instruction), so every turn reuses the same
+# underlying connection instead of building a client and redoing the TLS
+# handshake. GenerativeModel holds no per-call state, so one instance can be
+# shared by every Flask thread; async calls go through the SDK's own asyncio
+# client.
+#
+# Long static prompt preambles can be stored provider-side with
+# cached_model(): the preamble is uploaded once as cached content and each
+# call only sends the dynamic part. When the provider refuses (the preamble is
+# below the minimum cacheable size, or the model doesn't support caching) the
+# preamble becomes the model's system instruction instead, from then on. Other
+# errors (rate limits, timeouts) only fall back for that call. A cache is created
+# under a lock of its own, so only callers wanting that same preamble wait on
+# the upload.
+#
+# The backend is pluggable: LLM_BACKEND=fake swaps in fake_llm.FakeLLMClient,
+# which replays recorded responses offline with the same interface.
+
+logger = logging.getLogger(__name__)
+
+# How long cached contexts live on the provider; they are recreated when they expire
+CONTEXT_CACHE_TTL = datetime.timedelta(minutes=int(os.getenv('CONTEXT_CACHE_TTL_MINUTES', '60')))
+# Caches are recreated this long before they expire, so a call never lands on an expired one;
+# a tenth of short TTLs, so the cache still lives most of its TTL
+CONTEXT_CACHE_MARGIN = min(60.0, CONTEXT_CACHE_TTL.total_seconds() / 10)
+
+
+# Function to tell whether the provider refused to cache a preamble for good: the model doesn't
+# support caching, or the preamble is below the minimum cacheable size
+def caching_refused(error) -> bool:
+    if InvalidArgument is not None and isinstance(error, InvalidArgument):
+        return True
+    return 'too small' in str(error).lower()
+
+class BaseLLMClient:
+    # Interface shared by every LLM backend
+
+    def model(self, model_name: str = None, system_instruction: str = None):
+        # An object with generate_content(prompt, generation_config=None, stream=False),
+        # generate_content_async(...) and count_tokens(...)
+        raise NotImplementedError
+
+    def cached_model(self, system_instruction: str, model_name: str = None):
+        raise NotImplementedError
+
+    def generate(self, prompt, model_name: str = None, **kwargs):
+        raise NotImplementedError
+
+    async def generate_async(self, prompt, model_name: str = None, **kwargs):
+        raise NotImplementedError
+
+
+class LLMClient(BaseLLMClient):
+    def __init__(self, api_key: str = None, model_name: str = None):
+        self.api_key = api_key or os.getenv('GEMINI_API_KEY')
+        self.model_name = model_name or os.getenv('GEMINI_MODEL_NAME')
+        self.lock = threading.Lock()
+        self.models = {}  # (model_name, system_instruction) -> GenerativeModel
+        self.cached_models = {}  # (model_name, system_instruction) -> (GenerativeModel, expiry time)
+        self.cache_locks = {}  # (model_name, system_instruction) -> Lock held while its cache is created
+        self.caching_unsupported = set()  # Model names where context caching failed
+        genai.configure(api_key=self.api_key)
+
+    def model(self, model_name: str = None, system_instruction: str = None):
+        # Get the shared GenerativeModel, building it on first use
+        key = (model_name or self.model_name, system_instruction)
+        model = self.models.get(key)
+        if model is None:
+            with self.lock:
+                model = self.models.get(key)
+                if model is None:
+                    model = genai.GenerativeModel(key[0], system_instruction=system_instruction)
+                    self.models[key] = model
+        return model
+
+    def cached_model(self, system_instruction: str, model_name: str = None):
+        # Get a model whose static system_instruction is held in a provider-side context cache
+        model_name = model_name or self.model_name
+        if model_name in self.caching_unsupported:
+            return self.model(model_name, system_instruction)
+
+        key = (model_name, system_instruction)
+        with self.lock:
+            entry = self.cached_models.get(key)
+            if entry and entry[1] > time.monotonic():
+                return entry[0]
+            cache_lock = self.cache_locks.setdefault(key, threading.Lock())
+
+        # Creating the cache is a network call: only callers of this key wait for it
+        with cache_lock:
+            with self.lock:
+                entry = self.cached_models.get(key)
+                if entry and entry[1] > time.monotonic():
+                    return entry[0]  # Created while we waited
+                unsupported = model_name in self.caching_unsupported
+            if not unsupported:
+                try:
+                    cached_content = genai.caching.CachedContent.create(
+                        model=model_name,
+                        system_instruction=system_instruction,
+                        ttl=CONTEXT_CACHE_TTL,
+                    )
+                    model = genai.GenerativeModel.from_cached_content(cached_content)
+                except Exception as e:
+                    if caching_refused(e):
+                        logger.warning(f"Context caching unavailable for {model_name}, using a system instruction instead: {e}")
+                        with self.lock:
+                            self.caching_unsupported.add(model_name)
+                    else:
+                        # Transient (rate limit, timeout, network): try caching again on the next call
+                        logger.warning(f"Could not create a context cache for {model_name}, using a system instruction for this call: {e}")
+                else:
+                    expires_at = time.monotonic() + CONTEXT_CACHE_TTL.total_seconds() - CONTEXT_CACHE_MARGIN
+                    with self.lock:
+                        self.cached_models[key] = (model, expires_at)
+                    return model
+        return self.model(model_name, system_instruction)
+
+    def generate(self, prompt, model_name: str = None, **kwargs):
+        return self.model(model_name).generate_content(prompt, **kwargs)
+
+    async def generate_async(self, prompt, model_name: str = None, **kwargs):
+        return await self.model(model_name).generate_content_async(prompt, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> BaseLLMClient:
+    # Get the process-wide client for the configured backend, creating it on first use
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if os.getenv('LLM_BACKEND', 'gemini') == 'fake':
+                    from the_veiled_realm.fake_llm import FakeLLMClient
+                    _client = FakeLLMClient.from_env()
+                else:
+                    _client = LLMClient()
+    return _client
+
+
+def set_client(client: BaseLLMClient) -> None:
+    # Replace the process-wide client (e.g. with a FakeLLMClient for benchmarks)
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,164 @@
+import os
+import re
+import logging
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded conversation memory for the Game Master prompt.
+#
+# The prompt gets three pieces of history, each with a fixed size limit, so
+# its length stays flat however long a session runs:
+#   - the last recent_turns turns, verbatim (clipped to turn_chars each)
+#   - a rolling summary of everything older (at most summary_chars), which
+#     is refreshed in the background every summary_every evicted turns
+#   - up to max_events short notes on earlier turns that took place in the
+#     current location or involved NPCs who are present now
+# The event index keeps at most events_per_key notes for at most max_keys
+# locations/NPCs, so memory use is bounded too.
+#
+# Summary refreshes of every session's memory run on one shared pool of
+# SUMMARY_WORKERS threads (set MEMORY_SUMMARY_WORKERS), so the number of
+# threads doesn't grow with the number of sessions. A memory has at most one
+# refresh queued or running at a time, which also bounds the pool's queue.
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+SUMMARY_WORKERS = int(os.getenv('MEMORY_SUMMARY_WORKERS', '2'))
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix='memory')
+
+
+class Turn:
+    def __init__(self, number, action, response, location, npcs):
+        self.number = number
+        self.action = action
+        self.response = response
+        self.location = location  # Location name when the turn was played
+        self.npcs = npcs  # Names of the NPCs present
+
+    def gist(self, max_chars=160):
+        # First sentence of the response, used for summaries and event notes
+        first_sentence = SENTENCE_END.split(self.response.strip(), 1)[0]
+        return _clip(f"{self.action} -> {first_sentence}", max_chars)
+
+
+def _clip(text, max_chars):
+    text = ' '.join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 3] + '...'
+
+
+class ConversationMemory:
+    def __init__(self, summarize=None, recent_turns=4, turn_chars=600, summary_every=8, summary_chars=1200,
+                 max_events=3, events_per_key=10, max_keys=200, executor=None):
+        self.summarize = summarize  # Callable(summary, [Turn]) -> str; None keeps an extractive summary
+        self.recent = deque(maxlen=recent_turns)
+        self.turn_chars = turn_chars
+        self.summary_every = summary_every
+        self.summary_chars = summary_chars
+        self.max_events = max_events
+        self.events_per_key = events_per_key
+        self.max_keys = max_keys
+        self.summary = ''
+        self.pending = []  # Evicted turns not yet folded into the summary
+        self.events = OrderedDict()  # Lower-cased location/NPC name -> deque of (turn number, note)
+        self.turn_count = 0
+        self.lock = threading.Lock()
+        self.refreshed = threading.Condition(self.lock)
+        self.refreshing = False
+        self.closed = False
+        self.executor = executor or summary_executor
+
+    def record_turn(self, action, response, location=None, npcs=()):
+        with self.lock:
+            self.turn_count += 1
+            turn = Turn(self.turn_count, action, _clip(response or '', self.turn_chars), location, list(npcs))
+            if len(self.recent) == self.recent.maxlen:
+                evicted = self.recent[0]
+                self.pending.append(evicted)
+                self._index(evicted)
+            self.recent.append(turn)
+            self._maybe_refresh()
+
+    def _maybe_refresh(self):
+        # Start a summary refresh if enough turns are pending; call with self.lock held
+        if len(self.pending) >= self.summary_every and not self.refreshing and not self.closed:
+            self.refreshing = True
+            batch, self.pending = self.pending, []
+            self.executor.submit(self._refresh_summary, batch)
+
+    def _index(self, turn):
+        note = turn.gist()
+        for key in [turn.location] + turn.npcs:
+            if not key:
+                continue
+            key = key.lower()
+            notes = self.events.pop(key, None) or deque(maxlen=self.events_per_key)
+            notes.append((turn.number, note))
+            self.events[key] = notes  # Most recently used keys live at the end
+            if len(self.events) > self.max_keys:
+                self.events.popitem(last=False)
+
+    def _refresh_summary(self, batch):
+        with self.lock:
+            summary = self.summary
+        try:
+            if self.summarize:
+                summary = self.summarize(summary, batch)
+            else:
+                summary = self._extractive_summary(summary, batch)
+        except Exception as e:
+            logger.warning(f"Error summarising conversation, keeping an extractive summary: {e}")
+            summary = self._extractive_summary(summary, batch)
+        with self.lock:
+            # Keep the newest part if the summary outgrew its limit
+            summary = ' '.join((summary or '').split())
+            self.summary = summary if len(summary) <= self.summary_chars else '...' + summary[-(self.summary_chars - 3):]
+            self.refreshing = False
+            self._maybe_refresh()
+            self.refreshed.notify_all()
+
+    def _extractive_summary(self, summary, batch):
+        return ' '.join([summary] + [turn.gist() for turn in batch]).strip()
+
+    def relevant_events(self, location=None, npcs=()):
+        # Notes on older turns about the current location or NPCs, newest first
+        with self.lock:
+            recent_numbers = {turn.number for turn in self.recent}
+            found = {}
+            for key in [location] + list(npcs):
+                if key and key.lower() in self.events:
+                    for number, note in self.events[key.lower()]:
+                        if number not in recent_numbers:
+                            found[number] = note
+        return [found[number] for number in sorted(found, reverse=True)[:self.max_events]]
+
+    def context_block(self, location=None, npcs=()) -> str:
+        # The history section of the Game Master prompt
+        events = self.relevant_events(location, npcs)
+        with self.lock:
+            summary = self.summary
+            recent = list(self.recent)
+        lines = []
+        if summary:
+            lines.append(f"    Story so far: {summary}")
+        if events:
+            lines.append("    Earlier events here or with these characters:")
+            lines.extend(f"        - {note}" for note in events)
+        if recent:
+            lines.append("    Most recent turns:")
+            for turn in recent:
+                lines.append(f"        Player: {turn.action}")
+                lines.append(f"        Game Master: {turn.response}")
+        return '\n'.join(lines)
+
+    def wait_for_refresh(self):
+        # Block until any background summary refresh has finished (used by benchmarks)
+        with self.refreshed:
+            self.refreshed.wait_for(lambda: not self.refreshing)
+
+    def shutdown(self):
+        # The pool is shared; just stop starting refreshes for this memory
+        with self.lock:
+            self.closed = True
@@ -0,0 +1,350 @@
+from flask_pymongo import PyMongo
+import uuid
+import itertools
+import threading
+from datetime import datetime
+from typing import List, Dict, Tuple
+
+# Initialize the database
+# This will be imported in app.py
+
+mongo = PyMongo()
+
+EXP_FACTOR = 100  # Base experience factor for leveling up
+
+# Change tracking: saved models record which attributes were set or mutated
+# since they were last saved, so saves can write only what changed. Lists and
+# dicts assigned to a tracked attribute are wrapped so that in-place changes
+# (append, remove, item assignment, update, ...) count as well. A newly
+# created object starts with every attribute dirty.
+
+class TrackedList(list):
+    def __init__(self, owner, field, items=()):
+        super().__init__(items)
+        self._owner = owner
+        self._field = field
+
+    def _changed(self):
+        self._owner.mark_dirty(self._field)
+
+    def append(self, item):
+        super().append(item)
+        self._changed()
+
+    def extend(self, items):
+        super().extend(items)
+        self._changed()
+
+    def insert(self, index, item):
+        super().insert(index, item)
+        self._changed()
+
+    def remove(self, item):
+        super().remove(item)
+        self._changed()
+
+    def pop(self, index=-1):
+        item = super().pop(index)
+        self._changed()
+        return item
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._changed()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._changed()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._changed()
+
+    def __iadd__(self, items):
+        super().__iadd__(items)
+        self._changed()
+        return self
+
+class TrackedDict(dict):
+    def __init__(self, owner, field, items=()):
+        super().__init__(items)
+        self._owner = owner
+        self._field = field
+
+    def _changed(self):
+        self._owner.mark_dirty(self._field)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._changed()
+        return super().setdefault(key, default)
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+# Revision numbers taken by changed objects, so a change can be compared with a point in time (see versions)
+_revisions = itertools.count(1)
+
+class Tracked:
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+            return
+        # Wrap containers, including tracked ones that belong to another attribute or object
+        if isinstance(value, list) and not (isinstance(value, TrackedList) and value._owner is self and value._field == name):
+            value = TrackedList(self, name, value)
+        elif isinstance(value, dict) and not (isinstance(value, TrackedDict) and value._owner is self and value._field == name):
+            value = TrackedDict(self, name, value)
+        object.__setattr__(self, name, value)
+        self.mark_dirty(name)
+
+    def mark_dirty(self, field):
+        self.__dict__.setdefault('_dirty', set()).add(field)
+        self.__dict__['_revision'] = next(_revisions)
+
+    @staticmethod
+    def next_revision():
+        return next(_revisions)
+
+    def is_dirty(self):
+        return bool(self.__dict__.get('_dirty'))
+
+    def take_dirty(self):
+        # Return the changed attribute names and start tracking afresh
+        dirty = self.__dict__.get('_dirty') or set()
+        self._dirty = set()
+        return dirty
+
+    def restore_dirty(self, fields):
+        # Put back changes taken by a save that failed
+        self.__dict__.setdefault('_dirty', set()).update(fields)
+
+    def mark_clean(self):
+        self._dirty = set()
+
+class Item(Tracked):
+    def __init__(self, name, description):
+        self.id = uuid.uuid4()  # Generate a unique ID
+        self.name = name
+        self.description = description
+
+class Path(Tracked):
+    def __init__(self, description: str, destination_coordinates: Tuple[int, int], cardinal_direction: str):
+        self.id = uuid.uuid4()  # Unique identifier
+        self.description = description  # A brief description of the path
+        self.destination_coordinates: Tuple[int, int] = destination_coordinates  # Tuple for destination coordinates
+        self.cardinal_direction = cardinal_direction  # Cardinal direction (north, south, east, west)
+
+class NPC(Tracked):
+    def __init__(self, name: str, description: str, race: str, class_type: str, health: int = 100, mana: int = 100, inventory: List[Item] = None, stats: Dict[str, int] = None, coordinates: Tuple[int, int] = (0, 0), party_potential: int = 0, level: int = 1, experience: int = 0):
+        self.id: uuid.UUID = uuid.uuid4()  # Unique identifier
+        self.name: str = name
+        self.description: str = description
+        self.race: str = race
+        self.class_type: str = class_type
+        self.health: int = health
+        self.mana: int = mana
+        self.inventory: List[Item] = inventory if inventory is not None else []
+        self.stats: Dict[str, int] = stats if stats is not None else {
+            'strength': 10,
+            'intelligence': 10,
+            'wisdom': 10,
+            'charisma': 10,
+            'stealth': 10,
+            'dexterity': 10,
+            'constitution': 10
+        }
+        self.coordinates: Tuple[int, int] = coordinates  # NPC's current coordinates in the GameWorld
+        self.party_potential: int = party_potential  # Chance to join the player's party
+        self.level: int = level  # NPC's level
+        self.experience: int = experience  # NPC's current experience points
+
+    def experience_to_next_level(self):
+        return EXP_FACTOR * self.level  # Experience required for the next level
+
+class Location(Tracked):
+    def __init__(self, name: str, description: str, coordinates: Tuple[int, int] = (0, 0), items: List[Item] = None, npcs: List[NPC] = None, paths: List[Path] = None):
+        self.id: uuid.UUID = uuid.uuid4()
+        self.name: str = name
+        self.description: str = description
+        self.coordinates: Tuple[int, int] = coordinates
+        self.items: List[Item] = items if items is not None else []
+        self.npcs: List[NPC] = npcs if npcs is not None else []
+        self.paths: List[Path] = paths if paths is not None else []
+
+    def add_item(self, item):
+        self.items.append(item)
+
+    def add_npc(self, npc):
+        self.npcs.append(npc)
+
+    def add_path(self, path: Path):
+        self.paths.append(path)  # Method to add a Path object
+
+    def del_item(self, item):
+        if item in self.items:
+            self.items.remove(item)
+
+class QuestCriteria(Tracked):
+    def __init__(self, description):
+        self.id = uuid.uuid4()  # Unique identifier
+        self.description = description  # Description of the objective
+        self.completed = False  # Quest completion status
+
+class Quest(Tracked):
+    def __init__(self, name, description, criteria):
+        self.id = uuid.uuid4()  # Unique identifier
+        self.name = name
+        self.description = description
+        self.criteria = criteria  # List of QuestCriteria objects
+        self.completed = False  # Quest completion status
+
+class Player(Tracked):
+    def __init__(self, name, race, class_type, health=100, mana=100, inventory=None, stats=None, coordinates=(0, 0), level=1, experience=0):
+        self.id = uuid.uuid4()  # Unique identifier
+        self.name = name
+        self.race = race
+        self.class_type = class_type
+        self.health = health
+        self.mana = mana
+        self.inventory = inventory if inventory is not None else []  # List of Item objects
+        self.stats = stats if stats is not None else {
+            'strength': 10,
+            'intelligence': 10,
+            'wisdom': 10,
+            'charisma': 10,
+            'stealth': 10,
+            'dexterity': 10,
+            'constitution': 10
+        }
+        self.coordinates = coordinates  # Player's current coordinates in the GameWorld
+        self.level = level  # Player's level
+        self.experience = experience  # Player's current experience points
+        self.party_members = []  # List of NPC objects in the player's party
+        self.quest_list = []  # List of Quest objects for the player
+
+    def max_party_members(self):
+        return (self.level // 10) + 1  # Maximum party members based on player's level
+
+    def experience_to_next_level(self):
+        return EXP_FACTOR * self.level  # Experience required for the next level
+
+class GameWorld:
+    def __init__(self, player, current_location=None):
+        self.id = uuid.uuid4()  # Unique identifier
+        self.player = player  # Player object
+        self.current_location = current_location  # Current location object
+        self.locations = {}  # Dictionary to hold locations by coordinates
+        # Held while a turn changes the world and while a save takes its snapshot (see persistence)
+        self.state_lock = threading.RLock()
+        self.version = None  # Latest WorldVersion captured from this world (see versions)
+
+    def add_location(self, location):
+        self.locations[location.coordinates] = location
+
+    def get_location(self, coordinates):
+        return self.locations.get(coordinates, None)  # Returns None if location not found
+
+    def dirty_count(self):
+        # Number of saved objects (player, locations, NPCs and what they hold) changed since the last save
+        count = 0
+        for location in self.locations.values():
+            count += location.is_dirty() + sum(item.is_dirty() for item in location.items) + sum(path.is_dirty() for path in location.paths)
+            count += sum(npc.is_dirty() + sum(item.is_dirty() for item in npc.inventory) for npc in location.npcs)
+        count += self.player.is_dirty() + sum(item.is_dirty() for item in self.player.inventory)
+        count += sum(quest.is_dirty() + sum(criteria.is_dirty() for criteria in quest.criteria) for quest in self.player.quest_list)
+        return count
+
+class GameSave:
+    def __init__(self, manifest, save_name, user_id):
+        self.id = uuid.uuid4()  # Generate a unique ID
+        # Hash of the slot's manifest in the content store (see content_store.ContentStore.create_save);
+        # the slot shares unchanged documents and text with every other save
+        self.manifest = manifest
+        self.save_name = save_name
+        self.user_id = user_id  # Link to the user
+        self.timestamp = datetime.now()  # Save time
+
+class GameSaves:
+    def __init__(self):
+        self.id = uuid.uuid4()  # Unique identifier
+        self.saves = []  # List of GameSave objects
+
+    def add_save(self, game_save):
+        self.saves.append(game_save)
+
+    def del_save(self, game_save):
+        if game_save in self.saves:
+            self.saves.remove(game_save)
+
+    def get_saves_by_user(self, user_id):
+        return [save for save in self.saves if save.user_id == user_id]
+
+class Races:
+    VALID_RACES = [
+        ("Human", "Versatile and adaptable, with a wide range of skills and cultures"),
+        ("Elf", "Graceful and long-lived, with keen senses and a deep connection to nature"),
+        ("Dwarf", "Sturdy and skilled craftsmen, known for their resilience and expertise in mining"),
+        ("Halfling", "Small and nimble, with a cheerful disposition and surprising resourcefulness"),
+        ("Orc", "Strong and fierce warriors, with a proud tribal culture and indomitable spirit"),
+        ("Goblin", "Cunning and mischievous, with a knack for tinkering and causing chaos"),
+        ("Faun", "Nature-loving and musical, with goat-like features and a carefree attitude"),
+    ]
+
+    @classmethod
+    def is_valid_race(cls, race):
+        return race in cls.VALID_RACES
+
+    @classmethod
+    def list_races(cls):
+        return cls.VALID_RACES
+
+class CharacterClasses:
+    VALID_CLASSES = [
+        ("Warrior", "Strong melee fighters skilled in combat and defense"),
+        ("Mage", "Spellcasters who harness arcane energies to cast powerful spells"),
+        ("Rogue", "Stealthy and agile characters specializing in subterfuge and precision strikes"),
+        ("Cleric", "Divine spellcasters who heal allies and smite foes with holy power"),
+        ("Ranger", "Skilled archers and trackers with a deep connection to nature"),
+        ("Paladin", "Holy warriors who combine martial prowess with divine magic"),
+        ("Bard", "Versatile performers who use music and magic to inspire allies and confound enemies"),
+    ]
+
+    @classmethod
+    def is_valid_class(cls, character_class):
+        return any(character_class == c[0] for c in cls.VALID_CLASSES)
+
+    @classmethod
+    def list_classes(cls):
+        return cls.VALID_CLASSES
@@ -0,0 +1,174 @@
+import weakref
+import logging
+import threading
+import contextlib
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError, TimeoutError
+
+# Speculative prefetching of neighbouring locations.
+#
+# While the player reads the current scene, the destination of every
+# unvisited Path is generated on a small thread pool. When the player moves
+# along one of those paths the finished Location is handed over straight away
+# instead of waiting on another LLM round trip.
+#
+# One prefetcher serves every session: its thread pool is shared, but the
+# prefetches belong to the GameWorld they were scheduled for, so a location
+# generated for one player is never handed to another. A world's prefetches
+# are dropped with forget() when its session ends, or when the world is
+# garbage collected.
+#
+# Budget policy:
+#   - max_workers bounds how many prefetch LLM calls run at once, for all worlds
+#   - max_in_flight bounds how many prefetches a world can have queued or running
+#   - session_budget caps the number of prefetch calls made for each world
+#   - while a world's interactive turn is waiting on the LLM, no new prefetch
+#     starts for that world: its due prefetches are set aside and queued again
+#     when the turn ends, so no pool thread waits and other worlds carry on
+# Prefetches for paths that are no longer reachable from the current location
+# are cancelled (or their results discarded if they already started).
+
+logger = logging.getLogger(__name__)
+
+class _WorldPrefetches:
+    def __init__(self):
+        self.futures = {}  # Destination coordinates -> Future
+        self.paths = {}  # Destination coordinates -> Path being prefetched
+        self.calls_made = 0  # Prefetch LLM calls started for this world
+        self.interactive_turns = 0  # The world's turns currently waiting on the LLM
+        self.deferred = []  # Prefetch arguments set aside until the world's turn ends
+
+
+class LocationPrefetcher:
+    def __init__(self, generate_location, max_workers: int = 2, max_in_flight: int = 4, session_budget: int = 100):
+        self.generate_location = generate_location  # Callable(player, from_location, path) -> Location or None
+        self.max_in_flight = max_in_flight
+        self.session_budget = session_budget
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.lock = threading.Lock()
+        self.worlds = weakref.WeakKeyDictionary()  # GameWorld -> _WorldPrefetches
+        self.closed = False
+
+    def schedule(self, game_state):
+        # Queue prefetches for the unvisited destinations of the current location
+        location = game_state.current_location
+        wanted = {}
+        for path in location.paths:
+            if path.destination_coordinates is None:
+                continue
+            coordinates = tuple(path.destination_coordinates)
+            if game_state.get_location(coordinates) is not None:
+                continue  # Already visited, nothing to generate
+            wanted[coordinates] = path
+
+        with self.lock:
+            if self.closed:
+                return
+            state = self.worlds.get(game_state)
+            if state is None:
+                state = self.worlds[game_state] = _WorldPrefetches()
+            # Cancel work for paths that are no longer reachable
+            for coordinates in list(state.futures):
+                if coordinates not in wanted:
+                    state.futures.pop(coordinates).cancel()
+                    state.paths.pop(coordinates, None)
+
+            in_flight = sum(1 for future in state.futures.values() if not future.done())
+            for coordinates, path in wanted.items():
+                if coordinates in state.futures:
+                    continue
+                if in_flight >= self.max_in_flight:
+                    break
+                state.paths[coordinates] = path
+                future = state.futures[coordinates] = Future()
+                self.executor.submit(self._prefetch, state, coordinates, future, game_state.player, location, path)
+                in_flight += 1
+
+    def _prefetch(self, state, coordinates, future, player, from_location, path):
+        with self.lock:
+            if state.interactive_turns and not self.closed:
+                # Never compete with the player's own turn; queued again when it ends
+                state.deferred.append((coordinates, future, player, from_location, path))
+                return
+            if not future.set_running_or_notify_cancel():
+                return  # Cancelled while queued
+            if self.closed or state.paths.get(coordinates) is not path or state.calls_made >= self.session_budget:
+                future.set_result(None)
+                return
+            state.calls_made += 1
+        try:
+            future.set_result(self.generate_location(player, from_location, path))
+        except Exception as e:
+            future.set_exception(e)
+
+    def take(self, game_state, coordinates, timeout: float = 0.0):
+        # Hand over the location prefetched for game_state at coordinates, or None if it isn't ready
+        coordinates = tuple(coordinates)
+        with self.lock:
+            state = self.worlds.get(game_state)
+            future = state.futures.get(coordinates) if state else None
+        if future is None:
+            return None
+        try:
+            location = future.result(timeout=timeout)
+        except (TimeoutError, CancelledError):
+            return None
+        except Exception as e:
+            logger.warning(f"Error prefetching location at {coordinates}: {e}")
+            location = None
+        with self.lock:
+            if state.futures.get(coordinates) is future:
+                del state.futures[coordinates]
+                state.paths.pop(coordinates, None)
+        return location
+
+    def ready_locations(self, game_state):
+        # (path, location) pairs for game_state's prefetches that have already finished
+        ready = []
+        with self.lock:
+            state = self.worlds.get(game_state)
+            if state is None:
+                return ready
+            items = [(state.paths.get(coordinates), future) for coordinates, future in state.futures.items()]
+        for path, future in items:
+            if path is None or not future.done() or future.cancelled() or future.exception():
+                continue
+            location = future.result()
+            if location is not None:
+                ready.append((path, location))
+        return ready
+
+    @contextlib.contextmanager
+    def interactive_turn(self, game_state):
+        # Pause new prefetches for game_state for the duration of its interactive LLM call
+        with self.lock:
+            state = self.worlds.get(game_state)
+            if state is None:
+                state = self.worlds[game_state] = _WorldPrefetches()
+            state.interactive_turns += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                state.interactive_turns -= 1
+                deferred = []
+                if not state.interactive_turns and not self.closed:
+                    deferred, state.deferred = state.deferred, []
+                for args in deferred:
+                    self.executor.submit(self._prefetch, state, *args)
+
+    def forget(self, game_state):
+        # Cancel and drop a world's prefetches (e.g. when its session ends)
+        with self.lock:
+            state = self.worlds.pop(game_state, None)
+            if state is not None:
+                for future in state.futures.values():
+                    future.cancel()
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            for state in self.worlds.values():
+                for future in state.futures.values():
+                    future.cancel()
+            self.worlds.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,61 @@
+# Front-end renderers for the headless engine.
+#
+# The engine returns Scenes and TurnResults; a renderer decides how they are
+# shown. TextRenderer produces the console text the CLI prints and
+# JsonRenderer produces the dicts the Flask API sends. Another front end only
+# needs an object with the same scene/turn methods.
+
+
+class TextRenderer:
+    def welcome(self, scene) -> str:
+        player = scene.session.world.player
+        return (f"Welcome, {player.name}, to The Veiled Realm! Type 'exit' to quit.\n"
+                f"\nYou find yourself in {scene.name}.\n{scene.description}\n" + self.paths(scene))
+
+    def paths(self, scene) -> str:
+        if not scene.paths:
+            return "\nThere are no visible paths from here."
+        lines = ["\nAvailable paths:"]
+        lines.extend(f"- {direction.capitalize()}: {description}" for direction, description in scene.paths)
+        return '\n'.join(lines)
+
+    def scene(self, scene) -> str:
+        lines = [self.paths(scene), f"Location: {scene.name} {scene.coordinates}"]
+        if scene.npcs:
+            lines.append(f"NPCs here: {', '.join(scene.npcs)}")
+        return '\n'.join(lines)
+
+    def turn(self, result, narrative: bool = True) -> str:
+        # narrative=False when the narrative was already shown while streaming
+        lines = []
+        if narrative:
+            lines.append(result.text if result.local else f"Game Master: {result.text}")
+        if not result.local:
+            lines.append(self.scene(result.scene))
+        if result.player_died:
+            lines.append("\nYour adventure has come to an end.")
+        return '\n'.join(lines)
+
+
+class JsonRenderer:
+    def scene(self, scene) -> dict:
+        return {
+            'name': scene.name,
+            'description': scene.description,
+            'coordinates': list(scene.coordinates) if scene.coordinates is not None else None,
+            'paths': [{'cardinal_direction': direction, 'description': description} for direction, description in scene.paths],
+            'items': scene.items,
+            'npcs': scene.npcs,
+        }
+
+    def turn(self, result, narrative: bool = True) -> dict:
+        data = {
+            'state_update': result.state_update,
+            'scene': self.scene(result.scene),
+            'local': result.local,
+            'moved': result.moved,
+            'player_died': result.player_died,
+        }
+        if narrative:
+            data['response'] = result.text
+        return data
@@ -0,0 +1,143 @@
+from the_veiled_realm.json_repair import parse_json_object
+
+# Incremental parser for the Game Master's
+# {"RESPONSE": "...", "GAME_STATE_UPDATE": [...]} envelope.
+#
+# Chunks from a streaming generate_content call are fed in as they arrive.
+# The RESPONSE string is decoded on the fly so the narrative can be shown
+# word by word, while everything else is buffered until the stream ends and
+# the whole object can be parsed.
+
+RESPONSE_KEY = '"RESPONSE"'
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+class ResponseStreamParser:
+    def __init__(self):
+        self.buffer = ''  # Everything received so far
+        self.response_text = ''  # Decoded RESPONSE text emitted so far
+        self.response_done = False  # True once the closing quote was seen
+        self._pos = 0  # Scan position in the buffer
+        self._in_response = False  # True while inside the RESPONSE string
+
+    def feed(self, chunk: str) -> str:
+        # Add a chunk and return any newly decoded RESPONSE text
+        self.buffer += chunk
+        if self.response_done:
+            return ''
+        if not self._in_response and not self._find_response_start():
+            return ''
+
+        decoded = []
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if char == '"':
+                self._pos += 1
+                self._in_response = False
+                self.response_done = True
+                break
+            if char != '\\':
+                decoded.append(char)
+                self._pos += 1
+                continue
+
+            # Escape sequences may be split across chunks; wait for the rest
+            if self._pos + 1 >= len(buffer):
+                break
+            escape = buffer[self._pos + 1]
+            if escape == 'u':
+                code = _hex_code(buffer, self._pos + 2)
+                if code is None:
+                    break
+                length = 6
+                if 0xD800 <= code <= 0xDBFF:
+                    # A high surrogate: join it with the low half (emoji and
+                    # other characters outside the BMP) before emitting
+                    if self._pos + 12 > len(buffer):
+                        break
+                    low = _hex_code(buffer, self._pos + 8) if buffer[self._pos + 6:self._pos + 8] == '\\u' else -1
+                    if low is not None and 0xDC00 <= low <= 0xDFFF:
+                        code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                        length = 12
+                    else:
+                        code = 0xFFFD
+                elif 0xDC00 <= code <= 0xDFFF:
+                    code = 0xFFFD
+                decoded.append(chr(code) if code >= 0 else buffer[self._pos + 2:self._pos + 6])
+                self._pos += length
+            else:
+                decoded.append(_SIMPLE_ESCAPES.get(escape, escape))
+                self._pos += 2
+
+        text = ''.join(decoded)
+        self.response_text += text
+        return text
+
+    def _find_response_start(self) -> bool:
+        # Locate the opening quote of the RESPONSE value, if it has arrived.
+        # Scanning resumes where the last call stopped; a match is only taken
+        # as the key when a ':' follows it
+        buffer = self.buffer
+        while True:
+            key_index = buffer.find(RESPONSE_KEY, self._pos)
+            if key_index == -1:
+                # Keep a possibly split key in range for the next chunk
+                self._pos = max(self._pos, len(buffer) - len(RESPONSE_KEY) + 1)
+                return False
+            index = _skip_whitespace(buffer, key_index + len(RESPONSE_KEY))
+            if index >= len(buffer):
+                self._pos = key_index
+                return False
+            if buffer[index] != ':':
+                # Not a key (e.g. the word appears inside prose); look further on
+                self._pos = key_index + 1
+                continue
+            index = _skip_whitespace(buffer, index + 1)
+            if index >= len(buffer):
+                self._pos = key_index
+                return False
+            if buffer[index] != '"':
+                self._pos = key_index + 1
+                continue
+            self._pos = index + 1
+            self._in_response = True
+            return True
+
+    def result(self) -> dict:
+        # Parse the complete envelope once the stream has finished
+        response_data = parse_json_object(self.buffer, ('RESPONSE', 'GAME_STATE_UPDATE'))
+        if response_data is None:
+            return {
+                "RESPONSE": self.response_text or self.buffer,
+                "GAME_STATE_UPDATE": {}
+            }
+        return response_data
+
+
+def _skip_whitespace(buffer: str, index: int) -> int:
+    while index < len(buffer) and buffer[index] in ' \t\r\n':
+        index += 1
+    return index
+
+
+def _hex_code(buffer: str, index: int):
+    # The code unit of the four hex digits at index: None while they haven't
+    # all arrived, -1 when they aren't hex
+    hex_digits = buffer[index:index + 4]
+    if len(hex_digits) < 4:
+        return None
+    try:
+        return int(hex_digits, 16)
+    except ValueError:
+        return -1
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+
+# Prompt-facing schemas derived from master_schema.json.
+#
+# master_schema.json is the single source of truth for the game's classes.
+# Each prompt only needs some of those classes, and never the coordinates
+# (the game works those out from cardinal directions), so every variant is a
+# subset of the master. Variants are rendered as a compact, deterministic
+# TypeScript-like signature, e.g.
+#   Item{name:string;description:string}
+#   NPC{...;health?:number=100;inventory?:Item[]}
+# which costs far fewer tokens than the pretty-printed dict repr.
+#
+# Usage: python schema_render.py [--exact]   (report size of each variant;
+#        --exact asks the model's token counter instead of estimating)
+
+MASTER_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'master_schema.json')
+
+# Classes and omitted properties for each prompt
+VARIANTS = {
+    'initial_location': {
+        'types': ['Item', 'Path', 'NPC', 'Location', 'QuestCriteria', 'Quest'],
+        'omit': ['coordinates', 'destination_coordinates'],
+    },
+    'action': {
+        'types': ['Item', 'Path', 'Location', 'NPC', 'QuestCriteria', 'Quest', 'Player', 'LocationChanges'],
+        'omit': ['coordinates', 'destination_coordinates'],
+    },
+}
+
+
+def load_master_schema(path: str = MASTER_SCHEMA_PATH) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def derive_schema(master: dict, variant: str) -> dict:
+    # Build a variant's schema (same shorthand format as the master) from the master
+    spec = VARIANTS[variant]
+    schema = {}
+    for name in spec['types']:
+        definition = master[name]
+        properties = {
+            prop: value for prop, value in definition.get('properties', {}).items()
+            if prop not in spec['omit']
+        }
+        required = [prop for prop in definition.get('required', []) if prop not in spec['omit']]
+        schema[name] = {'required': required, 'properties': properties}
+    return schema
+
+
+def _render_type(type_spec) -> str:
+    if isinstance(type_spec, dict):
+        return '{' + ';'.join(f"{prop}?:{_render_type(value)}" for prop, value in type_spec.items()) + '}'
+    type_spec = type_spec.replace(' ', '')
+    if '(default:' in type_spec:
+        # number(default:100) -> number=100
+        base, default = type_spec.split('(default:', 1)
+        return f"{base}={default[:-1]}"
+    return type_spec
+
+
+def render_compact(schema: dict) -> str:
+    # One line per class; required properties first, optional ones marked with '?'
+    lines = []
+    for name, definition in schema.items():
+        required = definition.get('required', [])
+        properties = definition.get('properties', {})
+        ordered = [prop for prop in required if prop in properties]
+        ordered += [prop for prop in properties if prop not in required]
+        fields = ';'.join(
+            f"{prop}{'' if prop in required else '?'}:{_render_type(properties[prop])}"
+            for prop in ordered
+        )
+        lines.append(f"{name}{{{fields}}}")
+    return '\n'.join(lines)
+
+
+def render_json(schema: dict) -> str:
+    return json.dumps(schema, separators=(',', ':'))
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough count (about four characters per token for English and JSON)
+    return (len(text) + 3) // 4
+
+
+def count_tokens(text: str, exact: bool = False) -> int:
+    if exact:
+        from the_veiled_realm.llm_client import get_client
+        return get_client().model().count_tokens(text).total_tokens
+    return estimate_tokens(text)
+
+
+def report(exact: bool = False):
+    master = load_master_schema()
+    print(f"{'variant':<18} {'format':<8} {'chars':>7} {'tokens':>7}")
+    for variant in VARIANTS:
+        schema = derive_schema(master, variant)
+        renderings = {
+            'repr': str(schema),  # How schemas used to be interpolated into prompts
+            'json': render_json(schema),
+            'compact': render_compact(schema),
+        }
+        for name, text in renderings.items():
+            print(f"{variant:<18} {name:<8} {len(text):>7} {count_tokens(text, exact):>7}")
+
+
+if __name__ == '__main__':
+    report(exact='--exact' in sys.argv)
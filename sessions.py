@@ -0,0 +1,235 @@
+import time
+import logging
+import threading
+import contextlib
+from collections import OrderedDict
+
+# Registry of live game sessions, keyed by player ID.
+#
+# Hot sessions stay in memory; the least recently used ones are evicted when
+# there are more than max_sessions of them or their estimated size goes over
+# max_memory_mb, and sessions idle for longer than idle_ttl seconds are
+# evicted by a background sweeper. Evicted worlds are flushed with save() and
+# come back lazily through load() on the next request. A session that is
+# checked out for a turn is never evicted, and one that is requested again
+# while its flush is still running is revived instead of being reloaded.
+#
+# The sweeper also autosaves live sessions, so a busy node needs one thread
+# for autosaves instead of one per world. A session is saved once
+# save_after_turns turns have been played or save_after_dirty objects have
+# changed since its last save (as reported by GameWorld.dirty_count), and at
+# the latest every autosave_interval seconds.
+
+logger = logging.getLogger(__name__)
+
+
+# Rough in-memory size of a GameWorld in bytes, for the memory ceiling
+def estimate_world_size(world) -> int:
+    size = 2000  # Player, world and session overhead
+    for location in world.locations.values():
+        size += 600 + len(location.name or '') + len(location.description or '')
+        size += sum(200 + len(item.name or '') + len(item.description or '') for item in location.items)
+        size += sum(800 + len(npc.name or '') + len(npc.description or '') for npc in location.npcs)
+        size += sum(250 + len(path.description or '') for path in location.paths)
+    memory = getattr(world, 'memory', None)
+    if memory:
+        size += len(memory.summary) + sum(len(turn.action) + len(turn.response) for turn in memory.recent)
+    return size
+
+
+class SessionManager:
+    def __init__(self, engine, load, save=None, max_sessions: int = 10000, max_memory_mb: float = None,
+                 idle_ttl: float = 1800, autosave_interval: float = None, sweep_interval: float = 30,
+                 save_after_turns: int = None, save_after_dirty: int = None):
+        self.engine = engine
+        self.load = load  # Callable(session_id) -> GameWorld or None (unknown player)
+        self.save = save  # Callable(GameWorld), used to flush evicted and autosaved worlds
+        self.max_sessions = max_sessions
+        self.max_memory = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+        self.idle_ttl = idle_ttl
+        self.autosave_interval = autosave_interval
+        self.sweep_interval = sweep_interval
+        self.save_after_turns = save_after_turns
+        self.save_after_dirty = save_after_dirty
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()  # Session ID -> Session, least recently used first
+        self.flushing = {}  # Session ID -> Session being saved after eviction
+        self.load_locks = {}  # Session ID -> Lock, so a world is only loaded once
+        self.memory_used = 0
+        self.stats = {'hits': 0, 'loads': 0, 'revived': 0, 'evictions': 0, 'expired': 0, 'autosaves': 0}
+        self.closed = threading.Event()
+        self.wakeup = threading.Event()  # Set when a session is due for a save
+        self.sweeper = None
+        if idle_ttl or autosave_interval or save_after_turns or save_after_dirty:
+            self.sweeper = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+            self.sweeper.start()
+
+    def get(self, session_id):
+        # The live session for a player, loading the world if needed; None for unknown players
+        with self.lock:
+            session = self._touch(session_id)
+            if session:
+                return session
+            load_lock = self.load_locks.setdefault(session_id, threading.Lock())
+
+        with load_lock:
+            try:
+                with self.lock:
+                    # Another request may have loaded it while we waited
+                    session = self._touch(session_id)
+                    if session:
+                        return session
+                world = self.load(session_id)
+                if world is None:
+                    return None
+                session = self.engine.resume(world, session_id).session
+                session.pins = 0
+                session.turns_since_save = 0
+                session.save_due = False
+                session.last_used = session.last_saved = time.monotonic()
+                session.size = estimate_world_size(world)
+                with self.lock:
+                    self.sessions[session_id] = session
+                    self.memory_used += session.size
+                    self.stats['loads'] += 1
+                    victims = self._select_victims()
+            finally:
+                # Also when the load fails, so the lock isn't kept for a player forever
+                with self.lock:
+                    self.load_locks.pop(session_id, None)
+        self._flush(victims)
+        return session
+
+    def _touch(self, session_id):
+        # Mark a hot (or still flushing) session as used; call with self.lock held
+        session = self.sessions.get(session_id)
+        if session:
+            self.sessions.move_to_end(session_id)
+            self.stats['hits'] += 1
+        else:
+            session = self.flushing.get(session_id)
+            if session is None:
+                return None
+            self.sessions[session_id] = session
+            self.memory_used += session.size
+            self.stats['revived'] += 1
+        session.last_used = time.monotonic()
+        return session
+
+    def pin(self, session_id):
+        # The session for a player, pinned so it can't be evicted until release(); None for unknown players
+        session = self.get(session_id)
+        if session is not None:
+            with self.lock:
+                session.pins += 1
+        return session
+
+    @contextlib.contextmanager
+    def checkout(self, session_id):
+        # Pin a session for the duration of a turn; yields None for unknown players
+        session = self.pin(session_id)
+        if session is None:
+            yield None
+            return
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def release(self, session):
+        # Unpin after a turn, account for the world's new size and check whether it is due a save
+        size = estimate_world_size(session.world)
+        dirty_count = getattr(session.world, 'dirty_count', None)
+        dirty = dirty_count() if self.save_after_dirty and dirty_count else 0
+        with self.lock:
+            session.pins -= 1
+            session.last_used = time.monotonic()
+            session.turns_since_save += 1
+            if ((self.save_after_turns and session.turns_since_save >= self.save_after_turns)
+                    or (self.save_after_dirty and dirty >= self.save_after_dirty)):
+                session.save_due = True
+                self.wakeup.set()
+            if self.sessions.get(session.id) is session:
+                self.memory_used += size - session.size
+            session.size = size
+            victims = self._select_victims()
+        self._flush(victims)
+
+    def _select_victims(self):
+        # Remove least recently used, unpinned sessions over the limits; call with self.lock held
+        victims = []
+        for session_id, session in list(self.sessions.items()):
+            over_count = len(self.sessions) > self.max_sessions
+            over_memory = self.max_memory is not None and self.memory_used > self.max_memory
+            if not (over_count or over_memory):
+                break
+            if session.pins:
+                continue
+            victims.append(self._remove(session_id))
+            self.stats['evictions'] += 1
+        return victims
+
+    def _remove(self, session_id):
+        session = self.sessions.pop(session_id)
+        self.memory_used -= session.size
+        self.flushing[session_id] = session
+        return session
+
+    def _flush(self, victims):
+        # Save evicted sessions outside the lock, then let go of them unless they were revived
+        for session in victims:
+            try:
+                if self.save:
+                    self.save(session.world)
+            except Exception as e:
+                logger.error(f"Error flushing session {session.id}: {e}")
+            with self.lock:
+                self.flushing.pop(session.id, None)
+                revived = session.id in self.sessions
+            if not revived:
+                self.engine.end(session)
+
+    def sweep(self):
+        # Evict sessions idle for longer than idle_ttl and save the others that are due
+        now = time.monotonic()
+        with self.lock:
+            expired = []
+            if self.idle_ttl:
+                for session_id, session in list(self.sessions.items()):
+                    if now - session.last_used > self.idle_ttl and not session.pins:
+                        expired.append(self._remove(session_id))
+                        self.stats['expired'] += 1
+            due = []
+            if self.save:
+                due = [session for session in self.sessions.values() if session.save_due or (
+                    self.autosave_interval and now - session.last_saved >= self.autosave_interval)]
+        self._flush(expired)
+        for session in due:
+            session.last_saved = now
+            session.turns_since_save = 0
+            session.save_due = False
+            try:
+                self.save(session.world)
+                self.stats['autosaves'] += 1
+            except Exception as e:
+                logger.error(f"Error autosaving session {session.id}: {e}")
+
+    def _sweep_loop(self):
+        while not self.closed.is_set():
+            self.wakeup.wait(self.sweep_interval)
+            self.wakeup.clear()
+            if not self.closed.is_set():
+                self.sweep()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def close(self, timeout: float = None):
+        # Stop the sweeper (letting a running autosave finish) and flush every live session
+        self.closed.set()
+        self.wakeup.set()
+        if self.sweeper and self.sweeper is not threading.current_thread():
+            self.sweeper.join(timeout)
+        with self.lock:
+            victims = [self._remove(session_id) for session_id in list(self.sessions)]
+        self._flush(victims)
@@ -0,0 +1,4 @@
+from setuptools import setup
+
+# Configuration is in pyproject.toml
+setup()
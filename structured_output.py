@@ -0,0 +1,120 @@
+import re
+
+try:
+    from google.ai.generativelanguage import Schema as SdkSchema
+except ImportError:  # No SDK; only the offline fake backend is available
+    SdkSchema = None
+
+# Compiles the game's prompt schemas (derived from master_schema.json by
+# schema_render) into the provider's native response schema, so the model can
+# be asked for application/json output that matches our classes instead of
+# relying on the prompt alone.
+#
+# The schemas use a small shorthand for property types:
+#   "string", "number(default:100)", "boolean(default:false)",
+#   "Item[]" (list of another definition), "[number,number]" (a coordinate
+#   pair) and nested dicts (e.g. stats).
+
+PRIMITIVE_TYPES = {
+    'string': 'STRING',
+    'number': 'NUMBER',
+    'integer': 'INTEGER',
+    'boolean': 'BOOLEAN',
+    'datetime': 'STRING',
+}
+
+DEFAULT_SUFFIX = re.compile(r'\(default:.*\)$')
+
+
+def sdk_supports(field):
+    # Whether the installed SDK's Schema has a field; older SDKs reject unknown fields
+    # with a ValueError, which would make the whole schema look unsupported
+    return SdkSchema is not None and field in SdkSchema.meta.fields
+
+
+def compile_type(type_spec, definitions, partial=False):
+    # Compile one property type into a response schema dict
+    if isinstance(type_spec, dict):
+        return {
+            'type': 'OBJECT',
+            'properties': {name: compile_type(spec, definitions) for name, spec in type_spec.items()},
+        }
+
+    type_spec = DEFAULT_SUFFIX.sub('', type_spec.strip())
+    if type_spec.startswith('['):
+        # Tuples such as [number,number] become arrays of their element type
+        element = type_spec.strip('[]').split(',')[0]
+        return {'type': 'ARRAY', 'items': compile_type(element, definitions)}
+    if type_spec.endswith('[]'):
+        return {'type': 'ARRAY', 'items': compile_type(type_spec[:-2], definitions)}
+    if type_spec in PRIMITIVE_TYPES:
+        return {'type': PRIMITIVE_TYPES[type_spec]}
+    if type_spec in definitions:
+        return compile_schema(definitions, type_spec, partial)
+    # Unknown shorthand; let the model send a string rather than rejecting the schema
+    return {'type': 'STRING'}
+
+
+def compile_schema(definitions, name, partial=False):
+    # Compile a named definition; partial=True makes every property optional
+    definition = definitions[name]
+    properties = {
+        prop: compile_type(spec, definitions)
+        for prop, spec in definition.get('properties', {}).items()
+    }
+    schema = {'type': 'OBJECT', 'properties': properties}
+    # Only require properties the definition actually declares
+    required = [prop for prop in definition.get('required', []) if prop in properties]
+    if required and not partial:
+        schema['required'] = required
+    return schema
+
+
+def location_response_schema(definitions):
+    # {"Location": {...}} as expected by create_starting_location
+    return {
+        'type': 'OBJECT',
+        'properties': {'Location': compile_schema(definitions, 'Location')},
+        'required': ['Location'],
+    }
+
+
+def action_response_schema(definitions):
+    # {"RESPONSE": "...", "GAME_STATE_UPDATE": [...]} as expected by handle_game_action.
+    # Updates are a list of single-purpose objects, so every key is optional.
+    update_properties = {
+        'MOVING': {'type': 'STRING'},
+        'PLAYER_DIED': {'type': 'STRING'},
+    }
+    if 'Location' in definitions:
+        update_properties['Location'] = compile_schema(definitions, 'Location')
+    if 'Player' in definitions:
+        # Only changed player values are sent
+        update_properties['Player'] = compile_schema(definitions, 'Player', partial=True)
+    if 'NPC' in definitions:
+        update_properties['NPCS'] = {'type': 'ARRAY', 'items': compile_schema(definitions, 'NPC')}
+    if 'LocationChanges' in definitions:
+        update_properties['LOCATION_CHANGES'] = compile_schema(definitions, 'LocationChanges', partial=True)
+
+    schema = {
+        'type': 'OBJECT',
+        'properties': {
+            'RESPONSE': {'type': 'STRING'},
+            'GAME_STATE_UPDATE': {
+                'type': 'ARRAY',
+                'items': {'type': 'OBJECT', 'properties': update_properties},
+            },
+        },
+        'required': ['RESPONSE', 'GAME_STATE_UPDATE'],
+    }
+    if sdk_supports('property_ordering'):
+        # Keep the narrative first so it can still be streamed
+        schema['property_ordering'] = ['RESPONSE', 'GAME_STATE_UPDATE']
+    return schema
+
+
+def generation_config(response_schema):
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': response_schema,
+    }
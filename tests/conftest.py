@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Tests run offline against the fake LLM backend, without background prefetching
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('PREFETCH_LOCATIONS', '0')
+os.environ.setdefault('LOG_LLM_RESPONSES', '0')
+
+# The backend modules (persistence, storage, ...) import each other by their plain names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
@@ -0,0 +1,71 @@
+import pytest
+
+from the_veiled_realm.journal import TurnJournal
+from the_veiled_realm.engine import recover_world
+from the_veiled_realm.models import GameWorld, Player, Location
+
+
+def actions(journal, session_id, after=0):
+    return [(entry['seq'], entry['action']) for entry in journal.entries(session_id, after)]
+
+
+def test_append_numbers_entries(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    assert [journal.append('s', {'action': action}) for action in 'abc'] == [1, 2, 3]
+    assert actions(journal, 's', after=1) == [(2, 'b'), (3, 'c')]
+
+
+def test_torn_last_line_is_cut_before_appending(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    journal.append('s', {'action': 'a'})
+    journal.append('s', {'action': 'b'})
+    with open(journal.path('s'), 'a', encoding='utf-8') as f:
+        f.write('{"action": "to')  # Crash mid-write
+
+    restarted = TurnJournal(str(tmp_path))
+    assert restarted.append('s', {'action': 'c'}) == 3
+    restarted.append('s', {'action': 'd'})
+    assert actions(restarted, 's') == [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')]
+
+
+def test_seed_continues_after_snapshot(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    journal.append('s', {'action': 'a'})
+    journal.compact('s', 1)
+    restarted = TurnJournal(str(tmp_path))
+    restarted.seed('s', 1)
+    assert restarted.append('s', {'action': 'b'}) == 2
+
+
+def test_compact_keeps_later_entries(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    for action in 'abc':
+        journal.append('s', {'action': action})
+    journal.compact('s', 2)
+    assert actions(journal, 's') == [(3, 'c')]
+
+
+def snapshot_world(seq):
+    player = Player('Ava', 'Elf', 'Ranger')
+    location = Location('Glade', 'A quiet glade.', (0, 0))
+    world = GameWorld(player=player, current_location=location)
+    world.add_location(location)
+    world.journal_seq = seq
+    return world
+
+
+def test_recover_replays_entries_after_snapshot(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    journal.seed('s', 1)
+    journal.append('s', {'action': 'look', 'response': 'Birds sing.', 'update': []})
+    world = recover_world(journal, 's', snapshot_world(1))
+    assert world.journal_seq == 2
+
+
+def test_recover_rejects_a_gap(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    for seq in (2, 4):
+        with open(journal.path('s'), 'a', encoding='utf-8') as f:
+            f.write(f'{{"action": "look", "update": [], "seq": {seq}}}\n')
+    with pytest.raises(ValueError):
+        recover_world(journal, 's', snapshot_world(1))
@@ -0,0 +1,38 @@
+from the_veiled_realm.json_repair import find_objects, repair_text, parse_json_object
+
+
+def test_prose_and_fences_around_the_object():
+    text = 'Here you go:\n```json\n{"RESPONSE": "Hi \\"there\\" {", "GAME_STATE_UPDATE": []}\n```\nEnjoy!'
+    assert parse_json_object(text, ('RESPONSE',)) == {'RESPONSE': 'Hi "there" {', 'GAME_STATE_UPDATE': []}
+
+
+def test_trailing_commas_outside_strings():
+    assert repair_text('{"a": [1, 2,], "b": "x,]",}') == '{"a": [1, 2], "b": "x,]"}'
+
+
+def test_raw_newlines_in_strings():
+    assert parse_json_object('{"RESPONSE": "line one\nline two"}') == {'RESPONSE': 'line one\nline two'}
+
+
+def test_cut_off_object_closes_brackets_in_reverse_order():
+    text = '{"RESPONSE": "Hi", "GAME_STATE_UPDATE": [{"action": "move", "items": ["sword'
+    assert find_objects(text) == [text + '"]}]}']
+    assert parse_json_object(text)['GAME_STATE_UPDATE'] == [{'action': 'move', 'items': ['sword']}]
+
+
+def test_coordinates_are_normalized():
+    data = parse_json_object('{"coordinates": {"x": 5, "y": 12}, "list": [{"destination_coordinates": "1,-1"}, '
+                             '{"Coordinates": "23N, 47E"}, {"coordinates": "3W 4S"}]}')
+    assert data['coordinates'] == [5, 12]
+    assert [item.get('destination_coordinates', item.get('Coordinates', item.get('coordinates')))
+            for item in data['list']] == [[1, -1], [47, 23], [-3, -4]]
+
+
+def test_split_envelope_is_folded_together():
+    text = '{"RESPONSE": "You walk north."} and {"GAME_STATE_UPDATE": [{"action": "move"}]}'
+    assert parse_json_object(text, ('RESPONSE', 'GAME_STATE_UPDATE')) == {
+        'RESPONSE': 'You walk north.', 'GAME_STATE_UPDATE': [{'action': 'move'}]}
+
+
+def test_nothing_to_parse():
+    assert parse_json_object('no json here') is None
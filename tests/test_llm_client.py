@@ -0,0 +1,53 @@
+import time
+import threading
+
+import pytest
+
+llm_client = pytest.importorskip('the_veiled_realm.llm_client')
+if llm_client.genai is None or llm_client.InvalidArgument is None:
+    pytest.skip('google-generativeai is not installed', allow_module_level=True)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    created = []
+
+    class CachedContent:
+        @staticmethod
+        def create(model, system_instruction, ttl):
+            created.append(system_instruction)
+            time.sleep(0.05)
+            if system_instruction == 'tiny':
+                raise llm_client.InvalidArgument('Cached content is too small')
+            if system_instruction == 'busy' and created.count('busy') == 1:
+                raise RuntimeError('429 Resource exhausted')
+            return system_instruction
+
+    monkeypatch.setattr(llm_client.genai.caching, 'CachedContent', CachedContent)
+    monkeypatch.setattr(llm_client.genai.GenerativeModel, 'from_cached_content',
+                        staticmethod(lambda cached_content: ('cached', cached_content)))
+    client = llm_client.LLMClient(api_key='test', model_name='gemini-1.5-flash')
+    client.created = created
+    return client
+
+
+def test_cache_is_created_once_per_preamble(client):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.cached_model('preamble'))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.created == ['preamble']
+    assert results == [('cached', 'preamble')] * 5
+
+
+def test_refused_preamble_turns_caching_off(client):
+    assert not isinstance(client.cached_model('tiny'), tuple)
+    assert client.caching_unsupported == {'gemini-1.5-flash'}
+
+
+def test_transient_error_falls_back_for_one_call(client):
+    assert not isinstance(client.cached_model('busy'), tuple)
+    assert not client.caching_unsupported
+    assert client.cached_model('busy') == ('cached', 'busy')
@@ -0,0 +1,40 @@
+import os
+import threading
+
+from the_veiled_realm import engine
+
+
+def test_concurrent_logging_rotates_safely(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, 'LOG_LLM_RESPONSES', True)
+    monkeypatch.setattr(engine, 'LLM_LOG_DIR', str(tmp_path))
+    monkeypatch.setattr(engine, 'LLM_LOG_KEEP', 5)
+    errors = []
+
+    def log_many(worker):
+        try:
+            for turn in range(20):
+                engine.log_llm_response(f'{worker}:{turn}')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=log_many, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(os.listdir(tmp_path)) == 5
+
+
+def test_same_instant_responses_get_their_own_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, 'LOG_LLM_RESPONSES', True)
+    monkeypatch.setattr(engine, 'LLM_LOG_DIR', str(tmp_path))
+    for text in ('first', 'second', 'third'):
+        engine.log_llm_response(text)
+    contents = sorted(open(os.path.join(tmp_path, name)).read() for name in os.listdir(tmp_path))
+    assert contents == ['first', 'second', 'third']
+
+
+def test_default_directory_is_not_the_recorded_corpus():
+    corpus = os.path.join(os.path.dirname(os.path.abspath(engine.__file__)), 'logs')
+    assert os.path.abspath(engine.LLM_LOG_DIR) != corpus or os.getenv('LLM_LOG_DIR')
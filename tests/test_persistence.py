@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from the_veiled_realm.models import GameWorld, Player, NPC, Quest, QuestCriteria, Location, Item
+from persistence import write_game_world, snapshot_game_world, load_saved_game_world
+from migrations import SCHEMA_VERSIONS
+from storage import MemoryStorage
+
+
+def make_world():
+    player = Player('Ava', 'Elf', 'Ranger', health=70, mana=40)
+    start = Location('Glade', 'A quiet glade.', (0, 0), items=[Item('Stone', 'Smooth.')])
+    npc = NPC('Bram', 'A smith.', 'Dwarf', 'Smith', health=55, mana=5, stats={'strength': 17}, party_potential=3)
+    start.add_npc(npc)
+    criterion = QuestCriteria('Find the ore')
+    criterion.completed = True
+    player.quest_list.append(Quest('Iron', 'Bring Bram iron.', [criterion, QuestCriteria('Return')]))
+    world = GameWorld(player, start)
+    world.add_location(start)
+    return world
+
+
+def load(storage, world):
+    return load_saved_game_world(storage, storage.find_player(str(world.player.id)))
+
+
+def test_npc_and_quest_state_round_trips():
+    storage = MemoryStorage()
+    world = make_world()
+    write_game_world(storage, world, full=True)
+    loaded = load(storage, world)
+
+    npc = loaded.current_location.npcs[0]
+    assert (npc.health, npc.mana, npc.stats, npc.party_potential) == (55, 5, {'strength': 17}, 3)
+    quest, = loaded.player.quest_list
+    original = world.player.quest_list[0]
+    assert (quest.id, quest.name, quest.description) == (original.id, 'Iron', 'Bring Bram iron.')
+    assert [(c.id, c.description, c.completed) for c in quest.criteria] == \
+        [(c.id, c.description, c.completed) for c in original.criteria]
+
+
+def test_old_documents_are_migrated():
+    storage = MemoryStorage()
+    world = make_world()
+    write_game_world(storage, world, full=True)
+    player = storage.find_player(str(world.player.id))
+    npc = storage.find_npcs([str(world.current_location.npcs[0].id)])[0]
+    # The shapes saved before NPC state and quest details were stored
+    for key in ('health', 'mana', 'stats', 'party_potential'):
+        npc.pop(key)
+    npc['schema_version'] = 1
+    player['quests'] = [{'id': quest['id'], 'name': quest['name'], 'completed': False} for quest in player['quests']]
+    player['schema_version'] = 1
+    storage.collections['players'][player['id']] = json.dumps(player)
+    storage.collections['npcs'][npc['id']] = json.dumps(npc)
+
+    loaded = load(storage, world)
+    assert loaded.current_location.npcs[0].health == 100
+    assert loaded.player.quest_list[0].criteria == []
+
+
+def test_memory_storage_keeps_location_order():
+    storage = MemoryStorage()
+    world = make_world()
+    # Two locations at the same coordinates: the order they were saved in decides which one wins on load
+    for name in ('First', 'Second', 'Third'):
+        world.add_location(Location(name, '', (4, 4)))
+        write_game_world(storage, world)
+    names = [document['name'] for document in storage.find_locations(str(world.player.id))]
+    assert names[1:] == ['First', 'Second', 'Third']
+
+
+def test_saves_write_only_changed_fields():
+    storage = MemoryStorage()
+    world = make_world()
+    write_game_world(storage, world, full=True)
+    assert not any(snapshot_game_world(world).changes.values())
+
+    world.player.health = 12
+    world.current_location.npcs[0].inventory.append(Item('Hammer', 'Heavy.'))
+    changes = snapshot_game_world(world).changes
+    assert changes['players'] == [{'id': str(world.player.id), 'health': 12}]
+    npc_delta, = changes['npcs']
+    assert set(npc_delta) == {'id', 'inventory'}
+    assert changes['locations'] == []
+
+
+def test_new_entities_are_written_whole():
+    storage = MemoryStorage()
+    world = make_world()
+    write_game_world(storage, world, full=True)
+    location = Location('Ridge', 'Windy.', (1, 0))
+    world.add_location(location)
+    document, = snapshot_game_world(world).changes['locations']
+    assert document['name'] == 'Ridge' and document['schema_version'] == SCHEMA_VERSIONS['locations']
+
+
+def test_failed_write_keeps_changes_for_next_save():
+    class FailingStorage(MemoryStorage):
+        def write(self, changes, batch_size=None):
+            raise OSError('disk full')
+
+    storage = MemoryStorage()
+    world = make_world()
+    write_game_world(storage, world, full=True)
+    world.player.mana = 3
+    world.journal_seq = 7
+    with pytest.raises(OSError):
+        write_game_world(FailingStorage(), world)
+    assert getattr(world, 'saved_journal_seq', None) != 7
+
+    write_game_world(storage, world)
+    stored = storage.find_player(str(world.player.id))
+    assert (stored['mana'], stored['journal_seq']) == (3, 7)
+    assert load(storage, world).player.mana == 3
@@ -0,0 +1,54 @@
+import threading
+
+from the_veiled_realm.prefetch import LocationPrefetcher
+from the_veiled_realm.models import GameWorld, Player, Location, Path
+
+
+def make_world(name):
+    player = Player(name, 'Elf', 'Ranger')
+    location = Location('Glade', 'A quiet glade.', (0, 0))
+    location.paths = [Path('A narrow track.', (1, 0), 'east')]
+    world = GameWorld(player=player, current_location=location)
+    world.add_location(location)
+    return world
+
+
+def generated(player, from_location, path):
+    return Location(f"{player.name}'s ridge", 'Wind and stone.', tuple(path.destination_coordinates))
+
+
+def test_turn_pauses_only_its_own_world():
+    prefetcher = LocationPrefetcher(generated, max_workers=1)
+    busy, idle = make_world('Busy'), make_world('Idle')
+    try:
+        with prefetcher.interactive_turn(busy):
+            prefetcher.schedule(busy)
+            prefetcher.schedule(idle)
+            # The idle world's prefetch runs although another world's turn is in progress
+            assert prefetcher.take(idle, (1, 0), timeout=5).name == "Idle's ridge"
+            assert prefetcher.take(busy, (1, 0), timeout=0.2) is None
+        assert prefetcher.take(busy, (1, 0), timeout=5).name == "Busy's ridge"
+    finally:
+        prefetcher.shutdown()
+
+
+def test_budget_is_per_world():
+    calls = []
+    lock = threading.Lock()
+
+    def counted(player, from_location, path):
+        with lock:
+            calls.append(player.name)
+        return generated(player, from_location, path)
+
+    prefetcher = LocationPrefetcher(counted, session_budget=1)
+    first, second = make_world('First'), make_world('Second')
+    try:
+        for world in (first, second):
+            prefetcher.schedule(world)
+            assert prefetcher.take(world, (1, 0), timeout=5) is not None
+        prefetcher.schedule(first)
+        assert prefetcher.take(first, (1, 0), timeout=5) is None  # Over its budget
+        assert sorted(calls) == ['First', 'Second']
+    finally:
+        prefetcher.shutdown()
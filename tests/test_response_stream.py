@@ -0,0 +1,38 @@
+import json
+
+from the_veiled_realm.response_stream import ResponseStreamParser
+
+
+def stream(text, size):
+    parser = ResponseStreamParser()
+    decoded = ''.join(parser.feed(text[i:i + size]) for i in range(0, len(text), size))
+    return parser, decoded
+
+
+def test_emoji_escapes_are_joined_across_chunks():
+    narrative = 'A dragon \U0001F409 lands. Café "quoted"\n'
+    text = json.dumps({'RESPONSE': narrative, 'GAME_STATE_UPDATE': []})
+    for size in range(1, 16):
+        parser, decoded = stream(text, size)
+        assert decoded == narrative
+        assert parser.response_done
+
+
+def test_lone_surrogate_is_replaced():
+    parser, decoded = stream('{"RESPONSE": "a\\ud83d b", "GAME_STATE_UPDATE": []}', 3)
+    assert decoded == 'a� b'
+
+
+def test_key_must_be_followed_by_colon():
+    text = '{"NOTE": "the \\"RESPONSE\\" is below", "RESPONSE" : "Hello", "GAME_STATE_UPDATE": []}'
+    for size in (1, 4, len(text)):
+        parser, decoded = stream(text, size)
+        assert decoded == 'Hello'
+
+
+def test_scan_resumes_instead_of_restarting():
+    parser = ResponseStreamParser()
+    parser.feed('x' * 1000)
+    assert parser._pos > 900
+    parser.feed('{"RESP')
+    assert parser.feed('ONSE": "Hi"') == 'Hi'
@@ -0,0 +1,17 @@
+import pytest
+
+from the_veiled_realm.engine import Engine
+from the_veiled_realm.sessions import SessionManager
+
+
+def test_failed_load_releases_load_lock():
+    def load(session_id):
+        raise RuntimeError('database down')
+
+    sessions = SessionManager(Engine(), load, idle_ttl=None)
+    with pytest.raises(RuntimeError):
+        sessions.get('player')
+    assert sessions.load_locks == {}
+    sessions.load = lambda session_id: None
+    assert sessions.get('player') is None
+    assert sessions.load_locks == {}
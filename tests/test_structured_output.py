@@ -0,0 +1,26 @@
+import pytest
+
+genai = pytest.importorskip('google.generativeai')
+
+from the_veiled_realm import engine
+from the_veiled_realm.structured_output import generation_config
+
+
+@pytest.mark.parametrize('schema_name', ['location', 'action'])
+def test_schema_compiles_with_sdk(schema_name):
+    # The SDK turns the schema into its protobuf Schema before any request is sent;
+    # an unknown field raises ValueError there and the schema would be dropped for good
+    model = genai.GenerativeModel('gemini-1.5-flash')
+    request = model._prepare_request(
+        contents='Look around',
+        generation_config=generation_config(engine.response_schemas[schema_name]),
+        tools=None,
+        tool_config=None,
+    )
+    assert request.generation_config.response_mime_type == 'application/json'
+    assert request.generation_config.response_schema.properties
+
+
+def test_action_schema_keeps_required_keys():
+    schema = engine.response_schemas['action']
+    assert schema['required'] == ['RESPONSE', 'GAME_STATE_UPDATE']
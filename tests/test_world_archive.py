@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from world_archive import WorldArchive, ArchiveError
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc to count open files')
+@pytest.mark.parametrize('content', [b'not an archive, just some bytes', b'VR'])
+def test_bad_archive_is_closed(tmp_path, content):
+    path = tmp_path / 'bad.vra'
+    path.write_bytes(content)
+    before = len(os.listdir('/proc/self/fd'))
+    errors = []  # Kept, with their tracebacks, so nothing is closed by being freed
+    for _ in range(5):
+        with pytest.raises(ArchiveError) as error:
+            WorldArchive(str(path))
+        errors.append(error)
+    assert len(os.listdir('/proc/self/fd')) == before
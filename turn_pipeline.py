@@ -0,0 +1,159 @@
+import time
+import asyncio
+import logging
+import threading
+
+from the_veiled_realm.engine import (
+    build_game_action_prompt,
+    game_master_model,
+    generate_content_async,
+    interactive_turn,
+    log_llm_response,
+    parse_game_action_response,
+    record_turn,
+    update_game_state
+)
+
+logger = logging.getLogger(__name__)
+
+# Asyncio turn pipeline.
+#
+# A turn goes through explicit stages:
+#   prompt -> llm -> parse -> apply -> save
+# Many sessions can be in flight in one process because the only long stage
+# (llm) is awaited instead of holding a thread; blocking calls around it
+# (resolving the model, logging the response, saving) run in the loop's
+# executor so one slow call never stalls the other sessions. Backpressure:
+#   - llm_concurrency caps the number of outstanding model calls
+#   - turns of one session are applied strictly in order (per-session lock,
+#     dropped once the session has no turn in flight). Callers that also play
+#     turns elsewhere hold the engine's Session.lock around run_turn instead
+#     (see Engine.act).
+#   - saves go through a bounded queue drained by save_workers; when saving
+#     falls behind, new turns wait on the queue instead of piling up writes,
+#     and a session already waiting to be saved is not queued twice
+# Prefetching and summary refreshes are started from the apply stage and run
+# on their own bounded pools (see prefetch and memory).
+
+STAGES = ('prompt', 'llm', 'parse', 'apply', 'save')
+
+
+class TurnPipeline:
+    def __init__(self, save=None, llm_concurrency: int = 32, save_queue_size: int = 100, save_workers: int = 2,
+                 apply=None):
+        self.save = save  # Callable(game_world) run in a worker thread, e.g. save_game_world
+        # Callable(session_id, game_world, user_input, response_data) for the apply stage,
+        # e.g. to go through Engine.apply_response; update_game_state when None.
+        # run_turn returns what it returns.
+        self.apply = apply
+        self.llm_concurrency = llm_concurrency
+        self.save_queue_size = save_queue_size
+        self.save_workers = save_workers
+        self.llm_slots = None
+        self.save_queue = None
+        self.queued_saves = set()  # Session IDs already waiting in save_queue
+        self.session_locks = {}  # Session ID -> [asyncio.Lock, turns waiting for or holding it]
+        self.workers = []
+        self.stage_time = {stage: 0.0 for stage in STAGES}  # Total seconds spent per stage
+        self.turns = 0
+
+    async def start(self):
+        # Create the queue and workers on the running loop
+        self.llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        self.save_queue = asyncio.Queue(maxsize=self.save_queue_size)
+        if self.save:
+            self.workers = [asyncio.create_task(self._save_worker()) for _ in range(self.save_workers)]
+
+    async def run_turn(self, session_id, game_state, user_input: str):
+        # Play one turn for a session and return the parsed Game Master response,
+        # or the apply callback's result
+        entry = self.session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._run_turn(session_id, game_state, user_input)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.session_locks[session_id]
+
+    async def _run_turn(self, session_id, game_state, user_input: str):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        prompt = build_game_action_prompt(user_input, game_state)
+        start = self._lap('prompt', start)
+
+        async with self.llm_slots:
+            with interactive_turn(game_state):
+                # Resolving the model may create a context cache, a blocking network call
+                model = await loop.run_in_executor(None, game_master_model)
+                response = await generate_content_async(model, prompt, 'action')
+        start = self._lap('llm', start)
+
+        response_text = response.text
+        await loop.run_in_executor(None, log_llm_response, response_text)  # File I/O
+        response_data = parse_game_action_response(response_text)
+        start = self._lap('parse', start)
+
+        record_turn(user_input, response_data, game_state)
+        result = response_data
+        if self.apply:
+            result = self.apply(session_id, game_state, user_input, response_data)
+        else:
+            update_game_state(response_data.get("GAME_STATE_UPDATE", {}), game_state)
+        start = self._lap('apply', start)
+
+        if self.save and session_id not in self.queued_saves:
+            self.queued_saves.add(session_id)
+            await self.save_queue.put((session_id, game_state))  # Waits here if saving is behind
+        self._lap('save', start)
+        self.turns += 1
+        return result
+
+    async def _save_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            session_id, game_state = await self.save_queue.get()
+            # Later turns of this session may be queued again while it is written
+            self.queued_saves.discard(session_id)
+            try:
+                await loop.run_in_executor(None, self.save, game_state)
+            except Exception as e:
+                logger.error(f"Error saving session {session_id}: {e}")
+            finally:
+                self.save_queue.task_done()
+
+    def _lap(self, stage, start):
+        now = time.perf_counter()
+        self.stage_time[stage] += now - start
+        return now
+
+    async def close(self):
+        # Flush queued saves, then stop the workers
+        if self.save_queue is not None:
+            await self.save_queue.join()
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+
+class PipelineRunner:
+    # Runs a TurnPipeline on its own event loop thread so synchronous code
+    # (Flask views) can hand turns to it.
+
+    def __init__(self, pipeline: TurnPipeline):
+        self.pipeline = pipeline
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='turn-pipeline', daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(pipeline.start(), self.loop).result()
+
+    def run_turn(self, session_id, game_state, user_input: str, timeout: float = None):
+        future = asyncio.run_coroutine_threadsafe(
+            self.pipeline.run_turn(session_id, game_state, user_input), self.loop
+        )
+        return future.result(timeout)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.pipeline.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)